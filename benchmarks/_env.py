@@ -0,0 +1,16 @@
+"""
+Points ModBot at a throwaway data directory, for the benchmarks and tests that build a database of their own.
+
+Import it before anything from ptn.modbot, which reads the data directory once when ptn.modbot.constants is imported.
+The directory is removed again when the process exits.
+"""
+
+# libraries
+import atexit
+import os
+import shutil
+import tempfile
+
+data_dir = tempfile.mkdtemp(prefix='modbot_bench_')
+atexit.register(shutil.rmtree, data_dir, ignore_errors=True)
+os.environ['PTN_MODBOT_DATA_DIR'] = data_dir
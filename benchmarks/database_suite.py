@@ -0,0 +1,142 @@
+"""
+Times ModBot's database functions against a large synthetic database and reports latency percentiles as JSON.
+
+Builds a database with benchmarks.synthetic_data (1M infractions over 200k members and 5k carriers by default), then
+times the real functions as the bot calls them: find_infraction, insert_infraction, edit_infraction,
+get_all_carriers and find_carrier. Lookups are timed cold (infraction cache emptied before every call, members
+looked up for the first time) and warm (the same members again with the cache populated). Member lookups are drawn
+with the same skew as the data, so repeat offenders are looked up most.
+
+Usage:
+    python -m benchmarks.database_suite [--infractions 1000000] [--users 200000] [--carriers 5000] [--calls 2000]
+                                        [--output results.json]
+
+Compare the JSON from two commits to catch regressions before deploying.
+"""
+
+# libraries
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import time
+
+from benchmarks import _env  # noqa: F401, before ptn.modbot
+
+# the bot's modules print progress as they load, keep stdout for the JSON report
+with contextlib.redirect_stdout(sys.stderr):
+    import ptn.modbot.database.database as database  # noqa: E402
+    from benchmarks import synthetic_data  # noqa: E402
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+
+    def at(fraction):
+        return samples[min(int(len(samples) * fraction), len(samples) - 1)] * 1000
+
+    return {
+        'calls': len(samples),
+        'mean_ms': statistics.fmean(samples) * 1000,
+        'p50_ms': at(0.50),
+        'p90_ms': at(0.90),
+        'p95_ms': at(0.95),
+        'p99_ms': at(0.99),
+        'max_ms': samples[-1] * 1000,
+    }
+
+
+async def time_calls(calls, clear_cache=False):
+    """
+    Awaits each (function, args) in turn and returns the time each took in seconds.
+    """
+    samples = []
+    for func, args in calls:
+        if clear_cache:
+            database.infraction_cache.clear()
+        start = time.perf_counter()
+        await func(*args)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+async def run_suite(args):
+    rng = random.Random(args.seed)
+    members = synthetic_data.member_ids(args.users)
+    lookups = synthetic_data.skewed_choices(rng, members, args.calls)
+    carriers = await database.get_all_carriers()
+    max_entry = database.infraction_conn.execute('SELECT max(entry_id) FROM infractions').fetchone()[0]
+
+    results = {}
+    results['find_infraction cold'] = await time_calls(
+        [(database.find_infraction, (member, 'warned_user')) for member in lookups], clear_cache=True
+    )
+    # the same members again, now cached
+    await time_calls([(database.find_infraction, (member, 'warned_user')) for member in lookups])
+    results['find_infraction warm'] = await time_calls(
+        [(database.find_infraction, (member, 'warned_user')) for member in lookups]
+    )
+    results['find_infraction by rule cold'] = await time_calls(
+        [(database.find_infraction, (member, 'warned_user', rng.randint(1, synthetic_data.RULES), 'rule_broken'))
+         for member in lookups], clear_cache=True
+    )
+    results['get_all_carriers'] = await time_calls([(database.get_all_carriers, ())] * max(args.calls // 10, 1))
+    results['find_carrier by carrier_id'] = await time_calls(
+        [(database.find_carrier, (rng.choice(carriers).carrier_id, 'carrier_id')) for _ in range(args.calls)]
+    )
+    results['find_carrier by discord_user'] = await time_calls(
+        [(database.find_carrier, (rng.choice(carriers).discord_user, 'discord_user')) for _ in range(args.calls)]
+    )
+    results['insert_infraction'] = await time_calls(
+        [(database.insert_infraction, (member, synthetic_data.BASE_ID, int(time.time()), 1, 'benchmark warning'))
+         for member in lookups]
+    )
+    results['edit_infraction'] = await time_calls(
+        [(database.edit_infraction, (rng.randint(1, max_entry), None, None, None, rng.randint(1, 12),
+                                     'benchmark edit'))
+         for _ in range(args.calls)]
+    )
+    return {name: percentiles(samples) for name, samples in results.items()}
+
+
+async def main(args):
+    with contextlib.redirect_stdout(sys.stderr):
+        database.build_database_on_startup()
+        start = time.perf_counter()
+        synthetic_data.populate(database, args.infractions, args.users, args.carriers, args.seed)
+        generate_seconds = time.perf_counter() - start
+
+    # the database functions print on every call, keep them out of the timings and the JSON
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        results = await run_suite(args)
+
+    report = {
+        'parameters': {'infractions': args.infractions, 'users': args.users, 'carriers': args.carriers,
+                       'calls': args.calls, 'seed': args.seed},
+        'environment': {'python': platform.python_version(), 'sqlite': sqlite3.sqlite_version,
+                        'platform': platform.platform()},
+        'generate_seconds': generate_seconds,
+        'results': results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    print(output)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--infractions', type=int, default=1000000, help='infractions to generate')
+    parser.add_argument('--users', type=int, default=200000, help='members to spread them over')
+    parser.add_argument('--carriers', type=int, default=5000, help='tow truck carriers to generate')
+    parser.add_argument('--calls', type=int, default=2000, help='calls timed per function')
+    parser.add_argument('--seed', type=int, default=1, help='random seed')
+    parser.add_argument('--output', help='also write the JSON report to this file')
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,65 @@
+"""
+Measures infraction write throughput with and without group commit.
+
+Each writer awaits insert_infraction in a loop, like moderators firing Delete & Warn during a raid. With group commit
+the writes that queue up while one transaction commits are coalesced into the next one.
+
+Usage:
+    python -m benchmarks.group_commit [--writes 2000] [--synchronous NORMAL]
+"""
+
+# libraries
+import argparse
+import asyncio
+import contextlib
+import os
+import time
+
+from benchmarks import _env  # noqa: F401, before ptn.modbot
+
+import ptn.modbot.constants as constants  # noqa: E402
+import ptn.modbot.database.database as database  # noqa: E402
+
+WRITER_COUNTS = [1, 10, 100]
+
+MODES = {
+    # one transaction (and commit) per write, the pre group commit behaviour
+    'commit per write': {'commit_window': 0.0, 'max_batch': 1},
+    'group commit': {'commit_window': constants.DB_GROUP_COMMIT_WINDOW,
+                     'max_batch': constants.DB_GROUP_COMMIT_MAX_BATCH},
+}
+
+
+async def writer(writer_id, writes):
+    for _ in range(writes):
+        await database.insert_infraction(writer_id, 1, int(time.time()), 1, 'benchmark')
+
+
+async def measure(writers, total_writes):
+    writes_each = max(total_writes // writers, 1)
+    start = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        await asyncio.gather(*(writer(i, writes_each) for i in range(writers)))
+    elapsed = time.perf_counter() - start
+    return writers * writes_each / elapsed
+
+
+async def main(args):
+    database.build_database_on_startup()
+    database.infraction_conn.execute(f'PRAGMA synchronous = {args.synchronous}')
+
+    print(f'synchronous={args.synchronous}, {args.writes} writes per run')
+    for mode, settings in MODES.items():
+        database.infraction_db_worker.commit_window = settings['commit_window']
+        database.infraction_db_worker.max_batch = settings['max_batch']
+        for writers in WRITER_COUNTS:
+            rate = await measure(writers, args.writes)
+            print(f'{mode:>17} | {writers:>3} writer(s) | {rate:>9.0f} writes/sec')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--writes', type=int, default=2000, help='writes per run')
+    parser.add_argument('--synchronous', default='NORMAL', choices=['OFF', 'NORMAL', 'FULL'],
+                        help='sqlite synchronous setting for the run')
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,82 @@
+"""
+Measures event loop lag while ModBot's database functions are under write load.
+
+A probe coroutine sleeps for a fixed interval and records how late it wakes up. With sqlite3 running on the loop
+every commit/fsync shows up as lag; with the database worker thread it shouldn't.
+
+Usage:
+    python -m benchmarks.loop_lag [--writers 20] [--writes 50] [--inline]
+
+--inline runs the same statements directly on the event loop, reproducing the pre-worker behaviour for comparison.
+"""
+
+# libraries
+import argparse
+import asyncio
+import statistics
+import time
+
+from benchmarks import _env  # noqa: F401, before ptn.modbot
+
+import ptn.modbot.database.database as database  # noqa: E402
+
+PROBE_INTERVAL = 0.005  # seconds between loop lag probes
+
+
+async def probe_loop_lag(samples, stop_event):
+    while not stop_event.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        samples.append(time.perf_counter() - start - PROBE_INTERVAL)
+
+
+def insert_inline(warned_user):
+    # the pre-worker behaviour: blocking sqlite3 calls straight on the event loop
+    database.infraction_db.execute(
+        "INSERT INTO infractions (warned_user, warning_moderator, warning_time, rule_broken, warning_reason, "
+        "thread_id) VALUES (?, ?, ?, ?, ?, ?)",
+        (warned_user, 1, int(time.time()), 1, 'benchmark', None)
+    )
+    database.infraction_conn.commit()
+
+
+async def writer(writer_id, writes, inline):
+    for _ in range(writes):
+        if inline:
+            insert_inline(writer_id)
+            await asyncio.sleep(0)
+        else:
+            await database.insert_infraction(writer_id, 1, int(time.time()), 1, 'benchmark')
+
+
+async def main(args):
+    database.build_database_on_startup()
+    database.infraction_conn.execute('PRAGMA synchronous = FULL')  # make every commit pay for an fsync
+
+    samples = []
+    stop_event = asyncio.Event()
+    probe = asyncio.create_task(probe_loop_lag(samples, stop_event))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(writer(i, args.writes, args.inline) for i in range(args.writers)))
+    elapsed = time.perf_counter() - start
+
+    stop_event.set()
+    await probe
+
+    samples.sort()
+    mode = 'inline (on loop)' if args.inline else 'database worker'
+    print(f'mode: {mode}')
+    print(f'writes: {args.writers * args.writes} in {elapsed:.2f}s')
+    print(f'loop lag samples: {len(samples)}')
+    print(f'loop lag median: {statistics.median(samples) * 1000:.2f}ms')
+    print(f'loop lag p99: {samples[int(len(samples) * 0.99) - 1] * 1000:.2f}ms')
+    print(f'loop lag max: {samples[-1] * 1000:.2f}ms')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--writers', type=int, default=20, help='number of concurrent writers')
+    parser.add_argument('--writes', type=int, default=50, help='writes per writer')
+    parser.add_argument('--inline', action='store_true', help='run sqlite3 on the event loop for comparison')
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,93 @@
+"""
+Measures the cost of turning infraction rows into InfractionData objects.
+
+Compares the original construction (sqlite3.Row converted to a dict, then one .get per attribute, objects with a
+__dict__) against the slotted class built straight from tuples by its row factory. Reports the time to fetch and
+build the objects and the memory they hold on to.
+
+Usage:
+    python -m benchmarks.record_construction [--rows 100000] [--repeat 5]
+"""
+
+# libraries
+import argparse
+import gc
+import sqlite3
+import time
+import tracemalloc
+
+from ptn.modbot.classes.InfractionData import InfractionData
+
+
+class DictInfractionData:
+    # the pre-slots InfractionData, for comparison
+    def __init__(self, info_dict=None):
+        info_dict = dict(info_dict) if info_dict else dict()
+        self.entry_id = info_dict.get('entry_id', None)
+        self.warned_user = info_dict.get('warned_user', None)
+        self.warning_moderator = info_dict.get('warning_moderator', None)
+        self.warning_time = info_dict.get('warning_time', None)
+        self.rule_broken = info_dict.get('rule_broken', None)
+        self.warning_reason = info_dict.get('warning_reason', None)
+        self.thread_id = info_dict.get('thread_id', None)
+
+
+def build_database(rows):
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE infractions(entry_id INTEGER NOT NULL PRIMARY KEY, warned_user INTEGER NOT NULL, '
+                 'warning_moderator INTEGER NOT NULL, warning_time INTEGER NOT NULL, rule_broken INTEGER, '
+                 'warning_reason TEXT, thread_id INTEGER)')
+    conn.executemany(
+        'INSERT INTO infractions VALUES (?, ?, ?, ?, ?, ?, ?)',
+        ((i, 10 ** 17 + i % 5000, 10 ** 17 + i % 40, 1_600_000_000 + i, i % 12, f'warning reason {i}', None)
+         for i in range(1, rows + 1))
+    )
+    return conn
+
+
+def fetch_dict_backed(conn):
+    cursor = conn.cursor()
+    cursor.row_factory = sqlite3.Row
+    cursor.execute('SELECT * FROM infractions')
+    return [DictInfractionData(row) for row in cursor.fetchall()]
+
+
+def fetch_slotted(conn):
+    cursor = conn.cursor()
+    cursor.row_factory = InfractionData.row_factory
+    cursor.execute('SELECT * FROM infractions')
+    return cursor.fetchall()
+
+
+def measure(conn, fetch, repeat):
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        fetch(conn)
+        timings.append(time.perf_counter() - start)
+
+    # memory held by the finished list of objects, the row values themselves included
+    gc.collect()
+    tracemalloc.start()
+    objects = fetch(conn)
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del objects
+    return min(timings), held
+
+
+def main(args):
+    conn = build_database(args.rows)
+    print(f'{args.rows} rows, best of {args.repeat}')
+    for name, fetch in [('dict-backed', fetch_dict_backed), ('slotted, row factory', fetch_slotted)]:
+        seconds, held = measure(conn, fetch, args.repeat)
+        print(f'{name:>20} | {seconds * 1000:>8.1f}ms | {seconds / args.rows * 1e9:>6.0f}ns/row | '
+              f'{held / 1024 / 1024:>7.1f}MiB held | {held / args.rows:>5.0f}B/row')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100000, help='rows to fetch')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs, the best is reported')
+    main(parser.parse_args())
@@ -0,0 +1,131 @@
+"""
+Generates a realistic synthetic infractions database for benchmarking.
+
+Infractions are spread over members with a Zipf-like skew, so a small set of repeat offenders holds a large share of
+the record while most members have one or two warnings, like the real server. Moderators, rules, times and reasons
+are spread the same way. Everything is seeded, so the same arguments always build the same database.
+
+Usage:
+    python -m benchmarks.synthetic_data [--infractions 1000000] [--users 200000] [--carriers 5000] [--seed 1]
+
+Run on its own it builds the database in a throwaway data directory, removed again on exit, and reports how long
+that took.
+"""
+
+# libraries
+import argparse
+import itertools
+import os
+import random
+import time
+
+BASE_ID = 10 ** 17  # Discord snowflakes are 18 digit numbers
+MODERATORS = 40
+RULES = 12
+FIRST_WARNING = 1_600_000_000  # 2020-09
+LAST_WARNING = 1_790_000_000  # 2026-09
+REASON_WORDS = ['spam', 'carrier', 'trade', 'market', 'scam', 'insult', 'advertising', 'raid', 'wine', 'tonnage',
+                'station', 'jump', 'off', 'topic', 'repeat', 'warning', 'harassment', 'language', 'links', 'dms']
+
+INSERT_BATCH = 10000
+
+
+def skewed_choices(rng, population, count, skew=1.1):
+    """
+    Picks count items from population with Zipf-like weights: the first items are picked far more often.
+    """
+    cum_weights = list(itertools.accumulate(1 / (rank ** skew) for rank in range(1, len(population) + 1)))
+    return rng.choices(population, cum_weights=cum_weights, k=count)
+
+
+def member_ids(users):
+    return [BASE_ID + 1000 + i for i in range(users)]
+
+
+def generate_infractions(rng, infractions, users):
+    warned_users = skewed_choices(rng, member_ids(users), infractions)
+    moderators = skewed_choices(rng, [BASE_ID + i for i in range(MODERATORS)], infractions, skew=0.8)
+    rules = skewed_choices(rng, list(range(1, RULES + 1)), infractions, skew=0.9)
+    for warned_user, moderator, rule in zip(warned_users, moderators, rules):
+        reason = ' '.join(rng.choices(REASON_WORDS, k=rng.randint(3, 12)))
+        thread_id = BASE_ID + 500_000 + warned_user % 1_000_000
+        yield warned_user, moderator, rng.randint(FIRST_WARNING, LAST_WARNING), rule, reason, thread_id
+
+
+def generate_carriers(rng, carriers, users):
+    owners = member_ids(users)
+    for i in range(carriers):
+        roles = ','.join(str(BASE_ID + 900_000 + role) for role in rng.sample(range(60), rng.randint(1, 8)))
+        # XXX-NNN like a real carrier ID, unique for up to 17576 carriers
+        carrier_id = f'{chr(65 + i % 26)}{chr(65 + i // 26 % 26)}{chr(65 + i // 676 % 26)}-{i % 1000:03d}'
+        yield (f'P.T.N. Carrier {i}', carrier_id,
+               rng.choice(['Sol', 'Deciat', 'Shinrarta Dezhra', 'Colonia', 'Jameson Memorial']),
+               f'CMDR Owner {i}', rng.choice(owners), roles)
+
+
+def populate(database, infractions, users, carriers, seed=1):
+    """
+    Fills the bot's database with synthetic infractions and carriers, straight through the writer connection.
+
+    :param module database: ptn.modbot.database.database, already built
+    :returns: The member IDs used
+    :rtype: list
+    """
+    rng = random.Random(seed)
+    conn = database.infraction_conn
+    rows = generate_infractions(rng, infractions, users)
+    while True:
+        batch = list(itertools.islice(rows, INSERT_BATCH))
+        if not batch:
+            break
+        conn.execute('BEGIN')
+        conn.executemany(
+            'INSERT INTO infractions (warned_user, warning_moderator, warning_time, rule_broken, warning_reason, '
+            'thread_id) VALUES (?, ?, ?, ?, ?, ?)',
+            batch
+        )
+        conn.execute('COMMIT')
+
+    carrier_rows = list(generate_carriers(rng, carriers, users))
+    # a member's roles are snapshotted once, from their first carrier
+    snapshots = {}
+    for row in carrier_rows:
+        snapshots.setdefault(row[4], row[5].split(','))
+    conn.execute('BEGIN')
+    conn.executemany(
+        'INSERT INTO tow_truck (carrier_name, carrier_id, carrier_position, in_game_carrier_owner, discord_user) '
+        'VALUES (?, ?, ?, ?, ?)',
+        (row[:5] for row in carrier_rows)
+    )
+    conn.executemany(
+        'INSERT INTO tow_truck_role_snapshot (discord_user, role_id, position) VALUES (?, ?, ?)',
+        ((discord_user, int(role_id), position)
+         for discord_user, role_ids in snapshots.items() for position, role_id in enumerate(role_ids))
+    )
+    conn.execute('COMMIT')
+    conn.execute('ANALYZE')
+    # written around the carrier functions, so the in-memory tow lot has to be reloaded
+    database.carrier_mirror.load(conn)
+    return member_ids(users)
+
+
+def main(args):
+    from benchmarks import _env  # noqa: F401, before ptn.modbot
+    import ptn.modbot.database.database as database
+
+    database.build_database_on_startup()
+    start = time.perf_counter()
+    populate(database, args.infractions, args.users, args.carriers, args.seed)
+    elapsed = time.perf_counter() - start
+    size = os.path.getsize(database.constants.INFRACTIONS_DB_PATH)
+    print(f'{args.infractions} infractions over {args.users} members and {args.carriers} carriers in '
+          f'{elapsed:.1f}s, {size / 1024 / 1024:.0f}MiB')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--infractions', type=int, default=1000000, help='infractions to generate')
+    parser.add_argument('--users', type=int, default=200000, help='members to spread them over')
+    parser.add_argument('--carriers', type=int, default=5000, help='tow truck carriers to generate')
+    parser.add_argument('--seed', type=int, default=1, help='random seed')
+    main(parser.parse_args())
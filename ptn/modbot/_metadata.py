@@ -1,4 +1,4 @@
 # version is BREAKING CHANGE - MAJOR CHANGE - MINOR CHANGE
-__version__ = '1.3.12'
+__version__ = '1.4.0'
 
 
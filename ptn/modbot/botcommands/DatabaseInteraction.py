@@ -1,17 +1,536 @@
-from discord.ext import commands
+# libraries
+import collections
+import math
+import time
 
-from ptn.modbot.modules.ErrorHandler import on_app_command_error
+# import discord
+import discord
+from discord import app_commands
+from discord.app_commands import describe
+from discord.ext import commands, tasks
+
+# import constants
+import ptn.modbot.constants as constants
+
+# import database functions
+import ptn.modbot.database.database as database
+from ptn.modbot.database.database import search_infractions, browse_infractions, export_table, backup_database, \
+    dump_database, db_metrics, infraction_cache, archive_infractions, run_maintenance, get_moderator_month_stats, \
+    get_rule_month_stats, get_last_scheduled_run, save_scheduled_run
+
+# local modules
+from ptn.modbot.modules.DateString import date_to_posix, get_formatted_date_string, month_string
+from ptn.modbot.modules.ErrorHandler import on_app_command_error, on_generic_error, CustomError
+from ptn.modbot.modules.Helpers import check_roles
+
+'''
+VIEWS FOR DATABASE BROWSING
+'''
+
+
+# Paged results for /search_infractions
+class InfractionSearchResults(discord.ui.View):
+    page_size = 5
+
+    def __init__(self, search_text: str, exact_phrase: bool, member: discord.Member = None):
+        super().__init__(timeout=600)  # results are ephemeral, no need to keep paging forever
+        self.search_text = search_text
+        self.exact_phrase = exact_phrase
+        self.member = member
+        self.page = 0
+        self.total = 0
+
+    async def build_embed(self):
+        """
+        Fetches the current page of results and returns it as an embed, updating the paging buttons to match.
+        """
+        results, self.total = await search_infractions(
+            self.search_text, exact_phrase=self.exact_phrase, warned_user=self.member.id if self.member else None,
+            limit=self.page_size, offset=self.page * self.page_size
+        )
+        total_pages = max(math.ceil(self.total / self.page_size), 1)
+
+        embed = discord.Embed(
+            title='Infraction Search',
+            description=f'Results for `{self.search_text}`' + (f' from <@{self.member.id}>' if self.member else ''),
+            color=constants.EMBED_COLOUR_QU
+        )
+        for infraction, snippet in results:
+            embed.add_field(
+                name=f'Entry {infraction.entry_id} | Rule {infraction.rule_broken}',
+                value=f'<@{infraction.warned_user}> by <@{infraction.warning_moderator}> '
+                      f'<t:{infraction.warning_time}:d>\n{snippet[:900]}',
+                inline=False
+            )
+        if not results:
+            embed.description += '\nNo matching infractions found.'
+        embed.set_footer(text=f'Page {self.page + 1}/{total_pages} • {self.total} result(s)')
+
+        self.previous_page.disabled = self.page == 0
+        self.next_page.disabled = self.page + 1 >= total_pages
+        return embed
+
+    @discord.ui.button(label='Previous', style=discord.ButtonStyle.secondary, emoji='◀️', row=0)
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page = max(self.page - 1, 0)
+        embed = await self.build_embed()
+        await interaction.response.edit_message(embed=embed, view=self)
+
+    @discord.ui.button(label='Next', style=discord.ButtonStyle.secondary, emoji='▶️', row=0)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page += 1
+        embed = await self.build_embed()
+        await interaction.response.edit_message(embed=embed, view=self)
+
+
+# Newest-first pages through every infraction matching /browse_infractions
+class InfractionBrowser(discord.ui.View):
+    page_size = 10
+
+    def __init__(self, filters: dict, description: str, since: int = None, until: int = None,
+                 full_history: bool = False):
+        super().__init__(timeout=600)
+        self.filters = filters
+        self.description = description
+        self.since = since
+        self.until = until
+        self.full_history = full_history
+        # keyset of the last infraction on each page we've passed, going back pops rather than re-querying offsets
+        self.cursors = [None]
+        self.last_seen = None
+
+    async def build_embed(self):
+        """
+        Fetches the page after the cursor on top of the stack and returns it as an embed, updating the paging buttons.
+        """
+        infractions, more = await browse_infractions(
+            self.page_size, seek=self.cursors[-1], since=self.since, until=self.until,
+            full_history=self.full_history, **self.filters
+        )
+        self.last_seen = (infractions[-1].warning_time, infractions[-1].entry_id) if infractions else None
+
+        embed = discord.Embed(
+            title='Infraction Browser',
+            description=self.description,
+            color=constants.EMBED_COLOUR_QU
+        )
+        for infraction in infractions:
+            embed.add_field(
+                name=f'Entry {infraction.entry_id} | Rule {infraction.rule_broken}',
+                value=f'<@{infraction.warned_user}> by <@{infraction.warning_moderator}> '
+                      f'<t:{infraction.warning_time}:f>\n{(infraction.warning_reason or "")[:900]}',
+                inline=False
+            )
+        if not infractions:
+            embed.description += '\nNo matching infractions found.'
+        embed.set_footer(text=f'Page {len(self.cursors)}')
+
+        self.newer_page.disabled = len(self.cursors) == 1
+        self.older_page.disabled = not more
+        return embed
+
+    @discord.ui.button(label='Newer', style=discord.ButtonStyle.secondary, emoji='◀️', row=0)
+    async def newer_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        if len(self.cursors) > 1:
+            self.cursors.pop()
+        embed = await self.build_embed()
+        await interaction.response.edit_message(embed=embed, view=self)
+
+    @discord.ui.button(label='Older', style=discord.ButtonStyle.secondary, emoji='▶️', row=0)
+    async def older_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        if self.last_seen:
+            self.cursors.append(self.last_seen)
+        embed = await self.build_embed()
+        await interaction.response.edit_message(embed=embed, view=self)
+
+
+"""
+COG FOR DATABASE COMMANDS
+"""
 
 
 class DatabaseInteraction(commands.Cog):
     def __init__(self, bot: commands.Cog):
         self.bot = bot
+        self.recent_interactions = collections.deque()  # monotonic times, to tell when the bot is quiet
+        self.started = time.monotonic()
 
     def cog_load(self):
         tree = self.bot.tree
         self._old_tree_error = tree.on_error
         tree.on_error = on_app_command_error
+        self.scheduled_backup.start()
+        self.scheduled_maintenance.start()
 
     def cog_unload(self):
         tree = self.bot.tree
-        tree.on_error = self._old_tree_error
\ No newline at end of file
+        tree.on_error = self._old_tree_error
+        self.scheduled_backup.cancel()
+        self.scheduled_maintenance.cancel()
+
+    @commands.Cog.listener()
+    async def on_interaction(self, interaction: discord.Interaction):
+        self.recent_interactions.append(time.monotonic())
+
+    def is_quiet(self):
+        """
+        Whether fewer than DB_MAINTENANCE_QUIET_COMMANDS interactions came in over the last
+        DB_MAINTENANCE_QUIET_MINUTES. Never straight after startup, before there's been that long to watch.
+        """
+        cutoff = time.monotonic() - constants.DB_MAINTENANCE_QUIET_MINUTES * 60
+        if self.started > cutoff:
+            return False
+        while self.recent_interactions and self.recent_interactions[0] < cutoff:
+            self.recent_interactions.popleft()
+        return len(self.recent_interactions) < constants.DB_MAINTENANCE_QUIET_COMMANDS
+
+    async def is_due(self, job, interval_hours):
+        """
+        Whether interval_hours have passed since the job's last recorded run. The times are kept in the database, so
+        restarting the bot doesn't run the job again; a job with no run on record starts its first interval now.
+        """
+        now = time.time()
+        last_run = await get_last_scheduled_run(job)
+        if last_run is None:
+            await save_scheduled_run(job, now)
+            return False
+        return now - last_run >= interval_hours * 3600
+
+    # archive old infractions, then back up and dump the database into BACKUP_DB_PATH and SQL_PATH
+    @tasks.loop(minutes=constants.DB_SCHEDULE_CHECK_MINUTES)
+    async def scheduled_backup(self):
+        if not await self.is_due('backup', constants.DB_BACKUP_INTERVAL_HOURS):
+            return
+        # recorded up front, a job that fails waits for the next interval rather than retrying every check
+        await save_scheduled_run('backup', time.time())
+
+        for description, job in [('archival', archive_infractions), ('backup', backup_database),
+                                 ('SQL dump', dump_database)]:
+            try:
+                await job()
+            except Exception as e:
+                print(f'Scheduled database {description} failed: {e}')
+                try:
+                    dev_channel = self.bot.get_channel(constants.dev_channel())
+                    embed = discord.Embed(
+                        description=f'❌ Scheduled database {description} failed: ```{e}```',
+                        color=constants.EMBED_COLOUR_ERROR
+                    )
+                    await dev_channel.send(embed=embed)
+                except Exception as e:
+                    print(e)
+
+    @scheduled_backup.before_loop
+    async def before_scheduled_backup(self):
+        await self.bot.wait_until_ready()
+
+    # optimize, vacuum and checkpoint the database once things are quiet and it's been long enough since the last run
+    @tasks.loop(minutes=constants.DB_MAINTENANCE_QUIET_MINUTES / 2)
+    async def scheduled_maintenance(self):
+        if not self.is_quiet() or not await self.is_due('maintenance', constants.DB_MAINTENANCE_INTERVAL_HOURS):
+            return
+
+        await save_scheduled_run('maintenance', time.time())
+        try:
+            report = await run_maintenance()
+            embed = discord.Embed(
+                description=f"🧹 Database maintenance finished in {report['seconds']:.2f}s",
+                color=constants.EMBED_COLOUR_OK
+            )
+            for name, step in report['steps'].items():
+                details = ', '.join(f'{key}: {value}' for key, value in step.items() if key != 'seconds')
+                embed.add_field(name=name, value=f"{step['seconds']:.2f}s" + (f'\n{details}' if details else ''),
+                                inline=False)
+            if report['skipped']:
+                embed.add_field(name='Skipped, out of time', value=', '.join(report['skipped']), inline=False)
+        except Exception as e:
+            print(f'Scheduled database maintenance failed: {e}')
+            embed = discord.Embed(
+                description=f'❌ Scheduled database maintenance failed: ```{e}```',
+                color=constants.EMBED_COLOUR_ERROR
+            )
+
+        try:
+            dev_channel = self.bot.get_channel(constants.dev_channel())
+            await dev_channel.send(embed=embed)
+        except Exception as e:
+            print(e)
+
+    @scheduled_maintenance.before_loop
+    async def before_scheduled_maintenance(self):
+        await self.bot.wait_until_ready()
+
+    # full text search over every warning reason on record
+    @app_commands.command(name='search_infractions', description='Search infraction reasons for words or a phrase')
+    @check_roles(constants.any_elevated_role)
+    @describe(search_text='Words to search for, all must appear in the reason')
+    @describe(exact_phrase='Match the words as one exact phrase')
+    @describe(member='[Optional] Only search this member\'s infractions')
+    async def search_infractions(self, interaction: discord.Interaction, search_text: str,
+                                 exact_phrase: bool = False, member: discord.User = None):
+        print(f'search_infractions called by {interaction.user.display_name} for "{search_text}"')
+        if not search_text.strip():
+            try:
+                raise CustomError('You must give something to search for!')
+            except Exception as e:
+                return await on_generic_error(interaction, e)
+
+        try:
+            view = InfractionSearchResults(search_text=search_text, exact_phrase=exact_phrase, member=member)
+            embed = await view.build_embed()
+            await interaction.response.send_message(embed=embed, view=view, ephemeral=True)
+        except Exception as e:
+            try:
+                raise CustomError(f'Could not search infractions: {e}')
+            except Exception as e:
+                return await on_generic_error(interaction, e)
+
+    # page through the whole infraction history, newest first
+    @app_commands.command(name='browse_infractions', description='Page through infractions, newest first')
+    @check_roles(constants.any_elevated_role)
+    @describe(member='[Optional] Only infractions given to this member')
+    @describe(moderator='[Optional] Only infractions given by this moderator')
+    @describe(rule='[Optional] Only infractions for this rule number')
+    @describe(since='[Optional] Only infractions on or after this date, YYYY-MM-DD')
+    @describe(until='[Optional] Only infractions before this date, YYYY-MM-DD')
+    @describe(full_history='[Optional] Include archived infractions, the default when browsing one member')
+    async def browse_infractions(self, interaction: discord.Interaction, member: discord.User = None,
+                                 moderator: discord.User = None, rule: int = None, since: str = None,
+                                 until: str = None, full_history: bool = None):
+        print(f'browse_infractions called by {interaction.user.display_name}')
+        # one member's record is read whole, like View Infractions, everything else sticks to recent infractions
+        if full_history is None:
+            full_history = member is not None
+        full_history = full_history and database.archive_attached
+        try:
+            since_time, until_time = [date_to_posix(date) if date else None for date in (since, until)]
+        except ValueError:
+            try:
+                raise CustomError('Dates must be given as YYYY-MM-DD!')
+            except Exception as e:
+                return await on_generic_error(interaction, e)
+
+        filters = {}
+        description = 'Infractions'
+        if member:
+            filters['warned_user'] = member.id
+            description += f' given to <@{member.id}>'
+        if moderator:
+            filters['warning_moderator'] = moderator.id
+            description += f' given by <@{moderator.id}>'
+        if rule is not None:
+            filters['rule_broken'] = rule
+            description += f' for rule {rule}'
+        if since:
+            description += f' since {since}'
+        if until:
+            description += f' before {until}'
+        if full_history:
+            description += ', including archived infractions'
+
+        try:
+            view = InfractionBrowser(filters=filters, description=description, since=since_time, until=until_time,
+                                     full_history=full_history)
+            embed = await view.build_embed()
+            await interaction.response.send_message(embed=embed, view=view, ephemeral=True)
+        except Exception as e:
+            try:
+                raise CustomError(f'Could not browse infractions: {e}')
+            except Exception as e:
+                return await on_generic_error(interaction, e)
+
+    # download infractions or the tow lot as a gzipped file
+    @app_commands.command(name='export_infractions', description='Export infractions or the tow lot as a file')
+    @check_roles(constants.any_elevated_role)
+    @describe(table='What to export')
+    @describe(export_format='NDJSON (one JSON object per line) or CSV')
+    @describe(member='[Optional] Only rows for this member')
+    @describe(moderator='[Optional] Only infractions given by this moderator')
+    @describe(rule='[Optional] Only infractions for this rule number')
+    @describe(since='[Optional] Only infractions on or after this date, YYYY-MM-DD')
+    @describe(until='[Optional] Only infractions before this date, YYYY-MM-DD')
+    @describe(full_history='[Optional] Include archived infractions')
+    @app_commands.choices(
+        table=[app_commands.Choice(name='Infractions', value='infractions'),
+               app_commands.Choice(name='Tow lot', value='tow_truck')],
+        export_format=[app_commands.Choice(name='NDJSON', value='ndjson'),
+                       app_commands.Choice(name='CSV', value='csv')]
+    )
+    async def export_infractions(self, interaction: discord.Interaction, table: str = 'infractions',
+                                 export_format: str = 'ndjson', member: discord.User = None,
+                                 moderator: discord.User = None, rule: int = None, since: str = None,
+                                 until: str = None, full_history: bool = False):
+        print(f'export_infractions called by {interaction.user.display_name} for {table}')
+        try:
+            since_time, until_time = [date_to_posix(date) if date else None for date in (since, until)]
+        except ValueError:
+            try:
+                raise CustomError('Dates must be given as YYYY-MM-DD!')
+            except Exception as e:
+                return await on_generic_error(interaction, e)
+
+        filters = {'equals': {}}
+        if table == 'infractions':
+            if member:
+                filters['equals']['warned_user'] = member.id
+            if moderator:
+                filters['equals']['warning_moderator'] = moderator.id
+            if rule is not None:
+                filters['equals']['rule_broken'] = rule
+            filters['since'] = since_time
+            filters['until'] = until_time
+            filters['full_history'] = full_history and database.archive_attached
+        else:
+            if moderator or rule is not None or since or until or full_history:
+                try:
+                    raise CustomError('The tow lot can only be filtered by member!')
+                except Exception as e:
+                    return await on_generic_error(interaction, e)
+            if member:
+                filters['equals']['discord_user'] = member.id
+
+        # exports can take a while, don't let the interaction time out
+        await interaction.response.defer(ephemeral=True)
+
+        export_file = None
+        try:
+            export_file, row_count = await export_table(table, export_format, **filters)
+            file_size = export_file.seek(0, 2)
+            export_file.seek(0)
+            size_limit = interaction.guild.filesize_limit if interaction.guild else 25 * 1024 * 1024
+            if file_size > size_limit:
+                raise CustomError(f'The export is {file_size // 1024} KiB compressed, over the '
+                                  f'{size_limit // 1024} KiB upload limit. Narrow it down with filters.')
+
+            filename = f'{table}_{get_formatted_date_string()[0]}.{export_format}.gz'
+            await interaction.followup.send(
+                content=f'Exported {row_count} row(s).', file=discord.File(export_file, filename=filename),
+                ephemeral=True
+            )
+        except Exception as e:
+            try:
+                raise CustomError(f'Could not export {table}: {e}')
+            except Exception as e:
+                return await on_generic_error(interaction, e)
+        finally:
+            if export_file:
+                export_file.close()
+
+    # warnings per moderator and per rule, read from the monthly statistics tables
+    @app_commands.command(name='mod_stats', description='Show infractions given per moderator and per rule')
+    @check_roles(constants.any_elevated_role)
+    @describe(months='[Optional] How many months back to include, this month counts as one (max 24)')
+    @describe(moderator='[Optional] Month by month figures for this moderator')
+    @describe(rule='[Optional] Month by month figures for this rule number')
+    async def mod_stats(self, interaction: discord.Interaction, months: int = 6, moderator: discord.User = None,
+                        rule: int = None):
+        print(f'mod_stats called by {interaction.user.display_name}')
+        if not 1 <= months <= 24:
+            try:
+                raise CustomError('Months must be between 1 and 24!')
+            except Exception as e:
+                return await on_generic_error(interaction, e)
+
+        try:
+            since_month = month_string(months - 1)
+            moderator_stats = await get_moderator_month_stats(
+                since_month=since_month, warning_moderator=moderator.id if moderator else None
+            )
+            rule_stats = await get_rule_month_stats(since_month=since_month, rule_broken=rule)
+
+            embed = discord.Embed(
+                title='Moderation Statistics',
+                description=f'Infractions given since {since_month}, archived infractions included.',
+                color=constants.EMBED_COLOUR_QU
+            )
+
+            def totals(rows):
+                counts = collections.Counter()
+                for key, month, count in rows:
+                    counts[key] += count
+                return counts
+
+            def by_month(rows):
+                counts = collections.Counter()
+                for key, month, count in rows:
+                    counts[month] += count
+                return '\n'.join(f'{month}: {count}' for month, count in sorted(counts.items())) or 'None'
+
+            if moderator:
+                embed.add_field(name=f'Given by {moderator.display_name}', value=by_month(moderator_stats),
+                                inline=True)
+            if rule is not None:
+                embed.add_field(name=f'For rule {rule}', value=by_month(rule_stats), inline=True)
+            if not moderator and rule is None:
+                top_moderators = totals(moderator_stats).most_common(15)
+                embed.add_field(
+                    name='Moderators',
+                    value='\n'.join(f'<@{key}>: {count}' for key, count in top_moderators) or 'None',
+                    inline=True
+                )
+                top_rules = totals(rule_stats).most_common(15)
+                embed.add_field(
+                    name='Rules broken most',
+                    value='\n'.join(f'Rule {key}: {count}' if key else f'No rule: {count}'
+                                    for key, count in top_rules) or 'None',
+                    inline=True
+                )
+                # every infraction counts once towards its rule, so the rule figures give the monthly totals
+                embed.add_field(name='Per month', value=by_month(rule_stats), inline=True)
+
+            await interaction.response.send_message(embed=embed, ephemeral=True)
+        except Exception as e:
+            try:
+                raise CustomError(f'Could not get moderation statistics: {e}')
+            except Exception as e:
+                return await on_generic_error(interaction, e)
+
+    # how the database has been performing
+    @app_commands.command(name='db_stats', description='Show database call timings and cache statistics')
+    @check_roles(constants.any_elevated_role)
+    async def db_stats(self, interaction: discord.Interaction):
+        print(f'db_stats called by {interaction.user.display_name}')
+        try:
+            stats = db_metrics.stats()
+            cache = infraction_cache.stats()
+
+            embed = discord.Embed(
+                title='Database Statistics',
+                description=f'Timings over the last {stats["window"] // 60} minutes, slowest first.\n'
+                            f'Infraction cache: {cache["users"]}/{cache["max_users"]} members, '
+                            f'{cache["hit_rate"]:.0%} hit rate ({cache["hits"]} hits, {cache["misses"]} misses, '
+                            f'{cache["invalidations"]} invalidations)',
+                color=constants.EMBED_COLOUR_QU
+            )
+
+            # an embed holds 25 fields, one is kept for the slow calls
+            functions = sorted(stats['functions'].items(), key=lambda item: item[1]['total']['p95'], reverse=True)
+            for name, function in functions[:24]:
+                total, wait, execute = function['total'], function['wait'], function['execute']
+                embed.add_field(
+                    name=f'{name} ({total["count"]} calls)',
+                    value=f'p50 {total["p50"]:.1f}ms | p95 {total["p95"]:.1f}ms | p99 {total["p99"]:.1f}ms | '
+                          f'max {total["max"]:.1f}ms\n'
+                          f'wait p95 {wait["p95"]:.1f}ms | execute p95 {execute["p95"]:.1f}ms\n'
+                          f'{function["rows"]} rows, {function["errors"]} errors since startup',
+                    inline=False
+                )
+            if not functions:
+                embed.description += '\nNo database calls in this window.'
+
+            slow_calls = stats['slow_calls'][-5:]
+            if slow_calls:
+                embed.add_field(
+                    name=f'Recent slow calls (over {db_metrics.slow_ms:.0f}ms)',
+                    value='\n'.join(f'<t:{slow["time"]}:R> `{slow["function"]}` {slow["total_ms"]:.0f}ms '
+                                    f'(waited {slow["wait_ms"]:.0f}ms, {slow["rows"]} rows)'
+                                    for slow in reversed(slow_calls)),
+                    inline=False
+                )
+
+            await interaction.response.send_message(embed=embed, ephemeral=True)
+        except Exception as e:
+            try:
+                raise CustomError(f'Could not get database statistics: {e}')
+            except Exception as e:
+                return await on_generic_error(interaction, e)
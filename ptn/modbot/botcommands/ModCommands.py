@@ -7,7 +7,7 @@ from datetime import datetime, timedelta
 import discord
 from discord import app_commands, ui
 from discord.app_commands import describe
-from discord.ext import commands
+from discord.ext import commands, tasks
 
 # import metadata
 from ptn.modbot._metadata import __version__
@@ -21,13 +21,17 @@ from ptn.modbot.constants import role_council, role_mod, channel_evidence, \
     channel_botspam, forum_channel, dyno_user, atlas_channel, any_elevated_role
 
 # import database functions
-from ptn.modbot.database.database import find_infraction, delete_single_warning, edit_infraction
+import ptn.modbot.database.database as database
+from ptn.modbot.database.database import find_infraction, delete_single_warning, edit_infraction, \
+    query_infractions
 
 # local modules
 from ptn.modbot.modules.ErrorHandler import on_app_command_error, on_generic_error, CustomError
 from ptn.modbot.modules.Helpers import (find_thread, display_infractions, get_rule, create_thread, warn_user,
                                         check_roles, rule_check, delete_thread_if_only_bot_message, can_see_channel, \
-    warning_color, is_in_channel, edit_warning_reason, member_or_member_id)
+    warning_color, is_in_channel, edit_warning_reason, member_or_member_id, build_thread_index, index_thread,
+                                        unindex_thread, crawl_archived_threads, get_rule_embeds, update_rules_cache,
+                                        invalidate_rules_cache)
 
 '''
 MODALS FOR WARNS
@@ -289,10 +293,75 @@ class ModCommands(commands.Cog):
         tree = self.bot.tree
         self._old_tree_error = tree.on_error
         tree.on_error = on_app_command_error
+        self.crawl_threads.start()
 
     def cog_unload(self):
         tree = self.bot.tree
         tree.on_error = self._old_tree_error
+        self.crawl_threads.cancel()
+
+    # keep the member ID -> infraction thread index current
+    @commands.Cog.listener()
+    async def on_ready(self):
+        guild = self.bot.get_guild(constants.bot_guild())
+        if guild:
+            await build_thread_index(guild)
+            try:
+                await get_rule_embeds(guild, refresh=True)
+            except Exception as e:
+                # fetched on the first rule lookup instead
+                print(f'Could not cache the rules message: {e}')
+
+    @commands.Cog.listener()
+    async def on_thread_create(self, thread: discord.Thread):
+        await index_thread(thread)
+
+    @commands.Cog.listener()
+    async def on_thread_update(self, before: discord.Thread, after: discord.Thread):
+        if before.name != after.name:
+            await unindex_thread(before.id)
+            await index_thread(after)
+
+    @commands.Cog.listener()
+    async def on_raw_thread_delete(self, payload: discord.RawThreadDeleteEvent):
+        await unindex_thread(payload.thread_id)
+
+    # keep the cached rules in step with the rules message
+    @commands.Cog.listener()
+    async def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent):
+        if payload.message_id != constants.rules_message():
+            return
+        if 'embeds' in payload.data:
+            update_rules_cache(discord.Embed.from_dict(embed) for embed in payload.data['embeds'])
+            print('Rules message edited, cached rules updated')
+        else:
+            # nothing to update from, the next lookup fetches it
+            invalidate_rules_cache()
+
+    # index archived threads, which the forum's thread list and thread events don't cover
+    @tasks.loop(hours=constants.THREAD_CRAWL_INTERVAL_HOURS)
+    async def crawl_threads(self):
+        guild = self.bot.get_guild(constants.bot_guild())
+        if not guild:
+            return
+        try:
+            await crawl_archived_threads(guild)
+        except Exception as e:
+            # the next crawl resumes from the last checkpoint
+            print(f'Archived thread crawl failed: {e}')
+            try:
+                dev_channel = self.bot.get_channel(constants.dev_channel())
+                embed = discord.Embed(
+                    description=f'❌ Archived thread crawl failed: ```{e}```',
+                    color=constants.EMBED_COLOUR_ERROR
+                )
+                await dev_channel.send(embed=embed)
+            except Exception as e:
+                print(e)
+
+    @crawl_threads.before_loop
+    async def before_crawl_threads(self):
+        await self.bot.wait_until_ready()
 
     # ping command to check if the bot is responding
     @commands.command(name='ping', aliases=['hello', 'ehlo', 'helo'],
@@ -417,9 +486,10 @@ class ModCommands(commands.Cog):
         guild = interaction.guild
         botspam = guild.get_channel(channel_botspam())
 
-        db_infractions = await find_infraction(member.id, 'warned_user')
+        # archived infractions included, their thread messages are still evidence
+        db_infractions_raw = await query_infractions(warned_user=member.id, full_history=database.archive_attached)
+        db_infractions = [infraction.to_dictionary() for infraction in db_infractions_raw]
         # print(db_infractions)
-        await find_thread(interaction, member, guild)
         thread = await find_thread(interaction, member, guild)
 
         # If there are no infractions in the database and a thread exists, delete the thread and inform the user.
@@ -486,8 +556,6 @@ class ModCommands(commands.Cog):
                 infraction = extract_infraction_from_embed(embed)
                 thread_infractions.append(infraction)
 
-        db_infractions_raw = await find_infraction(member.id, 'warned_user')
-        db_infractions = [infraction.to_dictionary() for infraction in db_infractions_raw]
         db_ids = {infraction['entry_id'] for infraction in db_infractions}
         # print(db_ids)
         thread_ids = {int(infraction['entry_id']) for infraction in thread_infractions}
@@ -11,10 +11,11 @@ from discord.ext import commands
 from ptn.modbot import constants
 from ptn.modbot.bot import bot
 from ptn.modbot.constants import role_tow_truck, channel_botspam, channel_tow_truck
-from ptn.modbot.database.database import insert_carrier, find_carrier, delete_carrier, get_all_carriers, edit_carrier
+from ptn.modbot.database.database import insert_carrier, find_carrier, delete_carrier, get_all_carriers, \
+    get_role_snapshot, transaction
 from ptn.modbot.modules.ErrorHandler import on_app_command_error, CustomError, on_generic_error
 from ptn.modbot.modules.Helpers import check_roles, warn_user, build_tow_truck_embed, \
-    build_or_update_tow_truck_pin_embed, find_largest_user_roles
+    build_or_update_tow_truck_pin_embed
 
 
 class TowTruckCommands(commands.Cog):
@@ -115,11 +116,12 @@ class TowTruckCommands(commands.Cog):
                 await interaction.followup.send(embed=embed, ephemeral=True)
                 return
 
-            # Transform roles into string for storage
+            # Snapshot the member's roles for when they're released, unless an earlier impound already swapped
+            # them for the tow truck role - that impound's snapshot is kept
             role_ids = [str(role.id) for role in member.roles]
-            roles_string = ",".join(role_ids)
             member_id = member.id
-            roles = roles_string
+            if str(tow_truck_role.id) not in role_ids:
+                roles = [role.id for role in member.roles]
             spam_embed = discord.Embed(
                 description=f'{interaction.user.mention} impounded a carrier with the id {carrier_id} '
                             f'for member {member.mention}', color=constants.EMBED_COLOUR_QU)
@@ -265,49 +267,27 @@ class TowTruckCommands(commands.Cog):
                 multiple_carriers = len(carriers) > 1
                 print(multiple_carriers)
 
-        # Get the carrier with the roles
-        if multiple_carriers:
-
-            # filter carrier to remove from other carriers
-            other_carriers = [carrier for carrier in carriers if carrier.entry_id != carrier_to_remove[0].entry_id]
-
-            # get role count in carrier_to_remove
-            to_remove_role_count = len(carrier_to_remove[0].user_roles.split(','))
-
-            # get the max number of roles from other carrier objects
-            max_roles = 0
-            for carrier in other_carriers:
-                if carrier.entry_id == carrier_to_remove[0].entry_id:
-                    continue
-                num_roles = len(carrier.user_roles.split(','))
-                if num_roles > max_roles:
-                    max_roles = num_roles
-
-            # transfer roles to the next carrier if the carrier to remove has the highest number
-            if to_remove_role_count > max_roles:
-                roles_to_carrier = other_carriers[0]
-                await edit_carrier(roles_to_carrier.entry_id, user_roles=carrier_to_remove[0].user_roles)
-
         # Entry id from object
         entry_id = carrier_to_remove[0].entry_id
         carrier_id = carrier_to_remove[0].carrier_id
 
-        # Delete carrier from database
-        await delete_carrier(entry_id)
+        # The member's roles are snapshotted once, however many carriers they have in the lot. Read them in the same
+        # commit as the delete, which clears the snapshot along with the member's last carrier
+        async with transaction():
+            roles = await get_role_snapshot(possible_member) if possible_member else []
+            await delete_carrier(entry_id)
 
         # if member, give back roles and remove tow truck
         if member and not multiple_carriers:
             # remove tow truck role
             await member.remove_roles(tow_truck_role)
 
-            # get roles from object
-            roles = [int(role_id) for role_id in carrier_to_remove[0].user_roles.split(",")]
             bad_roles = []
             roles_list = []
             for role_id in roles:
 
-                # skip everyone
-                if role_id == everyone_role.id:
+                # skip everyone, and tow truck if they already had it when towed
+                if role_id in (everyone_role.id, tow_truck_role.id):
                     continue
 
                 # try to give roles, add to list if can't
@@ -1,5 +1,9 @@
 class InfractionData:
 
+    # one per infractions column, in the same order, so from_row can unpack a SELECT * row into them
+    __slots__ = ('entry_id', 'warned_user', 'warning_moderator', 'warning_time', 'rule_broken', 'warning_reason',
+                 'thread_id')
+
     def __init__(self, info_dict=None):
         """
         Class represents an infraction object as returned from the database.
@@ -22,6 +26,26 @@ class InfractionData:
         self.warning_reason = info_dict.get('warning_reason', None)
         self.thread_id = info_dict.get('thread_id', None)
 
+    @classmethod
+    def from_row(cls, row):
+        """
+        Builds the object straight from a tuple of column values in table order, as returned by SELECT *.
+
+        :param tuple row: A single row from the sqlite query.
+        :rtype: InfractionData
+        """
+        obj = cls.__new__(cls)
+        (obj.entry_id, obj.warned_user, obj.warning_moderator, obj.warning_time, obj.rule_broken, obj.warning_reason,
+         obj.thread_id) = row
+        return obj
+
+    @staticmethod
+    def row_factory(cursor, row):
+        """
+        sqlite3 row factory returning InfractionData objects, for cursors running SELECT * on the table.
+        """
+        return InfractionData.from_row(row)
+
     def to_dictionary(self):
         """
         Formats the carrier data into a dictionary for easy access.
@@ -30,7 +54,8 @@ class InfractionData:
         :rtype: dict
         """
         response = {}
-        for key, value in vars(self).items():
+        for key in self.__slots__:
+            value = getattr(self, key)
             if value is not None:
                 response[key] = value
         return response
@@ -52,4 +77,4 @@ class InfractionData:
 
         :rtype: bool
         """
-        return any([value for key, value in vars(self).items() if value])
+        return any(getattr(self, key) for key in self.__slots__)
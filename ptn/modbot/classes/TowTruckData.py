@@ -1,5 +1,10 @@
 class TowTruckData:
 
+    # one per tow_truck column, in the same order, so from_row can unpack a row into them;
+    # CarrierMirror keeps one of these for every carrier on the lot
+    __slots__ = ('entry_id', 'carrier_name', 'carrier_id', 'carrier_position', 'in_game_carrier_owner', 'discord_user',
+                 'user_roles')
+
     def __init__(self, info_dict=None):
         """
         Class represents a carrier object as returned from the database.
@@ -22,6 +27,26 @@ class TowTruckData:
         self.discord_user = info_dict.get('discord_user', None)
         self.user_roles = info_dict.get('user_roles', None)
 
+    @classmethod
+    def from_row(cls, row):
+        """
+        Builds the object straight from a tuple of column values in table order, as returned by SELECT *.
+
+        :param tuple row: A single row from the sqlite query.
+        :rtype: TowTruckData
+        """
+        obj = cls.__new__(cls)
+        (obj.entry_id, obj.carrier_name, obj.carrier_id, obj.carrier_position, obj.in_game_carrier_owner,
+         obj.discord_user, obj.user_roles) = row
+        return obj
+
+    @staticmethod
+    def row_factory(cursor, row):
+        """
+        sqlite3 row factory returning TowTruckData objects, for cursors running SELECT * on the table.
+        """
+        return TowTruckData.from_row(row)
+
     def to_dictionary(self):
         """
         Formats the carrier data into a dictionary for easy access.
@@ -30,7 +55,8 @@ class TowTruckData:
         :rtype: dict
         """
         response = {}
-        for key, value in vars(self).items():
+        for key in self.__slots__:
+            value = getattr(self, key)
             if value is not None:
                 response[key] = value
         return response
@@ -52,4 +78,4 @@ class TowTruckData:
 
         :rtype: bool
         """
-        return any([value for key, value in vars(self).items() if value])
+        return any(getattr(self, key) for key in self.__slots__)
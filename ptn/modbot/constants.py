@@ -21,6 +21,7 @@ DATA_DIR = os.getenv('PTN_MODBOT_DATA_DIR', TESTING_DATA_PATH)
 # database paths
 DB_PATH = os.path.join(DATA_DIR, 'database')  # path to database directory
 INFRACTIONS_DB_PATH = os.path.join(DATA_DIR, 'database', 'infractions.db')  # path to infractions database
+ARCHIVE_DB_PATH = os.path.join(DATA_DIR, 'database', 'infractions_archive.db')  # path to archived infractions
 BACKUP_DB_PATH = os.path.join(DATA_DIR, 'database', 'backups')  # path to use for direct DB backups
 SQL_PATH = os.path.join(DATA_DIR, 'database', 'db_sql')  # path to use for SQL dumps
 
@@ -29,6 +30,35 @@ SQL_PATH = os.path.join(DATA_DIR, 'database', 'db_sql')  # path to use for SQL d
 # load_dotenv(os.path.join(DATA_DIR, '.env'))
 load_dotenv(os.path.join(DATA_DIR, '.env'))
 
+# database tuning
+DB_READ_POOL_SIZE = int(os.getenv('PTN_MODBOT_DB_READERS', 4))  # number of read-only connections for lookups
+DB_MMAP_SIZE = int(os.getenv('PTN_MODBOT_DB_MMAP_SIZE', 64 * 1024 * 1024))  # bytes of the db file readers mmap
+DB_GROUP_COMMIT_WINDOW = float(os.getenv('PTN_MODBOT_DB_COMMIT_WINDOW', 0.003))  # seconds to coalesce writes for
+DB_GROUP_COMMIT_MAX_BATCH = int(os.getenv('PTN_MODBOT_DB_COMMIT_BATCH', 256))  # most writes in one transaction
+DB_STATEMENT_CACHE_SIZE = 256  # prepared statements kept per connection, one per distinct query shape
+DB_INFRACTION_CACHE_SIZE = int(os.getenv('PTN_MODBOT_DB_CACHE_USERS', 512))  # members' infraction lists kept cached
+DB_EXPORT_CHUNK_SIZE = 1000  # rows fetched per round trip when exporting
+DB_BACKUP_INTERVAL_HOURS = float(os.getenv('PTN_MODBOT_DB_BACKUP_HOURS', 24))  # hours between scheduled backups
+DB_BACKUP_RETAIN = int(os.getenv('PTN_MODBOT_DB_BACKUP_RETAIN', 7))  # newest backups kept, older ones are deleted
+DB_BACKUP_PAGES_PER_STEP = 1024  # pages copied per backup step
+DB_BACKUP_STEP_SLEEP = 0.005  # seconds between backup steps, lets the writer in
+DB_BACKUP_MAX_RESTARTS = 5  # restarts caused by writes before a backup falls back to one step
+DB_RESTORE_CHUNK_SIZE = 5000  # statements per transaction when restoring a table from its SQL dump
+DB_ARCHIVE_AFTER_DAYS = int(os.getenv('PTN_MODBOT_DB_ARCHIVE_DAYS', 730))  # infractions older are archived, 0 never
+DB_ARCHIVE_BATCH = 5000  # infractions moved to the archive per transaction
+DB_MAINTENANCE_INTERVAL_HOURS = float(os.getenv('PTN_MODBOT_DB_MAINTENANCE_HOURS', 6))  # least time between runs
+DB_MAINTENANCE_BUDGET = float(os.getenv('PTN_MODBOT_DB_MAINTENANCE_BUDGET', 30))  # seconds a run may take
+DB_MAINTENANCE_QUIET_MINUTES = 10  # how far back to look at command rate when deciding if it's quiet
+DB_MAINTENANCE_QUIET_COMMANDS = 5  # fewer interactions than this in that time counts as quiet
+DB_VACUUM_PAGES_PER_STEP = 512  # pages freed per incremental vacuum step
+DB_STARTUP_VACUUM_MAX_MB = float(os.getenv('PTN_MODBOT_DB_STARTUP_VACUUM_MB', 256))  # largest db vacuumed on startup
+DB_SCHEDULE_CHECK_MINUTES = 10  # how often scheduled database jobs check whether they're due
+THREAD_CRAWL_INTERVAL_HOURS = float(os.getenv('PTN_MODBOT_THREAD_CRAWL_HOURS', 6))  # archived thread crawl interval
+THREAD_CRAWL_CHECKPOINT = 100  # archived threads indexed between crawl checkpoints
+RULES_CACHE_TTL = float(os.getenv('PTN_MODBOT_RULES_CACHE_TTL', 6 * 3600))  # seconds before rules are refetched
+DB_SLOW_QUERY_MS = float(os.getenv('PTN_MODBOT_DB_SLOW_MS', 250))  # database calls slower than this are logged
+DB_STATS_WINDOW = 3600  # seconds of database call timings kept for /db_stats
+
 # define bot token
 TOKEN = os.getenv('MODBOT_DISCORD_TOKEN_PROD') if _production else os.getenv('MODBOT_DISCORD_TOKEN_TESTING')
 
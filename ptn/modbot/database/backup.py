@@ -0,0 +1,226 @@
+"""
+Backups and SQL dumps of the databases used by ModBot.
+
+Depends on: constants, metrics, worker
+"""
+
+# libraries
+import asyncio
+import datetime
+import glob
+import os
+import sqlite3
+import time
+
+# local constants
+import ptn.modbot.constants as constants
+
+# local modules
+from ptn.modbot.database.metrics import instrumented
+from ptn.modbot.database.worker import open_readonly_connection
+
+"""
+BACKUPS
+
+Hot copies of infractions.db into BACKUP_DB_PATH using SQLite's online backup API. The copy runs on its own thread
+from its own read-only connection, a bounded number of pages per step with a pause between steps, so neither the
+event loop nor the writer is held up while it runs.
+"""
+
+
+# database files backed up, and the name each one's backups start with
+backup_sources = {
+    constants.INFRACTIONS_DB_PATH: 'infractions',
+    constants.ARCHIVE_DB_PATH: 'infractions_archive',
+}
+
+
+class BackupAbandoned(Exception):
+    """
+    Raised from the backup progress callback to give up on a stepped backup that keeps being restarted by writes.
+    """
+    pass
+
+
+def _backup_to(source_path, target_path, pages_per_step, step_sleep, max_restarts):
+    # runs on a backup thread, returns the metrics for backup_database
+    stats = {'path': target_path, 'steps': 0, 'restarts': 0, 'pages': 0, 'single_step': False}
+    last_remaining = None
+
+    def progress(status, remaining, total):
+        nonlocal last_remaining
+        stats['steps'] += 1
+        stats['pages'] = total
+        # a write from another connection makes SQLite start the copy over, remaining jumps back up when it does
+        if last_remaining is not None and remaining > last_remaining:
+            stats['restarts'] += 1
+            if stats['restarts'] > max_restarts:
+                raise BackupAbandoned()
+        last_remaining = remaining
+
+    source = open_readonly_connection(source_path)
+    target = sqlite3.connect(target_path)
+    try:
+        try:
+            source.backup(target, pages=pages_per_step, progress=progress, sleep=step_sleep)
+        except BackupAbandoned:
+            # too busy to finish in steps, copy in one step instead. That holds a single WAL read snapshot for the
+            # length of the copy, which still doesn't block the writer
+            stats['single_step'] = True
+            source.backup(target, pages=-1)
+    finally:
+        target.close()
+        source.close()
+    return stats
+
+
+def rotate_backups(retain=None):
+    """
+    Deletes all but the newest retain backups in BACKUP_DB_PATH.
+
+    :param int retain: (Optional) Backups to keep, constants.DB_BACKUP_RETAIN by default
+    :returns: The paths deleted
+    :rtype: list
+    """
+    retain = constants.DB_BACKUP_RETAIN if retain is None else retain
+    expired = []
+    for prefix in backup_sources.values():
+        # names sort by their timestamp, oldest first
+        backups = sorted(glob.glob(os.path.join(constants.BACKUP_DB_PATH, f'{prefix}_[0-9]*.db')))
+        expired += backups[:-retain] if retain > 0 else backups
+    for path in expired:
+        os.remove(path)
+    return expired
+
+
+@instrumented
+async def backup_database(pages_per_step=None, step_sleep=None):
+    """
+    Takes a hot backup of infractions.db, and the archive if there is one, into BACKUP_DB_PATH, then deletes backups
+    past the retention count.
+
+    Each backup is written to a .partial file and only renamed into place once complete, so every .db file in the
+    backup directory is a whole database.
+
+    :param int pages_per_step: (Optional) Pages copied per step, constants.DB_BACKUP_PAGES_PER_STEP by default
+    :param float step_sleep: (Optional) Seconds to pause between steps, constants.DB_BACKUP_STEP_SLEEP by default
+    :returns: Metrics for the infractions.db backup: path, bytes, pages, steps, restarts, single_step and seconds,
+        plus archive (the same metrics for the archive, or None) and rotated
+    :rtype: dict
+    """
+    print("Called backup_database")
+    timestamp = datetime.datetime.now(datetime.timezone.utc).strftime('%Y%m%d_%H%M%S')
+
+    backups = []
+    for source_path, prefix in backup_sources.items():
+        if not os.path.exists(source_path):
+            backups.append(None)
+            continue
+        backup_path = os.path.join(constants.BACKUP_DB_PATH, f'{prefix}_{timestamp}.db')
+        partial_path = backup_path + '.partial'
+
+        start = time.perf_counter()
+        try:
+            stats = await asyncio.to_thread(
+                _backup_to, source_path, partial_path,
+                pages_per_step or constants.DB_BACKUP_PAGES_PER_STEP,
+                constants.DB_BACKUP_STEP_SLEEP if step_sleep is None else step_sleep,
+                constants.DB_BACKUP_MAX_RESTARTS
+            )
+            os.replace(partial_path, backup_path)
+        except Exception:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            raise
+
+        stats['path'] = backup_path
+        stats['seconds'] = round(time.perf_counter() - start, 3)
+        stats['bytes'] = os.path.getsize(backup_path)
+        print(f"Backed up database to {backup_path}: {stats['bytes']} bytes, {stats['pages']} pages in "
+              f"{stats['steps']} steps ({stats['restarts']} restarts) in {stats['seconds']}s")
+        backups.append(stats)
+
+    stats = backups[0]
+    stats['archive'] = backups[1]
+    stats['rotated'] = rotate_backups()
+    return stats
+
+
+"""
+SQL DUMPS
+
+Per-table SQL dumps into SQL_PATH, in the same form as sqlite3's iterdump (CREATE TABLE followed by one INSERT per
+row), for create_missing_table to rebuild a lost table from. Indexes, triggers and the search and count tables
+aren't dumped: after any restore build_database_on_startup resets user_version and re-applies every migration, which
+recreates them and reseeds the derived tables, whether the whole file was lost or just the one table.
+"""
+
+
+# tables dumped by dump_database, each to db_sql/{table}_dump.sql
+dump_tables = ['infractions', 'tow_truck', 'tow_truck_role_snapshot']
+
+
+def _write_table_dump(cursor, table, dump_file):
+    # one INSERT per row, quoted by SQLite the same way iterdump does it
+    cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,))
+    dump_file.write(f'{cursor.fetchone()[0]};\n')
+
+    table_info = cursor.execute(f'PRAGMA table_info("{table}")').fetchall()
+    columns = [row[1] for row in table_info]
+    values = " || ',' || ".join(f'quote("{column}")' for column in columns)
+    # primary key order, WITHOUT ROWID tables have no rowid to go by
+    order = ', '.join(f'"{row[1]}"' for row in sorted(table_info, key=lambda row: row[5]) if row[5]) or 'rowid'
+    cursor.execute(f"""SELECT 'INSERT INTO "{table}" VALUES(' || {values} || ');' FROM "{table}" ORDER BY {order}""")
+    rows = 0
+    while True:
+        chunk = cursor.fetchmany(constants.DB_EXPORT_CHUNK_SIZE)
+        if not chunk:
+            return rows
+        dump_file.writelines(f'{row[0]}\n' for row in chunk)
+        rows += len(chunk)
+
+
+def _dump_tables(tables):
+    # runs on a dump thread, every table is read from the same snapshot
+    conn = open_readonly_connection(constants.INFRACTIONS_DB_PATH)
+    conn.isolation_level = None
+    counts = {}
+    try:
+        cursor = conn.cursor()
+        cursor.execute('BEGIN')
+        for table in tables:
+            dump_path = os.path.join(constants.SQL_PATH, f'{table}_dump.sql')
+            partial_path = dump_path + '.partial'
+            try:
+                with open(partial_path, 'w', encoding='utf-8') as dump_file:
+                    dump_file.write('BEGIN TRANSACTION;\n')
+                    counts[table] = _write_table_dump(cursor, table, dump_file)
+                    dump_file.write('COMMIT;\n')
+                os.replace(partial_path, dump_path)
+            except Exception:
+                if os.path.exists(partial_path):
+                    os.remove(partial_path)
+                raise
+        cursor.execute('COMMIT')
+    finally:
+        conn.close()
+    return counts
+
+
+@instrumented
+async def dump_database(tables=None):
+    """
+    Writes a SQL dump of each table into SQL_PATH, streamed off the event loop from a read-only connection.
+
+    Each dump is written to a .partial file and renamed into place once complete, so an interrupted dump never
+    replaces the last good one.
+
+    :param list tables: (Optional) Tables to dump, dump_tables by default
+    :returns: The number of rows dumped per table
+    :rtype: dict
+    """
+    print("Called dump_database")
+    start = time.perf_counter()
+    counts = await asyncio.to_thread(_dump_tables, tables or dump_tables)
+    print(f"Dumped {counts} rows to {constants.SQL_PATH} in {time.perf_counter() - start:.1f}s")
+    return counts
@@ -0,0 +1,197 @@
+"""
+In-memory caches in front of ptn.modbot.database.database.
+
+The same member's infractions tend to be read several times in a row (View Infractions, /warn, the Edit/Remove
+Infraction menus, /sync_infractions), so their list is kept in a small LRU cache in front of find_infraction. Every
+write that touches a member's infractions invalidates that member once it has committed.
+
+The tow lot is small and read far more often than it changes, so the whole tow_truck table is mirrored in memory and
+kept current write-through.
+
+Depends on: TowTruckData
+"""
+
+# libraries
+import collections
+
+# local classes
+from ptn.modbot.classes.TowTruckData import TowTruckData
+
+
+class InfractionCache:
+    """
+    A bounded LRU cache of per-user infraction lists, with hit/miss counters.
+
+    A read that started before an invalidation may come back with stale rows, so put() takes the generation seen
+    before the read and drops the result if anything was invalidated in the meantime.
+    """
+
+    def __init__(self, max_users):
+        self.max_users = max_users
+        self._entries = collections.OrderedDict()
+        self.generation = 0  # bumped on every invalidation
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, warned_user):
+        """
+        Returns a copy of the user's cached infractions, or None if they aren't cached.
+        """
+        infractions = self._entries.get(warned_user)
+        if infractions is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(warned_user)
+        self.hits += 1
+        return list(infractions)
+
+    def put(self, warned_user, infractions, generation):
+        if generation != self.generation or self.max_users <= 0:
+            return  # something was written while we were reading
+        self._entries[warned_user] = list(infractions)
+        self._entries.move_to_end(warned_user)
+        while len(self._entries) > self.max_users:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, *warned_users):
+        self.generation += 1
+        for warned_user in warned_users:
+            if warned_user is not None:
+                self._entries.pop(warned_user, None)
+                self.invalidations += 1
+
+    def clear(self):
+        self.generation += 1
+        self._entries.clear()
+
+    def stats(self):
+        """
+        :returns: The cache's size and counters
+        :rtype: dict
+        """
+        lookups = self.hits + self.misses
+        return {
+            'users': len(self._entries),
+            'max_users': self.max_users,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'invalidations': self.invalidations,
+        }
+
+
+class CarrierMirror:
+    """
+    The whole tow_truck table held in memory, indexed by carrier_id, discord_user and carrier_position.
+
+    Loaded once on startup and kept current write-through by the carrier write functions once their writes commit, so
+    tow lot reads never touch SQLite. The TowTruckData objects handed out are shared: an edit replaces a carrier's
+    object rather than changing it, so don't modify them.
+    """
+
+    # columns compared as integers, as SQLite's INTEGER affinity would
+    integer_columns = ('entry_id', 'discord_user')
+
+    def __init__(self):
+        self._carriers = {}  # entry_id: TowTruckData
+        self._by_carrier_id = {}  # carrier_id: entry_id, carrier IDs are unique
+        self._by_discord_user = collections.defaultdict(set)  # discord_user: {entry_id}
+        self._by_position = collections.defaultdict(set)  # carrier_position: {entry_id}
+
+    def load(self, conn):
+        """
+        Replaces the mirror's contents with the table as it is now.
+
+        :param sqlite3.Connection conn: The writer connection, outside any transaction
+        """
+        self.clear()
+        for row in conn.execute("SELECT * FROM tow_truck ORDER BY entry_id"):
+            self.put(TowTruckData.from_row(tuple(row)))
+        print(f'Loaded {len(self._carriers)} carriers into memory')
+
+    def clear(self):
+        self._carriers.clear()
+        self._by_carrier_id.clear()
+        self._by_discord_user.clear()
+        self._by_position.clear()
+
+    def put(self, *carriers):
+        for carrier in carriers:
+            self.remove(carrier.entry_id)
+            self._carriers[carrier.entry_id] = carrier
+            self._by_carrier_id[carrier.carrier_id] = carrier.entry_id
+            self._by_discord_user[carrier.discord_user].add(carrier.entry_id)
+            self._by_position[carrier.carrier_position].add(carrier.entry_id)
+
+    def remove(self, *entry_ids):
+        for entry_id in entry_ids:
+            carrier = self._carriers.pop(entry_id, None)
+            if carrier is None:
+                continue
+            self._by_carrier_id.pop(carrier.carrier_id, None)
+            for index, key in ((self._by_discord_user, carrier.discord_user),
+                               (self._by_position, carrier.carrier_position)):
+                index[key].discard(entry_id)
+                if not index[key]:
+                    del index[key]
+
+    def all(self):
+        """
+        :returns: Every carrier, in entry_id order
+        :rtype: list
+        """
+        return [self._carriers[entry_id] for entry_id in sorted(self._carriers)]
+
+    def find(self, equals=None, contains=None):
+        """
+        Finds carriers the way query_carriers does: equals are exact matches, contains case-insensitive substrings.
+        Columns are tow_truck column names, which are also the TowTruckData attribute names.
+
+        :param dict equals: column: value the column must equal
+        :param dict contains: column: text the column must contain
+        :returns: Matching carriers, in entry_id order
+        :rtype: list
+        """
+        equals = dict(equals or {})
+        contains = dict(contains or {})
+        for column in self.integer_columns:
+            if column in equals:
+                try:
+                    equals[column] = int(equals[column])
+                except (TypeError, ValueError):
+                    return []
+
+        # narrow down with an index before checking the rest
+        if 'entry_id' in equals:
+            candidates = {equals['entry_id']}
+        elif 'carrier_id' in equals:
+            entry_id = self._by_carrier_id.get(equals['carrier_id'])
+            candidates = {entry_id} if entry_id is not None else set()
+        elif 'discord_user' in equals:
+            candidates = self._by_discord_user.get(equals['discord_user'], set())
+        elif 'carrier_position' in equals:
+            candidates = self._by_position.get(equals['carrier_position'], set())
+        elif 'carrier_position' in contains:
+            # only a handful of distinct positions to check
+            text = str(contains['carrier_position']).lower()
+            candidates = set().union(*(entry_ids for position, entry_ids in self._by_position.items()
+                                       if text in str(position).lower()))
+        else:
+            candidates = self._carriers.keys()
+
+        found = []
+        for entry_id in sorted(candidates):
+            carrier = self._carriers.get(entry_id)
+            if carrier is None:
+                continue
+            if any(getattr(carrier, column) != value for column, value in equals.items()):
+                continue
+            if any(getattr(carrier, column) is None or str(text).lower() not in str(getattr(carrier, column)).lower()
+                   for column, text in contains.items()):
+                continue
+            found.append(carrier)
+        return found
+
+    def __len__(self):
+        return len(self._carriers)
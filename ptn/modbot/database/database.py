@@ -1,7 +1,7 @@
 """
 Functions relating to databases used by ModBot.
 
-Depends on: constants
+Depends on: constants, backup, cache, metrics, worker
 
 Error handling: errors originating from Discord commands should be handled in their respective Cogs and outputted to user
                 errors occuring on startup functions should be handled within those functions and outputted to terminal
@@ -9,9 +9,18 @@ Error handling: errors originating from Discord commands should be handled in th
 
 # libraries
 import asyncio
+import contextlib
+import contextvars
+import csv
 import enum
+import functools
+import gzip
+import io
+import json
 import sqlite3
 import os
+import tempfile
+import time
 
 # local classes
 from ptn.modbot.classes.InfractionData import InfractionData
@@ -21,6 +30,13 @@ import ptn.modbot.constants as constants
 from ptn.modbot.bot import bot
 from ptn.modbot.classes.TowTruckData import TowTruckData
 
+# local modules
+from ptn.modbot.database.backup import backup_database, dump_database  # noqa: F401, part of the database API
+from ptn.modbot.database.cache import CarrierMirror, InfractionCache
+from ptn.modbot.database.metrics import CallStats, db_metrics, instrumented, timed_job
+from ptn.modbot.database.worker import DatabaseReaderPool, DatabaseTransaction, DatabaseWorker, after_commit, \
+    open_readonly_connection
+
 """
 STARTUP FUNCTIONS
 """
@@ -52,16 +68,42 @@ def build_database_on_startup():
         #       create (str): sql create statement for table
         database_table_map = {
             'infractions': {'obj': infraction_db, 'create': infractions_table_create},
-            'tow_truck': {'obj': infraction_db, 'create': tow_truck_table_create}
+            'tow_truck': {'obj': infraction_db, 'create': tow_truck_table_create},
+            'tow_truck_role_snapshot': {'obj': infraction_db, 'create': tow_truck_role_snapshot_table_create}
         }
 
         # check database exists, create from scratch if needed
+        recreated = False
         for table_name in database_table_map:
             t = database_table_map[table_name]
             if not check_database_table_exists(table_name, t['obj']):
                 create_missing_table(table_name, t['obj'], t['create'])
+                recreated = True
             else:
                 print(f'{table_name} table exists, do nothing')
+
+        # old infractions live in a database of their own, attached to the main one before migrating so migrations
+        # that seed from infractions can count archived ones too
+        attach_archive(infraction_conn)
+
+        if recreated:
+            # a recreated table comes back without its indexes and triggers, and the tables derived from it are
+            # stale. Every migration step is idempotent, so start them all over rather than only the ones the
+            # file hasn't had yet
+            print('Table recreated - re-applying all schema migrations')
+            infraction_conn.execute('PRAGMA user_version = 0')
+
+        # bring the schema up to date (indexes etc.) once all tables exist
+        run_database_migrations(infraction_conn)
+
+        # new entry IDs start above every ID ever used, archived ones included
+        bump_entry_id_sequence(infraction_conn.cursor())
+
+        # space freed by deletes is handed back by the maintenance job's incremental vacuum
+        enable_incremental_vacuum(infraction_conn)
+
+        # tow lot reads are served from memory
+        carrier_mirror.load(infraction_conn)
     except Exception as e:
         print(f"Error building database: {e}")
 
@@ -69,7 +111,7 @@ def build_database_on_startup():
 # defining infraction table for database creation
 infractions_table_create = '''
     CREATE TABLE infractions(
-        entry_id INTEGER NOT NULL PRIMARY KEY,
+        entry_id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
         warned_user INTEGER NOT NULL,
         warning_moderator INTEGER NOT NULL,
         warning_time INTEGER NOT NULL,
@@ -91,6 +133,17 @@ tow_truck_table_create = '''
     )   
 '''
 
+# the roles a towed member had before they were swapped for the tow truck role, one row per role, kept once per
+# member however many of their carriers are in the lot. position keeps the order the roles were listed in.
+tow_truck_role_snapshot_table_create = '''
+    CREATE TABLE tow_truck_role_snapshot(
+        discord_user INTEGER NOT NULL,
+        role_id INTEGER NOT NULL,
+        position INTEGER NOT NULL,
+        PRIMARY KEY(discord_user, role_id)
+    ) WITHOUT ROWID
+'''
+
 
 # enumerate infraction database columns
 class InfractionDbFields(enum.Enum):
@@ -116,6 +169,11 @@ class CarrierDbFields(enum.Enum):
 # list of infractions table columns
 infractions_table_columns = [member.value for member in InfractionDbFields]
 
+# free text columns, searched by substring rather than exact match
+infraction_text_columns = [InfractionDbFields.warning_reason.value]
+carrier_text_columns = [CarrierDbFields.carrier_name.value, CarrierDbFields.carrier_position.value,
+                        CarrierDbFields.in_game_carrier_owner.value, CarrierDbFields.user_roles.value]
+
 
 # function to check if a given table exists in a given database
 def check_database_table_exists(table_name, database):
@@ -129,7 +187,7 @@ def check_database_table_exists(table_name, database):
     """
     print(f'Starting up - checking if {table_name} table exists or not')
 
-    database.execute(f"SELECT count(name) FROM sqlite_master WHERE TYPE = 'table' AND name = '{table_name}'")
+    database.execute("SELECT count(name) FROM sqlite_master WHERE TYPE = 'table' AND name = ?", (table_name,))
     return bool(database.fetchone()[0])
 
 
@@ -137,14 +195,12 @@ def check_database_table_exists(table_name, database):
 def create_missing_table(table, db_obj, create_stmt):
     print(f'{table} table missing - creating it now')
 
-    if os.path.exists(os.path.join(os.getcwd(), 'db_sql', f'{table}_dump.sql')):
+    dump_path = os.path.join(constants.SQL_PATH, f'{table}_dump.sql')
+    if os.path.exists(dump_path):
 
         # recreate from backup file
         print('Recreating database from backup ...')
-        with open(os.path.join(os.getcwd(), 'db_sql', f'{table}_dump.sql')) as f:
-
-            sql_script = f.read()
-            db_obj.executescript(sql_script)
+        restore_table_from_dump(table, db_obj, dump_path)
 
     else:
         # Create a new version
@@ -153,20 +209,1256 @@ def create_missing_table(table, db_obj, create_stmt):
         db_obj.execute(create_stmt)
 
 
+# stream a table's SQL dump back into the database
+def restore_table_from_dump(table, db_obj, dump_path, chunk_size=None):
+    """
+    Replays a SQL dump a statement at a time, committing every chunk_size statements.
+
+    The file is streamed rather than read whole, so memory stays bounded however large the dump is. Transaction
+    statements in the dump are skipped in favour of the chunked commits. If the restore fails the partly restored
+    table is dropped again so the next startup retries from the dump.
+
+    :param str table: The table being restored
+    :param sqlite.Connection.cursor db_obj: Cursor on an autocommit connection to restore into
+    :param str dump_path: Path to the dump
+    :param int chunk_size: (Optional) Statements per transaction, constants.DB_RESTORE_CHUNK_SIZE by default
+    """
+    chunk_size = chunk_size or constants.DB_RESTORE_CHUNK_SIZE
+    total_bytes = os.path.getsize(dump_path) or 1
+    statements = 0
+    statement = ''
+    start = time.perf_counter()
+
+    db_obj.execute('BEGIN')
+    try:
+        with open(dump_path, encoding='utf-8') as f:
+            for line in f:
+                statement += line
+                # text values can hold newlines, only a complete statement ends at the end of a line
+                if not sqlite3.complete_statement(statement):
+                    continue
+                if statement.strip().upper() not in ('BEGIN TRANSACTION;', 'BEGIN;', 'COMMIT;'):
+                    db_obj.execute(statement)
+                    statements += 1
+                    if statements % chunk_size == 0:
+                        db_obj.execute('COMMIT')
+                        print(f'Restoring {table}: {statements} statements, '
+                              f'{f.buffer.tell() * 100 // total_bytes}% of {dump_path}')
+                        db_obj.execute('BEGIN')
+                statement = ''
+        db_obj.execute('COMMIT')
+    except Exception:
+        db_obj.execute('ROLLBACK')
+        db_obj.execute(f'DROP TABLE IF EXISTS "{table}"')
+        raise
+
+    print(f'Restored {table} from {dump_path}: {statements} statements in {time.perf_counter() - start:.1f}s')
+
+
+"""
+SCHEMA MIGRATIONS
+
+PRAGMA user_version records the last migration applied to the database file. On startup every migration with a
+higher version is applied in order, each in its own transaction together with the user_version bump.
+"""
+
+def _month_stats_add(row):
+    # trigger body counting an infractions row ('new' or 'old') into the monthly moderator and rule statistics
+    month = f"strftime('%Y-%m', {row}.warning_time, 'unixepoch')"
+    return f"""
+        INSERT INTO moderator_month_stats(warning_moderator, month, infraction_count)
+        VALUES ({row}.warning_moderator, {month}, 1)
+        ON CONFLICT(warning_moderator, month) DO UPDATE SET infraction_count = infraction_count + 1;
+        INSERT INTO rule_month_stats(rule_broken, month, infraction_count)
+        VALUES (ifnull({row}.rule_broken, 0), {month}, 1)
+        ON CONFLICT(rule_broken, month) DO UPDATE SET infraction_count = infraction_count + 1;"""
+
+
+def _month_stats_remove(row):
+    # trigger body counting an infractions row back out of the monthly statistics
+    month = f"strftime('%Y-%m', {row}.warning_time, 'unixepoch')"
+    return f"""
+        UPDATE moderator_month_stats SET infraction_count = infraction_count - 1
+        WHERE warning_moderator = {row}.warning_moderator AND month = {month};
+        DELETE FROM moderator_month_stats
+        WHERE warning_moderator = {row}.warning_moderator AND month = {month} AND infraction_count <= 0;
+        UPDATE rule_month_stats SET infraction_count = infraction_count - 1
+        WHERE rule_broken = ifnull({row}.rule_broken, 0) AND month = {month};
+        DELETE FROM rule_month_stats
+        WHERE rule_broken = ifnull({row}.rule_broken, 0) AND month = {month} AND infraction_count <= 0;"""
+
+
+def _has_archive(cursor):
+    # whether the archive is attached to the cursor's connection yet
+    return any(row[1] == 'archive' for row in cursor.execute('PRAGMA database_list').fetchall())
+
+
+def reseed_infraction_counts(cursor):
+    """
+    Rebuilds infraction_counts from every infraction, archived ones included.
+
+    :param sqlite3.Cursor cursor: A cursor on the writer connection, inside a transaction
+    """
+    source = 'main.infractions'
+    if _has_archive(cursor):
+        source = '(SELECT warned_user FROM main.infractions UNION ALL SELECT warned_user FROM archive.infractions)'
+    # from scratch so re-running can't double count
+    cursor.execute('DELETE FROM infraction_counts')
+    cursor.execute(f"""INSERT INTO infraction_counts(warned_user, infraction_count)
+                   SELECT warned_user, count(*) FROM {source} GROUP BY warned_user""")
+
+
+def backfill_month_stats(cursor):
+    """
+    Rebuilds moderator_month_stats and rule_month_stats from every infraction, archived ones included.
+
+    :param sqlite3.Cursor cursor: A cursor on the writer connection, inside a transaction
+    """
+    columns = 'warning_moderator, rule_broken, warning_time'
+    source = 'main.infractions'
+    if _has_archive(cursor):
+        source = f'(SELECT {columns} FROM main.infractions UNION ALL SELECT {columns} FROM archive.infractions)'
+    month = "strftime('%Y-%m', warning_time, 'unixepoch')"
+    # from scratch so re-running can't double count
+    cursor.execute('DELETE FROM moderator_month_stats')
+    cursor.execute('DELETE FROM rule_month_stats')
+    cursor.execute(f"""INSERT INTO moderator_month_stats(warning_moderator, month, infraction_count)
+                   SELECT warning_moderator, {month}, count(*) FROM {source} GROUP BY 1, 2""")
+    cursor.execute(f"""INSERT INTO rule_month_stats(rule_broken, month, infraction_count)
+                   SELECT ifnull(rule_broken, 0), {month}, count(*) FROM {source} GROUP BY 1, 2""")
+
+
+def _role_ids(user_roles):
+    # role IDs from a comma joined string, as tow_truck.user_roles stored them, or any iterable of IDs
+    if isinstance(user_roles, str):
+        user_roles = user_roles.split(',')
+    return [int(role_id) for role_id in user_roles if str(role_id).strip()]
+
+
+def migrate_user_roles_to_snapshots(cursor):
+    """
+    Moves the comma joined tow_truck.user_roles strings into tow_truck_role_snapshot, then clears them.
+
+    A member towed more than once has a copy on every carrier, only the first of which holds their real roles - the
+    later ones were taken after they'd been given the tow truck role. The copy with the most roles is kept.
+
+    :param sqlite3.Cursor cursor: A cursor on the writer connection, inside a transaction
+    """
+    snapshots = {}
+    cursor.execute("SELECT discord_user, user_roles FROM tow_truck "
+                   "WHERE discord_user IS NOT NULL AND user_roles IS NOT NULL AND user_roles != ''")
+    for discord_user, user_roles in cursor.fetchall():
+        role_ids = _role_ids(user_roles)
+        if len(role_ids) > len(snapshots.get(discord_user, ())):
+            snapshots[discord_user] = role_ids
+    # OR IGNORE: a snapshot restored from a dump wins over one rebuilt here
+    cursor.executemany(
+        "INSERT OR IGNORE INTO tow_truck_role_snapshot(discord_user, role_id, position) VALUES (?, ?, ?)",
+        ((discord_user, role_id, position)
+         for discord_user, role_ids in snapshots.items() for position, role_id in enumerate(role_ids))
+    )
+    cursor.execute("UPDATE tow_truck SET user_roles = NULL WHERE user_roles IS NOT NULL")
+    print(f'Moved role snapshots for {len(snapshots)} members into tow_truck_role_snapshot')
+
+
+def bump_entry_id_sequence(cursor):
+    """
+    Raises the infractions AUTOINCREMENT counter above every entry ID in the hot table and the archive, so an archived
+    infraction's ID is never handed out again. Needed after a restore, which only counts the rows it put back.
+
+    :param sqlite3.Cursor cursor: A cursor on the writer connection
+    """
+    highest = cursor.execute("SELECT ifnull(max(entry_id), 0) FROM main.infractions").fetchone()[0]
+    if _has_archive(cursor):
+        highest = max(highest, cursor.execute("SELECT ifnull(max(entry_id), 0) FROM archive.infractions").fetchone()[0])
+    cursor.execute("UPDATE main.sqlite_sequence SET seq = ? WHERE name = 'infractions' AND seq < ?", (highest, highest))
+    if not cursor.execute("SELECT 1 FROM main.sqlite_sequence WHERE name = 'infractions'").fetchone():
+        cursor.execute("INSERT INTO main.sqlite_sequence(name, seq) VALUES ('infractions', ?)", (highest,))
+
+
+def make_entry_ids_monotonic(cursor):
+    """
+    Rebuilds the infractions table with AUTOINCREMENT, if it doesn't have it, so entry IDs only ever go up. Without
+    it SQLite hands out the highest ID in the table plus one, reusing IDs once the newest infraction is deleted or
+    archived.
+
+    :param sqlite3.Cursor cursor: A cursor on the writer connection, inside a transaction
+    """
+    cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'infractions'")
+    if 'AUTOINCREMENT' not in cursor.fetchone()[0].upper():
+        # the triggers go with the old table, drop them first so copying the rows over doesn't fire them
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'infractions'")
+        for (trigger,) in cursor.fetchall():
+            cursor.execute(f'DROP TRIGGER "{trigger}"')
+        cursor.execute(infractions_table_create.replace('CREATE TABLE infractions(',
+                                                        'CREATE TABLE infractions_rebuild('))
+        cursor.execute("INSERT INTO infractions_rebuild SELECT * FROM infractions")
+        cursor.execute("DROP TABLE infractions")
+        cursor.execute("ALTER TABLE infractions_rebuild RENAME TO infractions")
+
+        # entry IDs are unchanged, so the search, count and statistics tables still hold; only the indexes and
+        # triggers need putting back
+        for migration in database_migrations:
+            if migration['version'] < 8:
+                _apply_migration_steps(cursor, migration['steps'])
+        # migration 3's seed only counted the hot table
+        reseed_infraction_counts(cursor)
+    bump_entry_id_sequence(cursor)
+
+
+# Add an entry to the end of this list when the schema needs to change - never edit or reorder a shipped entry
+# Requires:
+#   version (int): one higher than the previous entry
+#   description (str): printed when the migration is applied
+#   steps (list): sql strings, or callables taking a cursor for anything sql alone can't express
+# Steps must be idempotent (IF NOT EXISTS etc.) so a database restored from a dump can safely re-run them.
+database_migrations = [
+    {
+        'version': 1,
+        'description': 'index infractions and tow_truck lookup columns',
+        'steps': [
+            # find_infraction(member.id, 'warned_user'), ordered by time
+            'CREATE INDEX IF NOT EXISTS infractions_warned_user_time ON infractions(warned_user, warning_time)',
+            # lookups by moderator
+            'CREATE INDEX IF NOT EXISTS infractions_warning_moderator ON infractions(warning_moderator)',
+            # find_carrier(member.id, 'discord_user')
+            'CREATE INDEX IF NOT EXISTS tow_truck_discord_user ON tow_truck(discord_user)',
+        ]
+    },
+    {
+        'version': 2,
+        'description': 'full text index over infraction warning reasons',
+        'steps': [
+            # external content table: the text lives in infractions, the index only stores tokens
+            """CREATE VIRTUAL TABLE IF NOT EXISTS infractions_fts USING fts5(
+                warning_reason, content='infractions', content_rowid='entry_id'
+            )""",
+            """CREATE TRIGGER IF NOT EXISTS infractions_fts_insert AFTER INSERT ON infractions BEGIN
+                INSERT INTO infractions_fts(rowid, warning_reason) VALUES (new.entry_id, new.warning_reason);
+            END""",
+            """CREATE TRIGGER IF NOT EXISTS infractions_fts_delete AFTER DELETE ON infractions BEGIN
+                INSERT INTO infractions_fts(infractions_fts, rowid, warning_reason)
+                VALUES ('delete', old.entry_id, old.warning_reason);
+            END""",
+            """CREATE TRIGGER IF NOT EXISTS infractions_fts_update AFTER UPDATE OF warning_reason ON infractions BEGIN
+                INSERT INTO infractions_fts(infractions_fts, rowid, warning_reason)
+                VALUES ('delete', old.entry_id, old.warning_reason);
+                INSERT INTO infractions_fts(rowid, warning_reason) VALUES (new.entry_id, new.warning_reason);
+            END""",
+            # index everything already in the table
+            "INSERT INTO infractions_fts(infractions_fts) VALUES ('rebuild')",
+        ]
+    },
+    {
+        'version': 3,
+        'description': 'per user infraction counts',
+        'steps': [
+            """CREATE TABLE IF NOT EXISTS infraction_counts(
+                warned_user INTEGER NOT NULL PRIMARY KEY,
+                infraction_count INTEGER NOT NULL
+            )""",
+            """CREATE TRIGGER IF NOT EXISTS infraction_counts_insert AFTER INSERT ON infractions BEGIN
+                INSERT INTO infraction_counts(warned_user, infraction_count) VALUES (new.warned_user, 1)
+                ON CONFLICT(warned_user) DO UPDATE SET infraction_count = infraction_count + 1;
+            END""",
+            """CREATE TRIGGER IF NOT EXISTS infraction_counts_delete AFTER DELETE ON infractions BEGIN
+                UPDATE infraction_counts SET infraction_count = infraction_count - 1
+                WHERE warned_user = old.warned_user;
+                DELETE FROM infraction_counts WHERE warned_user = old.warned_user AND infraction_count <= 0;
+            END""",
+            """CREATE TRIGGER IF NOT EXISTS infraction_counts_update AFTER UPDATE OF warned_user ON infractions
+            WHEN old.warned_user IS NOT new.warned_user BEGIN
+                UPDATE infraction_counts SET infraction_count = infraction_count - 1
+                WHERE warned_user = old.warned_user;
+                DELETE FROM infraction_counts WHERE warned_user = old.warned_user AND infraction_count <= 0;
+                INSERT INTO infraction_counts(warned_user, infraction_count) VALUES (new.warned_user, 1)
+                ON CONFLICT(warned_user) DO UPDATE SET infraction_count = infraction_count + 1;
+            END""",
+            # seed from scratch so re-running the step can't double count
+            "DELETE FROM infraction_counts",
+            """INSERT INTO infraction_counts(warned_user, infraction_count)
+            SELECT warned_user, count(*) FROM infractions GROUP BY warned_user""",
+        ]
+    },
+    {
+        'version': 4,
+        'description': 'time ordered indexes for browsing infractions',
+        'steps': [
+            # browse_infractions pages by (warning_time, entry_id), entry_id is the rowid so every index carries it
+            'CREATE INDEX IF NOT EXISTS infractions_warning_time ON infractions(warning_time)',
+            'CREATE INDEX IF NOT EXISTS infractions_moderator_time ON infractions(warning_moderator, warning_time)',
+            'CREATE INDEX IF NOT EXISTS infractions_rule_time ON infractions(rule_broken, warning_time)',
+            # covered by infractions_moderator_time
+            'DROP INDEX IF EXISTS infractions_warning_moderator',
+        ]
+    },
+    {
+        'version': 5,
+        'description': 'monthly infraction statistics per moderator and per rule',
+        'steps': [
+            # month is YYYY-MM in UTC, rule_broken is 0 for infractions without one
+            """CREATE TABLE IF NOT EXISTS moderator_month_stats(
+                warning_moderator INTEGER NOT NULL,
+                month TEXT NOT NULL,
+                infraction_count INTEGER NOT NULL,
+                PRIMARY KEY(warning_moderator, month)
+            ) WITHOUT ROWID""",
+            """CREATE TABLE IF NOT EXISTS rule_month_stats(
+                rule_broken INTEGER NOT NULL,
+                month TEXT NOT NULL,
+                infraction_count INTEGER NOT NULL,
+                PRIMARY KEY(rule_broken, month)
+            ) WITHOUT ROWID""",
+            # /mod_stats reads a range of months across every moderator or rule
+            'CREATE INDEX IF NOT EXISTS moderator_month_stats_month ON moderator_month_stats(month)',
+            'CREATE INDEX IF NOT EXISTS rule_month_stats_month ON rule_month_stats(month)',
+            f"""CREATE TRIGGER IF NOT EXISTS month_stats_insert AFTER INSERT ON infractions BEGIN
+                {_month_stats_add('new')}
+            END""",
+            f"""CREATE TRIGGER IF NOT EXISTS month_stats_delete AFTER DELETE ON infractions BEGIN
+                {_month_stats_remove('old')}
+            END""",
+            f"""CREATE TRIGGER IF NOT EXISTS month_stats_update
+            AFTER UPDATE OF warning_moderator, rule_broken, warning_time ON infractions
+            WHEN old.warning_moderator IS NOT new.warning_moderator OR old.rule_broken IS NOT new.rule_broken
+                OR old.warning_time IS NOT new.warning_time BEGIN
+                {_month_stats_remove('old')}
+                {_month_stats_add('new')}
+            END""",
+            backfill_month_stats,
+        ]
+    },
+    {
+        'version': 6,
+        'description': 'role snapshots for towed members in their own table',
+        'steps': [
+            # "which towed members held role X"
+            'CREATE INDEX IF NOT EXISTS tow_truck_role_snapshot_role_id ON tow_truck_role_snapshot(role_id)',
+            # releasing a member's last carrier hands their roles back, the snapshot goes with it
+            """CREATE TRIGGER IF NOT EXISTS tow_truck_role_snapshot_release AFTER DELETE ON tow_truck
+            WHEN old.discord_user IS NOT NULL
+                AND NOT EXISTS (SELECT 1 FROM tow_truck WHERE discord_user = old.discord_user) BEGIN
+                DELETE FROM tow_truck_role_snapshot WHERE discord_user = old.discord_user;
+            END""",
+            migrate_user_roles_to_snapshots,
+        ]
+    },
+    {
+        'version': 7,
+        'description': 'persistent forum thread index and archived thread crawl checkpoints',
+        'steps': [
+            # rebuilt by the thread crawl if lost, so not dumped
+            """CREATE TABLE IF NOT EXISTS forum_threads(
+                discord_user INTEGER NOT NULL PRIMARY KEY,
+                thread_id INTEGER NOT NULL
+            )""",
+            'CREATE INDEX IF NOT EXISTS forum_threads_thread_id ON forum_threads(thread_id)',
+            # archive times are POSIX seconds. resume_before is where an unfinished crawl picks up, high_water the
+            # newest archive time the last finished crawl saw and pending_high_water the one the current crawl will
+            # record when it finishes
+            """CREATE TABLE IF NOT EXISTS thread_crawl_state(
+                forum_id INTEGER NOT NULL PRIMARY KEY,
+                resume_before REAL,
+                pending_high_water REAL,
+                high_water REAL
+            )""",
+        ]
+    },
+    {
+        'version': 8,
+        'description': 'entry IDs are never reused',
+        'steps': [
+            make_entry_ids_monotonic,
+        ]
+    },
+    {
+        'version': 9,
+        'description': 'infraction counts include archived infractions',
+        'steps': [
+            # migration 3 seeds from the hot table only, a rebuilt main database would lose the archived counts
+            reseed_infraction_counts,
+        ]
+    },
+    {
+        'version': 10,
+        'description': 'last run times of scheduled jobs',
+        'steps': [
+            """CREATE TABLE IF NOT EXISTS scheduled_runs(
+                job TEXT NOT NULL PRIMARY KEY,
+                last_run REAL NOT NULL
+            )""",
+        ]
+    },
+]
+
+
+def get_database_version(conn):
+    """
+    Returns the schema version recorded in the database file.
+
+    :param sqlite3.Connection conn: The database connection
+    :rtype: int
+    """
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def _apply_migration_steps(cursor, steps):
+    for step in steps:
+        if callable(step):
+            step(cursor)
+        else:
+            cursor.execute(step)
+
+
+def run_database_migrations(conn, migrations=None):
+    """
+    Applies every migration newer than the database's user_version.
+
+    Each migration runs in a single transaction, so a failure leaves the database at the previous version.
+
+    :param sqlite3.Connection conn: The database connection
+    :param list migrations: Migrations to apply, defaults to database_migrations
+    :returns: The schema version after migrating
+    :rtype: int
+    """
+    migrations = database_migrations if migrations is None else migrations
+    current_version = get_database_version(conn)
+    print(f'Database schema is at version {current_version}')
+
+    for migration in migrations:
+        version = migration['version']
+        if version <= current_version:
+            continue
+
+        print(f"Applying migration {version}: {migration['description']}")
+        cursor = conn.cursor()
+        try:
+            cursor.execute('BEGIN')
+            _apply_migration_steps(cursor, migration['steps'])
+            # user_version can't take a bound parameter, version is always an int from the list above
+            cursor.execute(f'PRAGMA user_version = {int(version)}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            print(f'Migration {version} failed, database left at version {current_version}')
+            raise
+
+        current_version = version
+
+    return current_version
+
+
+"""
+TRANSACTIONS
+
+Database functions hand their jobs to _run_write and _run_read, which run them inside the current transaction() block
+if there is one, otherwise on the writer thread or the read pool (see worker.py).
+"""
+
+
+# the transaction the current task is inside, if any
+_current_transaction = contextvars.ContextVar('current_transaction', default=None)
+
+
+@contextlib.asynccontextmanager
+async def transaction():
+    """
+    Groups several database calls into one atomic transaction with a single commit.
+
+    Every database function awaited inside the block joins the transaction, and reads inside it see its own
+    uncommitted writes. Leaving the block normally commits; an exception rolls everything back and is re-raised.
+    Nested blocks join the outer transaction.
+
+    Don't await Discord or other slow calls inside the block: the writer is held for the whole block.
+
+        async with transaction():
+            await edit_carrier(entry_id, user_roles=roles)
+            await delete_carrier(other_entry_id)
+    """
+    if _current_transaction.get() is not None:
+        # already inside a transaction, join it
+        yield _current_transaction.get()
+        return
+
+    call = CallStats()
+    start = time.perf_counter()
+    failed = False
+    async with infraction_db_lock:
+        call.wait = time.perf_counter() - start
+        txn = DatabaseTransaction(infraction_db_worker)
+        txn.begin()
+        token = _current_transaction.set(txn)
+        try:
+            yield txn
+        except BaseException:
+            failed = True
+            await txn.end(commit=False)
+            raise
+        else:
+            await txn.end(commit=True)
+        finally:
+            _current_transaction.reset(token)
+            call.execute = time.perf_counter() - start - call.wait
+            db_metrics.record('transaction', (time.perf_counter() - start) * 1000, call, failed)
+
+
+async def _run_write(func, *args, **kwargs):
+    """
+    Runs a write job in the current transaction, or on the worker to be group-committed.
+    """
+    func = timed_job(func)
+    txn = _current_transaction.get()
+    if txn is not None:
+        return await txn.run(func, *args, **kwargs)
+    return await infraction_db_worker.run(func, *args, **kwargs)
+
+
+async def _run_read(func, *args, **kwargs):
+    """
+    Runs a read job in the current transaction so it sees the transaction's writes, or on the read pool.
+    """
+    func = timed_job(func)
+    txn = _current_transaction.get()
+    if txn is not None:
+        return await txn.run(func, *args, **kwargs)
+    return await infraction_db_readers.run(func, *args, **kwargs)
+
+
 """
 DATABASE OBJECT
 
-Database connection, cursor, and lock
+Database connection, cursor, lock and worker
 """
 
 # connect to infraction database
-infraction_conn = sqlite3.connect(constants.INFRACTIONS_DB_PATH)
+# the connection is shared between startup (main thread) and the worker thread, never both at once
+# isolation_level=None hands transaction control to us: the worker opens and commits its own batches
+infraction_conn = sqlite3.connect(constants.INFRACTIONS_DB_PATH, check_same_thread=False, isolation_level=None,
+                                  cached_statements=constants.DB_STATEMENT_CACHE_SIZE)
 infraction_conn.row_factory = sqlite3.Row
 infraction_db = infraction_conn.cursor()
 
-# lock infraction db
+# WAL lets the read pool run alongside the writer; NORMAL only syncs at checkpoints, which is safe under WAL
+infraction_conn.execute('PRAGMA journal_mode = WAL')
+infraction_conn.execute('PRAGMA synchronous = NORMAL')
+
+# lock infraction db, held by a transaction() block for its whole duration
 infraction_db_lock = asyncio.Lock()
 
+# worker thread that owns all runtime writes to infraction_conn
+infraction_db_worker = DatabaseWorker(infraction_conn, 'infraction-db-worker',
+                                      commit_window=constants.DB_GROUP_COMMIT_WINDOW,
+                                      max_batch=constants.DB_GROUP_COMMIT_MAX_BATCH)
+
+# read-only connections for lookups
+infraction_db_readers = DatabaseReaderPool(constants.INFRACTIONS_DB_PATH, constants.DB_READ_POOL_SIZE,
+                                           'infraction-db-reader')
+
+# per-user infraction lists for find_infraction
+infraction_cache = InfractionCache(constants.DB_INFRACTION_CACHE_SIZE)
+
+# the tow lot, loaded by build_database_on_startup
+carrier_mirror = CarrierMirror()
+
+"""
+QUERY BUILDER
+
+Composable SELECTs over the infractions and tow_truck tables. Filters are equality matches (or IN for a list of
+values), optional time ranges and substring matches, plus ordering and paging. The SQL for each distinct query shape
+is built once and cached; because the text is then identical every time, sqlite's per-connection statement cache
+also reuses the prepared statement instead of re-parsing it.
+"""
+
+# table name: column enum and the column time ranges apply to
+query_tables = {
+    'infractions': {'fields': InfractionDbFields, 'time_column': InfractionDbFields.warning_time.value,
+                    'archive': 'archive.infractions'},
+    'tow_truck': {'fields': CarrierDbFields, 'time_column': None, 'archive': None},
+}
+
+
+@functools.lru_cache(maxsize=256)
+def _query_sql(table, shape):
+    """
+    Builds the SQL for one query shape. Only reached once per shape, later calls are served from the cache.
+
+    :param str table: The table to select from
+    :param tuple shape: (equals, contains, has_since, has_until, order_by, descending, has_seek, has_limit,
+        has_offset, full_history) where equals is a tuple of (column, number of values or None for a single value),
+        contains a tuple of columns and order_by a tuple of columns
+    :rtype: str
+    """
+    equals, contains, has_since, has_until, order_by, descending, has_seek, has_limit, has_offset, full_history = shape
+    time_column = query_tables[table]['time_column']
+
+    conditions = []
+    for column, count in equals:
+        if count is None:
+            conditions.append(f"{column} = ?")
+        else:
+            conditions.append(f"{column} IN ({', '.join('?' * count)})")
+    for column in contains:
+        conditions.append(f"{column} LIKE ?")
+    if has_since:
+        conditions.append(f"{time_column} >= ?")
+    if has_until:
+        conditions.append(f"{time_column} < ?")
+    if has_seek:
+        # keyset paging: everything past the last row of the previous page, an index seek rather than an OFFSET
+        conditions.append(f"({', '.join(order_by)}) {'<' if descending else '>'} ({', '.join('?' * len(order_by))})")
+
+    where = " WHERE " + " AND ".join(conditions) if conditions else ""
+    order = ""
+    if order_by:
+        direction = 'DESC' if descending else 'ASC'
+        order = " ORDER BY " + ", ".join(f"{column} {direction}" for column in order_by)
+
+    if full_history:
+        # the hot table and the archive filtered (and with a limit, ordered and cut short) each on their own
+        # indexes, then merged
+        halves = [f"SELECT * FROM {source}{where}" for source in (f"main.{table}", query_tables[table]['archive'])]
+        if has_limit:
+            halves = [f"SELECT * FROM ({half}{order} LIMIT ?)" for half in halves]
+        sql = f"SELECT * FROM ({' UNION ALL '.join(halves)})"
+    else:
+        sql = f"SELECT * FROM {table}{where}"
+    sql += order
+    if has_limit:
+        sql += " LIMIT ?"
+        if has_offset:
+            sql += " OFFSET ?"
+    return sql
+
+
+def compile_query(table, equals=None, contains=None, since=None, until=None, order_by=None, descending=False,
+                  seek=None, limit=None, offset=None, full_history=False):
+    """
+    Turns query filters into SQL and its parameters.
+
+    :param str table: 'infractions' or 'tow_truck'
+    :param dict equals: column: value to match exactly, or column: list of values to match any of
+    :param dict contains: column: text the column must contain (a LIKE scan, avoid on large tables)
+    :param int since: (Optional) Unix timestamp, inclusive lower bound on the table's time column
+    :param int until: (Optional) Unix timestamp, exclusive upper bound on the table's time column
+    :param order_by: (Optional) Column, or tuple of columns, to order by
+    :param bool descending: Order descending instead of ascending
+    :param tuple seek: (Optional) order_by values of the last row already seen, only rows after it are returned
+    :param int limit: (Optional) Maximum number of rows
+    :param int offset: (Optional) Rows to skip, only used with limit
+    :param bool full_history: Also include rows moved to the archive database
+    :returns: The SQL string and a tuple of parameters
+    :rtype: tuple
+    """
+    table_info = query_tables[table]
+    valid_columns = {field.value for field in table_info['fields']}
+    equals = equals or {}
+    contains = contains or {}
+    if isinstance(order_by, str):
+        order_by = (order_by,)
+    order_by = tuple(order_by or ())
+
+    # column names end up in the SQL text, so only ever accept the table's real columns
+    for column in [*equals, *contains, *order_by]:
+        if column not in valid_columns:
+            raise ValueError(f"{column} is not a column of {table}")
+    if (since is not None or until is not None) and not table_info['time_column']:
+        raise ValueError(f"{table} has no time column to filter on")
+    if seek is not None and len(seek) != len(order_by):
+        raise ValueError("seek needs one value per order_by column")
+    if full_history and not table_info['archive']:
+        raise ValueError(f"{table} has no archive")
+
+    equals_shape = []
+    params = []
+    for column in sorted(equals):  # sorted so the same filters always give the same shape
+        value = equals[column]
+        if isinstance(value, (list, tuple, set, frozenset)):
+            values = list(value)
+            equals_shape.append((column, len(values)))
+            params.extend(values)
+        else:
+            equals_shape.append((column, None))
+            params.append(value)
+
+    contains_shape = []
+    for column in sorted(contains):
+        contains_shape.append(column)
+        params.append(f"%{contains[column]}%")
+
+    if since is not None:
+        params.append(since)
+    if until is not None:
+        params.append(until)
+    if seek is not None:
+        params.extend(seek)
+    if full_history:
+        # each half of the union binds the filters, and its own limit covering the rows skipped by the offset
+        half_limit = [limit + (offset or 0)] if limit is not None else []
+        params = [*params, *half_limit, *params, *half_limit]
+    if limit is not None:
+        params.append(limit)
+        if offset is not None:
+            params.append(offset)
+
+    shape = (tuple(equals_shape), tuple(contains_shape), since is not None, until is not None, order_by,
+             bool(descending), seek is not None, limit is not None, limit is not None and offset is not None,
+             bool(full_history))
+    return _query_sql(table, shape), tuple(params)
+
+
+@instrumented
+async def query_infractions(since=None, until=None, contains=None, order_by=InfractionDbFields.entry_id.value,
+                            descending=False, seek=None, limit=None, offset=None, full_history=False, **equals):
+    """
+    Finds infractions matching any combination of filters.
+
+    Any infractions column can be passed as a keyword to match it exactly, or with a list of values to match any
+    of them, e.g. query_infractions(warned_user=member.id, rule_broken=[1, 2], since=timestamp, limit=10)
+
+    :param int since: (Optional) Only infractions warned at or after this Unix timestamp
+    :param int until: (Optional) Only infractions warned before this Unix timestamp
+    :param dict contains: (Optional) column: text the column must contain
+    :param order_by: Column, or tuple of columns, to order by, entry_id (oldest first) by default
+    :param bool descending: Order descending instead of ascending
+    :param tuple seek: (Optional) order_by values of the last infraction already seen, for keyset paging
+    :param int limit: (Optional) Maximum number of infractions to return
+    :param int offset: (Optional) Infractions to skip, only used with limit
+    :param bool full_history: Also include infractions moved to the archive, only recent ones otherwise
+    :returns: A list of InfractionData objects
+    :rtype: list
+    """
+    sql, params = compile_query('infractions', equals=equals, contains=contains, since=since, until=until,
+                                order_by=order_by, descending=descending, seek=seek, limit=limit, offset=offset,
+                                full_history=full_history)
+
+    def _query(cursor):
+        cursor.row_factory = InfractionData.row_factory
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+    return await _run_read(_query)
+
+
+@instrumented
+async def browse_infractions(page_size, seek=None, since=None, until=None, full_history=False, **equals):
+    """
+    Returns one page of infractions, newest first, for paging through the whole table.
+
+    Pages are found by keyset rather than OFFSET: pass the (warning_time, entry_id) of the last infraction on the
+    previous page as seek, and the page is read straight off an index however deep into the table it is.
+
+    :param int page_size: Infractions per page
+    :param tuple seek: (Optional) (warning_time, entry_id) of the last infraction on the previous page
+    :param int since: (Optional) Only infractions warned at or after this Unix timestamp
+    :param int until: (Optional) Only infractions warned before this Unix timestamp
+    :param bool full_history: Also page through infractions moved to the archive
+    :returns: The page of InfractionData objects, and whether there is another page after it
+    :rtype: tuple
+    """
+    infraction_data = await query_infractions(
+        since=since, until=until, seek=seek, descending=True, limit=page_size + 1, full_history=full_history,
+        order_by=(InfractionDbFields.warning_time.value, InfractionDbFields.entry_id.value), **equals
+    )
+    return infraction_data[:page_size], len(infraction_data) > page_size
+
+
+@instrumented
+async def query_carriers(contains=None, order_by=CarrierDbFields.entry_id.value, descending=False, limit=None,
+                         offset=None, **equals):
+    """
+    Finds tow truck carriers matching any combination of filters, see query_infractions.
+
+    :returns: A list of TowTruckData objects
+    :rtype: list
+    """
+    sql, params = compile_query('tow_truck', equals=equals, contains=contains, order_by=order_by,
+                                descending=descending, limit=limit, offset=offset)
+
+    def _query(cursor):
+        cursor.row_factory = TowTruckData.row_factory
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+    return await _run_read(_query)
+
+
+def _fts_match_expression(text, exact_phrase=False):
+    """
+    Turns free text into an FTS5 MATCH expression, quoting each word so punctuation can't be read as query syntax.
+
+    :param str text: The text to search for
+    :param bool exact_phrase: Match the words as one phrase rather than anywhere in the reason
+    :rtype: str
+    """
+    words = [word.replace('"', '""') for word in text.split()]
+    if exact_phrase:
+        return '"' + ' '.join(words) + '"'
+    return ' '.join(f'"{word}"' for word in words)
+
+
+@instrumented
+async def search_infractions(text, exact_phrase=False, warned_user=None, limit=10, offset=0):
+    """
+    Full text search over warning reasons, archived ones included, best matches first.
+
+    The hot table and the archive have an index each, and bm25 scores each against its own index's statistics, so
+    scores from the two can't be compared. Results alternate instead: the best hot match, the best archived match,
+    the second best of each and so on, newer infractions first where the two are level.
+
+    :param str text: Words to search for, all of which must appear in the reason
+    :param bool exact_phrase: Match the words as one phrase
+    :param int warned_user: (Optional) Only search this user's infractions
+    :param int limit: Maximum number of infractions to return
+    :param int offset: Results to skip, for paging
+    :returns: A list of (InfractionData, snippet) tuples for the page, and the total number of matches
+    :rtype: tuple
+    """
+    match = _fts_match_expression(text, exact_phrase)
+    if not match:
+        return [], 0
+
+    user_filter = " AND infractions.warned_user = ?" if warned_user is not None else ""
+    params = (match, warned_user) if warned_user is not None else (match,)
+    schemas = ['main', 'archive'] if archive_attached else ['main']
+
+    def _matches(schema, columns):
+        return (f"SELECT {columns} FROM {schema}.infractions_fts AS infractions_fts "
+                f"JOIN {schema}.infractions AS infractions ON infractions.entry_id = infractions_fts.rowid "
+                f"WHERE infractions_fts MATCH ?{user_filter}")
+
+    def _search(cursor):
+        total = 0
+        for schema in schemas:
+            cursor.execute(_matches(schema, 'count(*)'), params)
+            total += cursor.fetchone()[0]
+
+        # plain tuples, the infraction columns come first and the snippet last. No page can need more than
+        # offset + limit matches from either index
+        cursor.row_factory = None
+        ranked = []
+        for schema in schemas:
+            cursor.execute(
+                _matches(schema, "infractions.*, snippet(infractions_fts, 0, '**', '**', '…', 24)")
+                + " ORDER BY infractions_fts.rank LIMIT ?",
+                (*params, offset + limit)
+            )
+            ranked.append(cursor.fetchall())
+
+        # interleaved by place in each index's own ranking, newer infractions first where the two are level
+        merged = sorted(((position, -row[0], row) for rows in ranked for position, row in enumerate(rows)),
+                        key=lambda item: item[:2])
+        results = [(InfractionData.from_row(row[:-1]), row[-1]) for _, _, row in merged[offset:offset + limit]]
+        return results, total
+
+    return await _run_read(_search)
+
+
+def _search_pairs_to_filters(search_pairs, text_columns):
+    """
+    Splits find_infraction/find_carrier style (term, column) pairs into exact and substring filters.
+    """
+    equals = {}
+    contains = {}
+    for term, column in search_pairs:
+        if term is None or column is None:
+            continue
+        if column in text_columns:
+            contains[column] = term
+        else:
+            equals[column] = term
+    return equals, contains
+
+
+"""
+EXPORTS
+
+Streams a table out as gzipped NDJSON or CSV. Rows are pulled in fetchmany chunks from their own read-only connection
+and compressed as they're written, so memory stays flat however many rows match.
+"""
+
+
+export_formats = ['ndjson', 'csv']
+
+
+def iter_table_rows(table, chunk_size=None, **filters):
+    """
+    Yields rows of table matching the query API filters, oldest first, reading chunk_size rows at a time.
+
+    Runs on a connection of its own, so everything yielded comes from one consistent snapshot of the database and
+    the generator can be consumed from any thread.
+
+    :param str table: 'infractions' or 'tow_truck'
+    :param int chunk_size: (Optional) Rows fetched per round trip, constants.DB_EXPORT_CHUNK_SIZE by default
+    :param filters: equals, contains, since and until as accepted by compile_query
+    :rtype: generator of sqlite3.Row
+    """
+    sql, params = compile_query(table, order_by='entry_id', **filters)
+    conn = open_readonly_connection(constants.INFRACTIONS_DB_PATH)
+    try:
+        cursor = conn.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size or constants.DB_EXPORT_CHUNK_SIZE)
+            if not rows:
+                return
+            yield from rows
+    finally:
+        conn.close()
+
+
+def write_export(fileobj, table, export_format='ndjson', **filters):
+    """
+    Writes the rows of table matching filters to fileobj as gzipped NDJSON or CSV.
+
+    :param fileobj: A binary file object to write to
+    :param str table: 'infractions' or 'tow_truck'
+    :param str export_format: 'ndjson' or 'csv'
+    :param filters: equals, contains, since and until as accepted by compile_query
+    :returns: The number of rows written
+    :rtype: int
+    """
+    if export_format not in export_formats:
+        raise ValueError(f"{export_format} is not an export format, use one of {', '.join(export_formats)}")
+
+    columns = [field.value for field in query_tables[table]['fields']]
+    row_count = 0
+    with gzip.GzipFile(filename='', fileobj=fileobj, mode='wb') as compressed, \
+            io.TextIOWrapper(compressed, encoding='utf-8', newline='') as text:
+        if export_format == 'csv':
+            writer = csv.writer(text)
+            writer.writerow(columns)
+        for row in iter_table_rows(table, **filters):
+            if export_format == 'csv':
+                writer.writerow(tuple(row))
+            else:
+                text.write(json.dumps(dict(zip(columns, row))) + '\n')
+            row_count += 1
+    return row_count
+
+
+@instrumented
+async def export_table(table, export_format='ndjson', **filters):
+    """
+    Exports table to a gzipped temporary file off the event loop.
+
+    :param str table: 'infractions' or 'tow_truck'
+    :param str export_format: 'ndjson' or 'csv'
+    :param filters: equals, contains, since and until as accepted by compile_query
+    :returns: The temporary file, rewound to the start, and the number of rows in it. The caller closes the file.
+    :rtype: tuple
+    """
+    print(f"Called export_table for {table} as {export_format} with {filters}")
+
+    def _export():
+        export_file = tempfile.TemporaryFile()
+        try:
+            row_count = write_export(export_file, table, export_format, **filters)
+        except Exception:
+            export_file.close()
+            raise
+        export_file.seek(0)
+        return export_file, row_count
+
+    return await asyncio.to_thread(_export)
+
+
+"""
+ARCHIVE
+
+Infractions older than DB_ARCHIVE_AFTER_DAYS are moved out of the hot infractions table into
+infractions_archive.db, ATTACHed to every connection as `archive`. Bulk queries only read the hot table and stay fast
+however long the history gets; pass full_history=True to the query functions to read both. A member's record
+(find_infraction, get_user_infractions) and full text search always include the archive, and edits and deletes by
+entry ID reach archived infractions too.
+
+Archived infractions still count towards a member's infraction_counts and the monthly statistics: temporary triggers
+on the writer connection count rows in and out of the archive, so moving a row nets out. The archive keeps its own
+full text index, maintained by triggers stored in the archive file.
+"""
+
+
+# the archive's infractions table, the same columns as the hot one
+# only ever filled with IDs the hot table handed out, so it doesn't need AUTOINCREMENT itself
+archive_table_create = infractions_table_create.replace('CREATE TABLE infractions(',
+                                                        'CREATE TABLE IF NOT EXISTS archive.infractions(') \
+    .replace(' AUTOINCREMENT', '')
+
+# set on the writer connection by attach_archive, temporary so they only ever fire for the writer
+archive_triggers = [
+    """CREATE TEMP TRIGGER IF NOT EXISTS archive_counts_insert AFTER INSERT ON archive.infractions BEGIN
+        INSERT INTO infraction_counts(warned_user, infraction_count) VALUES (new.warned_user, 1)
+        ON CONFLICT(warned_user) DO UPDATE SET infraction_count = infraction_count + 1;
+    END""",
+    """CREATE TEMP TRIGGER IF NOT EXISTS archive_counts_delete AFTER DELETE ON archive.infractions BEGIN
+        UPDATE infraction_counts SET infraction_count = infraction_count - 1 WHERE warned_user = old.warned_user;
+        DELETE FROM infraction_counts WHERE warned_user = old.warned_user AND infraction_count <= 0;
+    END""",
+    f"""CREATE TEMP TRIGGER IF NOT EXISTS archive_month_stats_insert AFTER INSERT ON archive.infractions BEGIN
+        {_month_stats_add('new')}
+    END""",
+    f"""CREATE TEMP TRIGGER IF NOT EXISTS archive_month_stats_delete AFTER DELETE ON archive.infractions BEGIN
+        {_month_stats_remove('old')}
+    END""",
+    """CREATE TEMP TRIGGER IF NOT EXISTS archive_counts_update AFTER UPDATE OF warned_user ON archive.infractions
+    WHEN old.warned_user IS NOT new.warned_user BEGIN
+        UPDATE infraction_counts SET infraction_count = infraction_count - 1 WHERE warned_user = old.warned_user;
+        DELETE FROM infraction_counts WHERE warned_user = old.warned_user AND infraction_count <= 0;
+        INSERT INTO infraction_counts(warned_user, infraction_count) VALUES (new.warned_user, 1)
+        ON CONFLICT(warned_user) DO UPDATE SET infraction_count = infraction_count + 1;
+    END""",
+    f"""CREATE TEMP TRIGGER IF NOT EXISTS archive_month_stats_update
+    AFTER UPDATE OF warning_moderator, rule_broken, warning_time ON archive.infractions
+    WHEN old.warning_moderator IS NOT new.warning_moderator OR old.rule_broken IS NOT new.rule_broken
+        OR old.warning_time IS NOT new.warning_time BEGIN
+        {_month_stats_remove('old')}
+        {_month_stats_add('new')}
+    END""",
+]
+
+# the archive's own full text index, with its triggers stored in the archive file so the index follows the rows
+# whichever connection writes them
+archive_fts = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS archive.infractions_fts USING fts5(
+        warning_reason, content='infractions', content_rowid='entry_id'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS archive.archive_fts_insert AFTER INSERT ON infractions BEGIN
+        INSERT INTO infractions_fts(rowid, warning_reason) VALUES (new.entry_id, new.warning_reason);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS archive.archive_fts_delete AFTER DELETE ON infractions BEGIN
+        INSERT INTO infractions_fts(infractions_fts, rowid, warning_reason)
+        VALUES ('delete', old.entry_id, old.warning_reason);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS archive.archive_fts_update AFTER UPDATE OF warning_reason ON infractions BEGIN
+        INSERT INTO infractions_fts(infractions_fts, rowid, warning_reason)
+        VALUES ('delete', old.entry_id, old.warning_reason);
+        INSERT INTO infractions_fts(rowid, warning_reason) VALUES (new.entry_id, new.warning_reason);
+    END""",
+]
+
+archive_attached = False
+
+
+def archive_exists():
+    """
+    Whether there's an archive to read full history from. Unlike archive_attached this also holds in processes that
+    never ran build_database_on_startup, like the export command line, whose read-only connections attach the
+    archive file if it's there.
+
+    :rtype: bool
+    """
+    return archive_attached or os.path.exists(constants.ARCHIVE_DB_PATH)
+
+
+def attach_archive(conn):
+    """
+    Attaches infractions_archive.db to the writer connection as `archive`, creating it if needed.
+
+    :param sqlite3.Connection conn: The writer connection, outside any transaction
+    """
+    global archive_attached
+    if not any(row[1] == 'archive' for row in conn.execute('PRAGMA database_list')):
+        conn.execute("ATTACH DATABASE ? AS archive", (constants.ARCHIVE_DB_PATH,))
+    conn.execute('PRAGMA archive.journal_mode = WAL')
+    conn.execute(archive_table_create)
+    conn.execute('CREATE INDEX IF NOT EXISTS archive.archive_warned_user_time '
+                 'ON infractions(warned_user, warning_time)')
+    conn.execute('CREATE INDEX IF NOT EXISTS archive.archive_warning_time ON infractions(warning_time)')
+    indexed = conn.execute("SELECT 1 FROM archive.sqlite_master WHERE name = 'infractions_fts'").fetchone()
+    for statement in archive_fts:
+        conn.execute(statement)
+    if not indexed:
+        # an archive from before it had a full text index
+        conn.execute("INSERT INTO archive.infractions_fts(infractions_fts) VALUES ('rebuild')")
+    for trigger in archive_triggers:
+        conn.execute(trigger)
+    archive_attached = True
+    print(f'Attached infraction archive {constants.ARCHIVE_DB_PATH}')
+
+
+@instrumented
+async def archive_infractions(older_than_days=None, batch_size=None):
+    """
+    Moves infractions warned more than older_than_days ago into the archive, batch_size at a time.
+
+    Each batch is its own short write, so other database calls carry on between batches. Entry IDs are never reused
+    (see make_entry_ids_monotonic), so an archived ID can't collide with a hot one; if one somehow does, the batch
+    fails and rolls back rather than overwrite the archived infraction.
+
+    :param int older_than_days: (Optional) Age to archive from, constants.DB_ARCHIVE_AFTER_DAYS by default
+    :param int batch_size: (Optional) Infractions moved per transaction, constants.DB_ARCHIVE_BATCH by default
+    :returns: The number of infractions archived
+    :rtype: int
+    """
+    older_than_days = constants.DB_ARCHIVE_AFTER_DAYS if older_than_days is None else older_than_days
+    batch_size = batch_size or constants.DB_ARCHIVE_BATCH
+    print(f"Called archive_infractions for infractions older than {older_than_days} days")
+    if not older_than_days or not archive_attached:
+        return 0
+    cutoff = int(time.time()) - older_than_days * 86400
+
+    batch = "SELECT entry_id FROM main.infractions WHERE warning_time < ? ORDER BY entry_id LIMIT ?"
+
+    def _archive_batch(cursor):
+        cursor.execute(f"SELECT DISTINCT warned_user FROM main.infractions WHERE entry_id IN ({batch})",
+                       (cutoff, batch_size))
+        warned_users = [row[0] for row in cursor.fetchall()]
+        cursor.execute(f"INSERT INTO archive.infractions SELECT * FROM main.infractions "
+                       f"WHERE entry_id IN ({batch})", (cutoff, batch_size))
+        cursor.execute(f"DELETE FROM main.infractions WHERE entry_id IN ({batch})", (cutoff, batch_size))
+        after_commit(lambda: infraction_cache.invalidate(*warned_users))
+        return cursor.rowcount
+
+    archived = 0
+    while True:
+        moved = await _run_write(_archive_batch)
+        archived += moved
+        if moved < batch_size:
+            break
+
+    print(f"Archived {archived} infractions")
+    return archived
+
+
+"""
+MAINTENANCE
+
+Housekeeping the bot runs on the database in quiet periods: PRAGMA optimize to keep the query planner's statistics
+current, an incremental vacuum to return pages freed by deletes, and a WAL checkpoint to fold the write-ahead log back
+into the database. Each step runs on the writer as a standalone job, so other writes slot in between steps, and the
+run stops once its time budget is spent.
+"""
+
+
+def enable_incremental_vacuum(conn):
+    """
+    Switches the database to incremental auto_vacuum. Existing databases need a one-off VACUUM to change over, which
+    runs here on startup and holds up the bot until it's done, so it's only run on databases up to
+    DB_STARTUP_VACUUM_MAX_MB. Larger ones stay as they are until the limit is raised for a restart.
+
+    :param sqlite3.Connection conn: The writer connection, outside any transaction
+    :returns: Whether the database uses incremental auto_vacuum now
+    :rtype: bool
+    """
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+        return True
+    page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+    size_mb = conn.execute('PRAGMA page_count').fetchone()[0] * page_size / 2 ** 20
+    if size_mb > constants.DB_STARTUP_VACUUM_MAX_MB:
+        print(f'Not switching the database to incremental vacuum: the one-off VACUUM for a {size_mb:.0f} MB database '
+              f'would stall startup. Raise PTN_MODBOT_DB_STARTUP_VACUUM_MB above it to switch on a restart.')
+        return False
+    print(f'Switching the {size_mb:.1f} MB database to incremental vacuum with a one-off VACUUM...')
+    start = time.perf_counter()
+    conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    conn.execute('VACUUM')
+    after_mb = conn.execute('PRAGMA page_count').fetchone()[0] * page_size / 2 ** 20
+    print(f'Database vacuumed from {size_mb:.1f} MB to {after_mb:.1f} MB in {time.perf_counter() - start:.1f}s')
+    return True
+
+
+def _optimize(cursor):
+    # bound how much of each table ANALYZE reads, so optimize stays quick on a large database
+    cursor.execute('PRAGMA analysis_limit = 1000')
+    cursor.execute('PRAGMA optimize')
+    return {}
+
+
+def _incremental_vacuum(cursor, pages):
+    freelist = cursor.execute('PRAGMA freelist_count').fetchone()[0]
+    # each page is freed by a step of the statement, so it has to be fetched to completion
+    cursor.execute(f'PRAGMA incremental_vacuum({int(pages)})').fetchall()
+    remaining = cursor.execute('PRAGMA freelist_count').fetchone()[0]
+    return {'freed': freelist - remaining, 'remaining': remaining}
+
+
+def _wal_checkpoint(cursor):
+    # every attached database, truncating the WAL files back to nothing once they're folded in
+    busy, log_pages, checkpointed = cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchone()
+    return {'busy': bool(busy), 'wal_pages': log_pages, 'checkpointed': checkpointed}
+
+
+@instrumented
+async def run_maintenance(budget_seconds=None):
+    """
+    Runs PRAGMA optimize, an incremental vacuum and a WAL checkpoint, stopping when budget_seconds is spent.
+
+    :param float budget_seconds: (Optional) Time budget, constants.DB_MAINTENANCE_BUDGET by default
+    :returns: What each step did and how long it took, and which steps were skipped for lack of time
+    :rtype: dict
+    """
+    budget_seconds = constants.DB_MAINTENANCE_BUDGET if budget_seconds is None else budget_seconds
+    print(f"Called run_maintenance with a {budget_seconds}s budget")
+    if _current_transaction.get() is not None:
+        raise RuntimeError("Maintenance can't run inside a transaction")
+
+    start = time.perf_counter()
+    deadline = start + budget_seconds
+    report = {'steps': {}, 'skipped': []}
+
+    async def step(name, func, *args):
+        if time.perf_counter() >= deadline:
+            report['skipped'].append(name)
+            return None
+        step_start = time.perf_counter()
+        result = await infraction_db_worker.run_standalone(func, *args)
+        result['seconds'] = time.perf_counter() - step_start
+        report['steps'][name] = result
+        return result
+
+    await step('optimize', _optimize)
+
+    # a chunk of pages per job, until the free list is empty or the time is up
+    vacuumed = {'freed': 0, 'remaining': None}
+    vacuum_start = time.perf_counter()
+    while time.perf_counter() < deadline:
+        result = await infraction_db_worker.run_standalone(_incremental_vacuum, constants.DB_VACUUM_PAGES_PER_STEP)
+        vacuumed['freed'] += result['freed']
+        vacuumed['remaining'] = result['remaining']
+        if not result['remaining'] or not result['freed']:
+            break
+    if vacuumed['remaining'] is None:
+        report['skipped'].append('incremental vacuum')
+    else:
+        vacuumed['seconds'] = time.perf_counter() - vacuum_start
+        report['steps']['incremental vacuum'] = vacuumed
+
+    await step('wal checkpoint', _wal_checkpoint)
+
+    report['seconds'] = time.perf_counter() - start
+    print(f"Maintenance finished in {report['seconds']:.2f}s: {report}")
+    return report
+
+
+@instrumented
+async def get_last_scheduled_run(job):
+    """
+    Returns when a scheduled job last ran, so a restart doesn't run it again straight away.
+
+    :param str job: Name of the job, e.g. 'backup' or 'maintenance'
+    :returns: Unix timestamp of the last run, or None if it has never run
+    :rtype: float
+    """
+
+    def _get(cursor):
+        cursor.execute("SELECT last_run FROM scheduled_runs WHERE job = ?", (job,))
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+    return await _run_read(_get)
+
+
+@instrumented
+async def save_scheduled_run(job, last_run):
+    """
+    Records when a scheduled job last ran, see get_last_scheduled_run.
+    """
+
+    def _save(cursor):
+        cursor.execute("INSERT INTO scheduled_runs(job, last_run) VALUES (?, ?) "
+                       "ON CONFLICT(job) DO UPDATE SET last_run = excluded.last_run", (job, last_run))
+
+    await _run_write(_save)
+
+
 """
 DATABASE EDIT FUNCTIONS
 
@@ -174,21 +1466,36 @@ DATABASE EDIT FUNCTIONS
 - Add infraction: insert_infraction
 - Search database by warned user ID: find_infraction
 - Search database by entry ID: find_infraction
+- Get a user's infractions (cached): get_user_infractions
+- Count a user's infractions: count_infractions
+- Search database by any combination of filters: query_infractions
+- Full text search of warning reasons: search_infractions
+- Page through infractions newest first: browse_infractions
+- Move old infractions to the archive: archive_infractions
 - Remove warning from database: delete_single_warning
+- Remove many warnings from database: delete_warnings
 - Remove all warnings for a user from database: delete_all_warnings_for_user
-- Edit single infraction object: insert_infraction
+- Remove all warnings for many users from database: delete_all_warnings_for_users
+- Edit single infraction object: edit_infraction
+- Apply one edit to many infractions: edit_infractions
 
 -- Carrier Table --
 - Search database by carrier ID: find_carrier
 - Search database by discord ID: find_carrier
+- Search database by any combination of filters: query_carriers
 - Remove tracked carrier from database: delete_carrier
+- Remove many tracked carriers from database: delete_carriers
 - Add carrier to the database: insert_carrier
+- Add many carriers to the database: insert_carriers
+
+Any of these can be grouped into one atomic commit with `async with transaction():`
 """
 
 ''' -- Infractions Table --'''
 
 
 # find an infraction in the db
+@instrumented
 async def find_infraction(searchterm1, searchcolumn1, searchterm2=None, searchcolumn2=None):
     print(f"Called find_infraction with {searchterm1}, {searchcolumn1}, {searchterm2}, {searchcolumn2}")
     """
@@ -202,71 +1509,225 @@ async def find_infraction(searchterm1, searchcolumn1, searchterm2=None, searchco
     :rtype: InfractionData
     """
 
-    # Building the SQL query and the tuple of parameters
-    sql = "SELECT * FROM infractions WHERE "
-    params = []
-
-    # Handling the first column and term
-    if searchcolumn1 in [InfractionDbFields.entry_id.value, InfractionDbFields.warned_user.value,
-                         InfractionDbFields.warning_moderator.value]:
-        sql += f"{searchcolumn1} = ?"
-        params.append(searchterm1)
+    # ID, time and rule columns are matched exactly, free text columns by substring
+    equals, contains = _search_pairs_to_filters(((searchterm1, searchcolumn1), (searchterm2, searchcolumn2)),
+                                                infraction_text_columns)
+
+    warned_user = equals.get(InfractionDbFields.warned_user.value)
+    if warned_user is not None and not contains and set(equals) <= {InfractionDbFields.warned_user.value,
+                                                                    InfractionDbFields.entry_id.value}:
+        # a member's record (or one entry from it), served from the cache
+        infraction_data = await get_user_infractions(warned_user)
+        entry_id = equals.get(InfractionDbFields.entry_id.value)
+        if entry_id is not None:
+            infraction_data = [infraction for infraction in infraction_data if infraction.entry_id == int(entry_id)]
     else:
-        sql += f"{searchcolumn1} LIKE ?"
-        params.append(f"%{searchterm1}%")
-
-    # Handling the second column and term (if provided)
-    if searchterm2 is not None and searchcolumn2 is not None:
-        if searchcolumn2 in [InfractionDbFields.entry_id.value, InfractionDbFields.warned_user.value,
-                             InfractionDbFields.warning_moderator.value]:
-            sql += f" AND {searchcolumn2} = ?"
-            params.append(searchterm2)
-        else:
-            sql += f" AND {searchcolumn2} LIKE ?"
-            params.append(f"%{searchterm2}%")
-
-    # Executing the SQL statement
-    infraction_db.execute(sql, tuple(params))
-
-    infraction_data = [InfractionData(infraction) for infraction in infraction_db.fetchall()]
+        infraction_data = await query_infractions(contains=contains, full_history=archive_attached, **equals)
     # for infraction in infraction_data:
     #     print(infraction)  # calls the __str__ method to print the contents of the instantiated class object
 
     return infraction_data
 
 
+# get every infraction for a user, oldest first
+@instrumented
+async def get_user_infractions(warned_user):
+    """
+    Returns a user's infractions, archived ones included, from the infraction cache when possible.
+
+    :param int warned_user: ID of the user
+    :returns: A list of InfractionData objects
+    :rtype: list
+    """
+    if _current_transaction.get() is not None:
+        # inside a transaction the rows may be uncommitted, so neither trust nor fill the cache
+        return await query_infractions(warned_user=warned_user, full_history=archive_attached)
+
+    infraction_data = infraction_cache.get(warned_user)
+    if infraction_data is None:
+        generation = infraction_cache.generation
+        infraction_data = await query_infractions(warned_user=warned_user, full_history=archive_attached)
+        infraction_cache.put(warned_user, infraction_data, generation)
+    return infraction_data
+
+
+# count a user's infractions
+@instrumented
+async def count_infractions(warned_user):
+    """
+    Returns how many infractions a user has on record.
+
+    Reads the trigger-maintained infraction_counts table, so the cost doesn't grow with the user's record.
+
+    :param int warned_user: ID of the user
+    :rtype: int
+    """
+
+    def _count(cursor):
+        cursor.execute("SELECT infraction_count FROM infraction_counts WHERE warned_user = ?", (warned_user,))
+        row = cursor.fetchone()
+        return row[0] if row else 0
+
+    return await _run_read(_count)
+
+
+def _month_stats_query(table, key_column, key, since_month, until_month):
+    sql = f"SELECT {key_column}, month, infraction_count FROM {table} WHERE month >= ?"
+    params = [since_month or '']
+    if until_month:
+        sql += " AND month <= ?"
+        params.append(until_month)
+    if key is not None:
+        sql += f" AND {key_column} = ?"
+        params.append(key)
+    sql += f" ORDER BY month, {key_column}"
+
+    def _query(cursor):
+        cursor.execute(sql, params)
+        return [tuple(row) for row in cursor.fetchall()]
+
+    return _query
+
+
+# warnings per moderator per month
+@instrumented
+async def get_moderator_month_stats(since_month=None, until_month=None, warning_moderator=None):
+    """
+    Returns how many infractions each moderator gave each month, from the trigger-maintained moderator_month_stats.
+
+    :param str since_month: (Optional) First month to include, as YYYY-MM
+    :param str until_month: (Optional) Last month to include, as YYYY-MM
+    :param int warning_moderator: (Optional) Only this moderator
+    :returns: (warning_moderator, month, infraction_count) tuples, ordered by month
+    :rtype: list
+    """
+    return await _run_read(_month_stats_query('moderator_month_stats', 'warning_moderator', warning_moderator,
+                                              since_month, until_month))
+
+
+# infractions per rule per month
+@instrumented
+async def get_rule_month_stats(since_month=None, until_month=None, rule_broken=None):
+    """
+    Returns how many infractions were given for each rule each month, from the trigger-maintained rule_month_stats.
+    Infractions without a rule are counted under rule 0.
+
+    :param str since_month: (Optional) First month to include, as YYYY-MM
+    :param str until_month: (Optional) Last month to include, as YYYY-MM
+    :param int rule_broken: (Optional) Only this rule
+    :returns: (rule_broken, month, infraction_count) tuples, ordered by month
+    :rtype: list
+    """
+    return await _run_read(_month_stats_query('rule_month_stats', 'rule_broken', rule_broken,
+                                              since_month, until_month))
+
+
 # Remove warning from database
+@instrumented
 async def delete_single_warning(entry_id):
     """
     Function to lookup a warning by its Primary Key and delete it.
     """
     print(f"Attempting to delete entry {entry_id}.")
-    try:
-        await infraction_db_lock.acquire()
-        infraction_db.execute(f"DELETE FROM infractions WHERE entry_id = {entry_id}")
-        infraction_conn.commit()
-    finally:
-        infraction_db_lock.release()
+
+    await delete_warnings([entry_id])
 
     return
 
 
+def _infraction_tables():
+    # every table an infraction can be in, edits and deletes by entry ID are applied to each
+    return ['main.infractions', 'archive.infractions'] if archive_attached else ['main.infractions']
+
+
+def _warned_users_for_entries(cursor, entry_ids):
+    # whose records the entries belong to, so their cached infractions can be dropped. Chunked to stay well under
+    # SQLite's limit on bound parameters
+    warned_users = set()
+    for start in range(0, len(entry_ids), 500):
+        chunk = entry_ids[start:start + 500]
+        for table in _infraction_tables():
+            cursor.execute(
+                f"SELECT DISTINCT warned_user FROM {table} WHERE entry_id IN ({', '.join('?' * len(chunk))})",
+                chunk
+            )
+            warned_users.update(row[0] for row in cursor.fetchall())
+    return warned_users
+
+
+# Remove many warnings from database
+@instrumented
+async def delete_warnings(entry_ids):
+    """
+    Deletes every warning in entry_ids in a single transaction, archived or not.
+
+    :param list entry_ids: Primary keys of the warnings to delete
+    :returns: The number of warnings deleted
+    :rtype: int
+    """
+    entry_ids = list(entry_ids)
+    print(f"Attempting to delete {len(entry_ids)} entries.")
+    if not entry_ids:
+        return 0
+
+    def _delete(cursor):
+        warned_users = _warned_users_for_entries(cursor, entry_ids)
+        deleted = 0
+        for table in _infraction_tables():
+            cursor.executemany(f"DELETE FROM {table} WHERE entry_id = ?", ((entry_id,) for entry_id in entry_ids))
+            deleted += cursor.rowcount
+        after_commit(lambda: infraction_cache.invalidate(*warned_users))
+        return deleted
+
+    deleted = await _run_write(_delete)
+
+    return deleted
+
+
 # Remove all warnings for a user
+@instrumented
 async def delete_all_warnings_for_user(warned_user):
     """
     Function to delete all entries matching a given warned user ID.
     """
     print(f"Attempting to delete all entries for {warned_user}.")
-    try:
-        await infraction_db_lock.acquire()
-        infraction_db.execute(f"DELETE FROM infractions WHERE warned_user = {warned_user}")
-        infraction_conn.commit()
-    finally:
-        infraction_db_lock.release()
+
+    await delete_all_warnings_for_users([warned_user])
     return
 
 
+# Remove all warnings for many users
+@instrumented
+async def delete_all_warnings_for_users(warned_users):
+    """
+    Deletes every warning given to any of warned_users in a single transaction.
+
+    :param list warned_users: IDs of the users whose records are purged
+    :returns: The number of warnings deleted
+    :rtype: int
+    """
+    warned_users = list(warned_users)
+    print(f"Attempting to delete all entries for {len(warned_users)} users.")
+    if not warned_users:
+        return 0
+
+    def _delete(cursor):
+        cursor.executemany("DELETE FROM infractions WHERE warned_user = ?", ((user,) for user in warned_users))
+        deleted = cursor.rowcount
+        if archive_attached:
+            # a purge takes the member's archived history with it
+            cursor.executemany("DELETE FROM archive.infractions WHERE warned_user = ?",
+                               ((user,) for user in warned_users))
+            deleted += cursor.rowcount
+        after_commit(lambda: infraction_cache.invalidate(*warned_users))
+        return deleted
+
+    deleted = await _run_write(_delete)
+    return deleted
+
+
 # Insert an infraction into the database
+@instrumented
 async def insert_infraction(warned_user, warning_moderator, warning_time, rule_broken=None, warning_reason=None,
                             thread_id=None):
     """
@@ -284,29 +1745,28 @@ async def insert_infraction(warned_user, warning_moderator, warning_time, rule_b
 
     print(f"Inserting infraction for user {warned_user} by moderator {warning_moderator}.")
 
-    try:
-        await infraction_db_lock.acquire()
-
-        infraction_db.execute(
+    def _insert(cursor):
+        cursor.execute(
             f"INSERT INTO infractions (warned_user, warning_moderator, warning_time, rule_broken, warning_reason, "
             f"thread_id) VALUES (?, ?, ?, ?, ?, ?)",
             (warned_user, warning_moderator, warning_time, rule_broken, warning_reason, thread_id)
         )
-        infraction_conn.commit()
 
+        after_commit(lambda: infraction_cache.invalidate(warned_user))
         # Fetch the ID of the last row inserted (this is our infraction's entry ID)
-        entry_id = infraction_db.lastrowid
-    finally:
-        infraction_db_lock.release()
+        return cursor.lastrowid
+
+    entry_id = await _run_write(_insert)
 
     print(f"Infraction inserted with entry ID {entry_id}.")
     return entry_id
 
 
+@instrumented
 async def edit_infraction(entry_id, warned_user=None, warning_moderator=None, warning_time=None, rule_broken=None,
                           warning_reason=None, thread_id=None):
     """
-    Edits an existing infraction in the infractions table.
+    Edits an existing infraction, in the infractions table or the archive.
 
     :param int entry_id: ID of the infraction entry to be edited
     :param int warned_user: (Optional) New ID of the user being warned
@@ -321,189 +1781,450 @@ async def edit_infraction(entry_id, warned_user=None, warning_moderator=None, wa
 
     print(f"Editing infraction with entry ID {entry_id}.")
 
-    try:
-        await infraction_db_lock.acquire()
-
-        # Prepare the SET part of the SQL command
-        updates = []
-        parameters = []
-        if warned_user is not None:
-            updates.append("warned_user = ?")
-            parameters.append(warned_user)
-        if warning_moderator is not None:
-            updates.append("warning_moderator = ?")
-            parameters.append(warning_moderator)
-        if warning_time is not None:
-            updates.append("warning_time = ?")
-            parameters.append(warning_time)
-        if rule_broken is not None:
-            updates.append("rule_broken = ?")
-            parameters.append(rule_broken)
-        if warning_reason is not None:
-            updates.append("warning_reason = ?")
-            parameters.append(warning_reason)
-        if thread_id is not None:
-            updates.append("thread_id = ?")
-            parameters.append(thread_id)
-
-        set_command = ", ".join(updates)
-        parameters.append(entry_id)
-
-        # Check if there is anything to update
-        if not updates:
-            print("No updates provided.")
-            return False
+    # Prepare the SET part of the SQL command
+    updates = []
+    parameters = []
+    if warned_user is not None:
+        updates.append("warned_user = ?")
+        parameters.append(warned_user)
+    if warning_moderator is not None:
+        updates.append("warning_moderator = ?")
+        parameters.append(warning_moderator)
+    if warning_time is not None:
+        updates.append("warning_time = ?")
+        parameters.append(warning_time)
+    if rule_broken is not None:
+        updates.append("rule_broken = ?")
+        parameters.append(rule_broken)
+    if warning_reason is not None:
+        updates.append("warning_reason = ?")
+        parameters.append(warning_reason)
+    if thread_id is not None:
+        updates.append("thread_id = ?")
+        parameters.append(thread_id)
+
+    set_command = ", ".join(updates)
+    parameters.append(entry_id)
+
+    # Check if there is anything to update
+    if not updates:
+        print("No updates provided.")
+        return False
+
+    def _update(cursor):
+        # note whose record this was, so their cached infractions can be dropped
+        previous = _warned_users_for_entries(cursor, [entry_id])
 
         # Execute the update command
-        infraction_db.execute(
-            f"UPDATE infractions SET {set_command} WHERE entry_id = ?",
-            tuple(parameters)
-        )
-        infraction_conn.commit()
+        for table in _infraction_tables():
+            cursor.execute(
+                f"UPDATE {table} SET {set_command} WHERE entry_id = ?",
+                tuple(parameters)
+            )
+        after_commit(lambda: infraction_cache.invalidate(*previous, warned_user))
 
-    finally:
-        infraction_db_lock.release()
+    await _run_write(_update)
 
     print("Infraction updated.")
     return True
 
 
+@instrumented
+async def edit_infractions(entry_ids, **fields):
+    """
+    Applies the same edit to every infraction in entry_ids in a single transaction, archived or not, e.g. pointing a
+    batch of infractions at a new thread.
+
+    :param list entry_ids: IDs of the infraction entries to be edited
+    :param fields: New values by column, as accepted by edit_infraction
+    :returns: The number of infractions updated
+    :rtype: int
+    """
+    entry_ids = list(entry_ids)
+    print(f"Editing {len(entry_ids)} infractions.")
+
+    valid_columns = set(infractions_table_columns) - {InfractionDbFields.entry_id.value}
+    for column in fields:
+        if column not in valid_columns:
+            raise ValueError(f"{column} is not an editable column of infractions")
+    updates = {column: value for column, value in fields.items() if value is not None}
+    if not updates or not entry_ids:
+        print("No updates provided.")
+        return 0
+
+    set_command = ", ".join(f"{column} = ?" for column in updates)
+    values = tuple(updates.values())
+
+    def _update(cursor):
+        warned_users = _warned_users_for_entries(cursor, entry_ids)
+        updated = 0
+        for table in _infraction_tables():
+            cursor.executemany(
+                f"UPDATE {table} SET {set_command} WHERE entry_id = ?",
+                ((*values, entry_id) for entry_id in entry_ids)
+            )
+            updated += cursor.rowcount
+        if InfractionDbFields.warned_user.value in updates:
+            warned_users.add(updates[InfractionDbFields.warned_user.value])
+        after_commit(lambda: infraction_cache.invalidate(*warned_users))
+        return updated
+
+    updated = await _run_write(_update)
+
+    print(f"{updated} infractions updated.")
+    return updated
+
+
 ''' -- Tow Truck Table -- '''
 
 
+def _write_role_snapshot(cursor, discord_user, user_roles, replace=False):
+    # a member keeps the snapshot from their first impound unless replace is set
+    if replace:
+        cursor.execute("DELETE FROM tow_truck_role_snapshot WHERE discord_user = ?", (discord_user,))
+    else:
+        cursor.execute("SELECT 1 FROM tow_truck_role_snapshot WHERE discord_user = ? LIMIT 1", (discord_user,))
+        if cursor.fetchone():
+            return
+    cursor.executemany(
+        "INSERT OR IGNORE INTO tow_truck_role_snapshot(discord_user, role_id, position) VALUES (?, ?, ?)",
+        ((discord_user, role_id, position) for position, role_id in enumerate(_role_ids(user_roles)))
+    )
+
+
+def _select_carriers(cursor, column, values):
+    # reads carriers back inside a write, for the mirror to pick up once it commits
+    values = list(values)
+    carriers = []
+    for start in range(0, len(values), 500):
+        chunk = values[start:start + 500]
+        cursor.execute(f"SELECT * FROM tow_truck WHERE {column} IN ({', '.join('?' * len(chunk))})", chunk)
+        carriers.extend(TowTruckData.from_row(tuple(row)) for row in cursor.fetchall())
+    return carriers
+
+
+@instrumented
 async def insert_carrier(carrier_name: str, carrier_id: str, carrier_position: str, in_game_carrier_owner: str,
-                         discord_user: int = None, user_roles: str = None):
+                         discord_user: int = None, user_roles=None):
     """
     Inserts a new carrier into the tow truck table
+
+    user_roles (a comma joined string or a list of role IDs) are stored as discord_user's role snapshot, unless an
+    earlier carrier of theirs already stored one.
     """
     print(f'Inserting infraction for carrier {carrier_name} ({carrier_id})')
 
-    try:
-        await infraction_db_lock.acquire()
-
-        infraction_db.execute(
-            f"INSERT INTO tow_truck (carrier_name, carrier_id, carrier_position, in_game_carrier_owner, discord_user, "
-            f"user_roles) VALUES (?, ?, ?, ?, ?, ?)",
-            (carrier_name, carrier_id, carrier_position, in_game_carrier_owner, discord_user, user_roles)
+    def _insert(cursor):
+        cursor.execute(
+            f"INSERT INTO tow_truck (carrier_name, carrier_id, carrier_position, in_game_carrier_owner, "
+            f"discord_user) VALUES (?, ?, ?, ?, ?)",
+            (carrier_name, carrier_id, carrier_position, in_game_carrier_owner, discord_user)
         )
+        if discord_user is not None and user_roles:
+            _write_role_snapshot(cursor, discord_user, user_roles)
+        carriers = _select_carriers(cursor, CarrierDbFields.entry_id.value, [cursor.lastrowid])
+        after_commit(lambda: carrier_mirror.put(*carriers))
+        return carriers
 
-        infraction_conn.commit()
-
-    finally:
-        infraction_db_lock.release()
+    await _run_write(_insert)
 
     print(f"Carrier {carrier_id} inserted into database")
 
 
-async def find_carrier(searchterm1, searchcolumn1, searchterm2=None, searchcolumn2=None):
-    print(f"Called find_carrier with {searchterm1}, {searchcolumn1}, {searchterm2}, {searchcolumn2}")
+@instrumented
+async def insert_carriers(carriers):
+    """
+    Inserts many carriers into the tow truck table in a single transaction.
 
-    # Building the SQL query and the tuple of parameters
-    sql = "SELECT * FROM tow_truck WHERE "
-    params = []
+    :param list carriers: dicts of insert_carrier's arguments, one per carrier
+    :returns: The number of carriers inserted
+    :rtype: int
+    """
+    carriers = list(carriers)
+    rows = [
+        (carrier['carrier_name'], carrier['carrier_id'], carrier['carrier_position'],
+         carrier['in_game_carrier_owner'], carrier.get('discord_user'))
+        for carrier in carriers
+    ]
+    print(f'Inserting {len(rows)} carriers')
+    if not rows:
+        return 0
+
+    def _insert(cursor):
+        cursor.executemany(
+            "INSERT INTO tow_truck (carrier_name, carrier_id, carrier_position, in_game_carrier_owner, "
+            "discord_user) VALUES (?, ?, ?, ?, ?)",
+            rows
+        )
+        for carrier in carriers:
+            if carrier.get('discord_user') is not None and carrier.get('user_roles'):
+                _write_role_snapshot(cursor, carrier['discord_user'], carrier['user_roles'])
+        inserted_carriers = _select_carriers(cursor, CarrierDbFields.carrier_id.value, [row[1] for row in rows])
+        after_commit(lambda: carrier_mirror.put(*inserted_carriers))
+        return inserted_carriers
 
-    # Handling the first column and term
-    if searchcolumn1 in [CarrierDbFields.entry_id.value, CarrierDbFields.carrier_id.value,
-                         CarrierDbFields.discord_user.value]:
-        sql += f"{searchcolumn1} = ?"
-        params.append(searchterm1)
-    else:
-        sql += f"{searchcolumn1} LIKE ?"
-        params.append(f"%{searchterm1}%")
-
-    # Handling the second column and term (if provided)
-    if searchterm2 is not None and searchcolumn2 is not None:
-        if searchcolumn2 in [CarrierDbFields.entry_id.value, CarrierDbFields.carrier_id.value,
-                             CarrierDbFields.discord_user.value]:
-            sql += f" AND {searchcolumn2} = ?"
-            params.append(searchterm2)
-        else:
-            sql += f" AND {searchcolumn2} LIKE ?"
-            params.append(f"%{searchterm2}%")
+    inserted_carriers = await _run_write(_insert)
+    inserted = len(inserted_carriers)
 
-    # Executing the SQL statement
-    infraction_db.execute(sql, tuple(params))
+    print(f"{inserted} carriers inserted into database")
+    return inserted
 
-    carrier_data = [TowTruckData(carrier) for carrier in infraction_db.fetchall()]
-    # for infraction in infraction_data:
-    #     print(infraction)  # calls the __str__ method to print the contents of the instantiated class object
+
+@instrumented
+async def find_carrier(searchterm1, searchcolumn1, searchterm2=None, searchcolumn2=None):
+    print(f"Called find_carrier with {searchterm1}, {searchcolumn1}, {searchterm2}, {searchcolumn2}")
+
+    # ID columns are matched exactly, everything else by substring
+    equals, contains = _search_pairs_to_filters(((searchterm1, searchcolumn1), (searchterm2, searchcolumn2)),
+                                                carrier_text_columns)
+    if _current_transaction.get() is not None:
+        # the mirror only has committed carriers, the transaction's own writes are in the database
+        carrier_data = await query_carriers(contains=contains, **equals)
+    else:
+        carrier_data = carrier_mirror.find(equals, contains)
+    # for carrier in carrier_data:
+    #     print(carrier)  # calls the __str__ method to print the contents of the instantiated class object
 
     return carrier_data
 
 
+@instrumented
 async def delete_carrier(entry_id):
     """
     Function to lookup a carrier by its Primary Key and delete it.
     """
     print(f"Attempting to delete entry {entry_id}.")
-    try:
-        await infraction_db_lock.acquire()
-        infraction_db.execute(f"DELETE FROM tow_truck WHERE entry_id = {entry_id}")
-        infraction_conn.commit()
-    finally:
-        infraction_db_lock.release()
+
+    await delete_carriers([entry_id])
 
     return
 
 
+@instrumented
+async def delete_carriers(entry_ids):
+    """
+    Deletes every carrier in entry_ids in a single transaction.
+
+    :param list entry_ids: Primary keys of the carriers to delete
+    :returns: The number of carriers deleted
+    :rtype: int
+    """
+    entry_ids = list(entry_ids)
+    print(f"Attempting to delete {len(entry_ids)} carriers.")
+    if not entry_ids:
+        return 0
+
+    def _delete(cursor):
+        cursor.executemany("DELETE FROM tow_truck WHERE entry_id = ?", ((entry_id,) for entry_id in entry_ids))
+        after_commit(lambda: carrier_mirror.remove(*entry_ids))
+        return cursor.rowcount
+
+    deleted = await _run_write(_delete)
+    return deleted
+
+
+@instrumented
 async def get_all_carriers():
     print('Getting all carriers')
-    try:
-        await infraction_db_lock.acquire()
-        infraction_db.execute("SELECT * FROM tow_truck")
-        carrier_data = [TowTruckData(carrier) for carrier in infraction_db.fetchall()]
-    finally:
-        infraction_db_lock.release()
+
+    if _current_transaction.get() is None:
+        return carrier_mirror.all()
+
+    def _get_all(cursor):
+        cursor.row_factory = TowTruckData.row_factory
+        cursor.execute("SELECT * FROM tow_truck")
+        return cursor.fetchall()
+
+    carrier_data = await _run_read(_get_all)
 
     return carrier_data
 
 
+@instrumented
 async def edit_carrier(entry_id, carrier_name=None, carrier_id=None, carrier_position=None, in_game_carrier_owner=None,
                        discord_user=None, user_roles=None):
     print(f"Editing infraction with entry ID {entry_id}.")
 
-    try:
-        await infraction_db_lock.acquire()
-
-        # Prepare the SET part of the SQL command
-        updates = []
-        parameters = []
-        if carrier_name is not None:
-            updates.append("carrier_name = ?")
-            parameters.append(carrier_name)
-        if carrier_id is not None:
-            updates.append("carrier_id = ?")
-            parameters.append(carrier_id)
-        if carrier_position is not None:
-            updates.append("carrier_position = ?")
-            parameters.append(carrier_position)
-        if in_game_carrier_owner is not None:
-            updates.append("in_game_carrier_owner = ?")
-            parameters.append(in_game_carrier_owner)
-        if discord_user is not None:
-            updates.append("discord_user = ?")
-            parameters.append(discord_user)
+    # Prepare the SET part of the SQL command
+    updates = []
+    parameters = []
+    if carrier_name is not None:
+        updates.append("carrier_name = ?")
+        parameters.append(carrier_name)
+    if carrier_id is not None:
+        updates.append("carrier_id = ?")
+        parameters.append(carrier_id)
+    if carrier_position is not None:
+        updates.append("carrier_position = ?")
+        parameters.append(carrier_position)
+    if in_game_carrier_owner is not None:
+        updates.append("in_game_carrier_owner = ?")
+        parameters.append(in_game_carrier_owner)
+    if discord_user is not None:
+        updates.append("discord_user = ?")
+        parameters.append(discord_user)
+
+    set_command = ", ".join(updates)
+    parameters.append(entry_id)
+
+    # Check if there is anything to update
+    if not updates and user_roles is None:
+        print("No updates provided.")
+        return False
+
+    def _update(cursor):
+        # Execute the update command
+        if updates:
+            cursor.execute(
+                f"UPDATE tow_truck SET {set_command} WHERE entry_id = ?",
+                tuple(parameters)
+            )
+        # roles live in the carrier's member's snapshot, which they replace
         if user_roles is not None:
-            updates.append("user_roles = ?")
-            parameters.append(user_roles)
+            cursor.execute("SELECT discord_user FROM tow_truck WHERE entry_id = ?", (entry_id,))
+            row = cursor.fetchone()
+            if row and row[0] is not None:
+                _write_role_snapshot(cursor, row[0], user_roles, replace=True)
+        carriers = _select_carriers(cursor, CarrierDbFields.entry_id.value, [entry_id])
+        after_commit(lambda: carrier_mirror.put(*carriers))
+        return carriers
+
+    await _run_write(_update)
 
-        set_command = ", ".join(updates)
-        parameters.append(entry_id)
+    print("Carrier updated.")
+    return True
 
-        # Check if there is anything to update
-        if not updates:
-            print("No updates provided.")
-            return False
 
-        # Execute the update command
-        infraction_db.execute(
-            f"UPDATE tow_truck SET {set_command} WHERE entry_id = ?",
-            tuple(parameters)
+# a towed member's roles from before their impound
+@instrumented
+async def get_role_snapshot(discord_user):
+    """
+    Returns the role IDs a towed member had before they were given the tow truck role, in their original order.
+
+    :param int discord_user: ID of the member
+    :returns: Role IDs, empty if there's no snapshot for the member
+    :rtype: list
+    """
+
+    def _get(cursor):
+        cursor.execute("SELECT role_id FROM tow_truck_role_snapshot WHERE discord_user = ? ORDER BY position",
+                       (discord_user,))
+        return [row[0] for row in cursor.fetchall()]
+
+    return await _run_read(_get)
+
+
+# towed members who held a role
+@instrumented
+async def find_members_with_snapshot_role(role_id):
+    """
+    Returns the IDs of every towed member whose role snapshot includes role_id.
+
+    :param int role_id: ID of the role
+    :rtype: list
+    """
+
+    def _find(cursor):
+        cursor.execute("SELECT discord_user FROM tow_truck_role_snapshot WHERE role_id = ? ORDER BY discord_user",
+                       (role_id,))
+        return [row[0] for row in cursor.fetchall()]
+
+    return await _run_read(_find)
+
+
+''' -- Forum Thread Index -- '''
+
+
+@instrumented
+async def get_thread_index():
+    """
+    Returns the persisted member ID -> infraction thread ID index.
+
+    :rtype: dict
+    """
+
+    def _get(cursor):
+        cursor.execute("SELECT discord_user, thread_id FROM forum_threads")
+        return {discord_user: thread_id for discord_user, thread_id in cursor.fetchall()}
+
+    return await _run_read(_get)
+
+
+@instrumented
+async def save_thread_index(threads, replace=True):
+    """
+    Persists member ID -> thread ID entries.
+
+    :param dict threads: discord_user: thread_id
+    :param bool replace: Overwrite members already indexed, otherwise only add new members
+    :returns: The number of entries written
+    :rtype: int
+    """
+    rows = list(threads.items())
+    if not rows:
+        return 0
+
+    def _save(cursor):
+        cursor.executemany(
+            f"INSERT OR {'REPLACE' if replace else 'IGNORE'} INTO forum_threads(discord_user, thread_id) VALUES (?, ?)",
+            rows
         )
-        infraction_conn.commit()
+        return cursor.rowcount
 
-    finally:
-        infraction_db_lock.release()
+    return await _run_write(_save)
 
-    print("Carrier updated.")
-    return True
+
+@instrumented
+async def delete_thread_index(thread_ids):
+    """
+    Removes every entry pointing at the given threads from the persisted index.
+
+    :param list thread_ids: IDs of the threads
+    :returns: The number of entries removed
+    :rtype: int
+    """
+    thread_ids = list(thread_ids)
+    if not thread_ids:
+        return 0
+
+    def _delete(cursor):
+        cursor.executemany("DELETE FROM forum_threads WHERE thread_id = ?", ((thread_id,) for thread_id in thread_ids))
+        return cursor.rowcount
+
+    return await _run_write(_delete)
+
+
+@instrumented
+async def get_thread_crawl_state(forum_id):
+    """
+    Returns the archived thread crawl's checkpoint for a forum channel.
+
+    :param int forum_id: ID of the forum channel
+    :returns: resume_before, pending_high_water and high_water, each None if not set
+    :rtype: dict
+    """
+
+    def _get(cursor):
+        cursor.execute("SELECT resume_before, pending_high_water, high_water FROM thread_crawl_state "
+                       "WHERE forum_id = ?", (forum_id,))
+        row = cursor.fetchone()
+        return dict(zip(('resume_before', 'pending_high_water', 'high_water'), row or (None, None, None)))
+
+    return await _run_read(_get)
+
+
+@instrumented
+async def save_thread_crawl_state(forum_id, resume_before, pending_high_water, high_water):
+    """
+    Records the archived thread crawl's checkpoint for a forum channel, see get_thread_crawl_state.
+    """
+
+    def _save(cursor):
+        cursor.execute(
+            "INSERT INTO thread_crawl_state(forum_id, resume_before, pending_high_water, high_water) "
+            "VALUES (?, ?, ?, ?) ON CONFLICT(forum_id) DO UPDATE SET resume_before = excluded.resume_before, "
+            "pending_high_water = excluded.pending_high_water, high_water = excluded.high_water",
+            (forum_id, resume_before, pending_high_water, high_water)
+        )
+
+    await _run_write(_save)
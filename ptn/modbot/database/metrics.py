@@ -0,0 +1,244 @@
+"""
+Instrumentation for the database functions in ptn.modbot.database.database.
+
+Every public database function is wrapped with @instrumented, which records how long the call took in total, how long
+its jobs waited for the writer or a reader thread (the database's lock wait), how long they spent executing and how
+many rows they touched. Timings go into rolling histograms per function for /db_stats, and calls slower than
+DB_SLOW_QUERY_MS are logged with the SQL they ran and the shape of its parameters.
+
+Depends on: constants
+"""
+
+# libraries
+import bisect
+import collections
+import contextvars
+import functools
+import sqlite3
+import time
+
+# local constants
+import ptn.modbot.constants as constants
+
+
+class RollingHistogram:
+    """
+    Millisecond timings bucketed over a rolling window, split into slices that expire one at a time.
+    """
+    # bucket upper bounds in milliseconds, anything slower lands in a final overflow bucket
+    bounds = (0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+    def __init__(self, window, slices=60):
+        self.slice_seconds = window / slices
+        self.slices = collections.deque(maxlen=slices)  # [slice index, bucket counts, count, total, max]
+
+    def record(self, ms):
+        index = int(time.monotonic() // self.slice_seconds)
+        if not self.slices or self.slices[-1][0] != index:
+            self.slices.append([index, [0] * (len(self.bounds) + 1), 0, 0.0, 0.0])
+        current = self.slices[-1]
+        current[1][bisect.bisect_left(self.bounds, ms)] += 1
+        current[2] += 1
+        current[3] += ms
+        current[4] = max(current[4], ms)
+
+    def snapshot(self):
+        """
+        Returns count, mean, p50, p95, p99 and max over the window. Percentiles are bucket upper bounds.
+
+        :rtype: dict
+        """
+        oldest = int(time.monotonic() // self.slice_seconds) - self.slices.maxlen + 1
+        live = [current for current in self.slices if current[0] >= oldest]
+        buckets = [sum(counts) for counts in zip(*(current[1] for current in live))] if live else []
+        count = sum(current[2] for current in live)
+        maximum = max((current[4] for current in live), default=0.0)
+        summary = {'count': count, 'mean': sum(current[3] for current in live) / count if count else 0.0,
+                   'max': maximum}
+
+        for name, fraction in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99)):
+            target = fraction * count
+            seen = 0
+            summary[name] = 0.0
+            for bucket, bucket_count in enumerate(buckets):
+                seen += bucket_count
+                if count and seen >= target:
+                    summary[name] = min(self.bounds[bucket], maximum) if bucket < len(self.bounds) else maximum
+                    break
+        return summary
+
+
+class CallStats:
+    # what one instrumented call's jobs did, filled in on the database threads
+    __slots__ = ('wait', 'execute', 'rows', 'sql', 'params')
+
+    def __init__(self):
+        self.wait = 0.0
+        self.execute = 0.0
+        self.rows = 0
+        self.sql = None
+        self.params = None
+
+
+class TracingCursor(sqlite3.Cursor):
+    """
+    Cursor that remembers the last statement it ran and counts the rows it fetched or changed.
+    """
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.last_sql = None
+        self.last_params = None
+        self.rows = 0
+
+    def execute(self, sql, parameters=()):
+        self.last_sql, self.last_params = sql, parameters
+        super().execute(sql, parameters)
+        if self.rowcount > 0:
+            self.rows += self.rowcount
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self.last_sql, self.last_params = sql, 'many'
+        super().executemany(sql, seq_of_parameters)
+        if self.rowcount > 0:
+            self.rows += self.rowcount
+        return self
+
+    def fetchone(self):
+        row = super().fetchone()
+        if row is not None:
+            self.rows += 1
+        return row
+
+    def fetchmany(self, *args):
+        rows = super().fetchmany(*args)
+        self.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        self.rows += len(rows)
+        return rows
+
+
+def _params_shape(params):
+    # the types of a statement's parameters, never their values, which can be members' IDs and warning reasons
+    if params == 'many':
+        return 'executemany'
+    if isinstance(params, dict):
+        return '{' + ', '.join(f'{key}: {type(value).__name__}' for key, value in params.items()) + '}'
+    return '(' + ', '.join(type(value).__name__ for value in params) + ')'
+
+
+class DatabaseMetrics:
+    """
+    Rolling per-function timings and the most recent slow calls, for /db_stats.
+    """
+
+    def __init__(self, window, slow_ms, slow_log_size=20):
+        self.window = window
+        self.slow_ms = slow_ms
+        self.functions = {}
+        self.slow_calls = collections.deque(maxlen=slow_log_size)
+
+    def record(self, name, total_ms, call=None, failed=False):
+        """
+        Records one finished call. Only ever called from the event loop.
+        """
+        metrics = self.functions.get(name)
+        if metrics is None:
+            metrics = self.functions[name] = {
+                'total': RollingHistogram(self.window), 'wait': RollingHistogram(self.window),
+                'execute': RollingHistogram(self.window), 'rows': 0, 'errors': 0
+            }
+        metrics['total'].record(total_ms)
+        if call is not None:
+            metrics['wait'].record(call.wait * 1000)
+            metrics['execute'].record(call.execute * 1000)
+            metrics['rows'] += call.rows
+        if failed:
+            metrics['errors'] += 1
+
+        if total_ms >= self.slow_ms:
+            sql = ' '.join(call.sql.split()) if call is not None and call.sql else None
+            params = _params_shape(call.params) if call is not None and call.params is not None else None
+            wait_ms = call.wait * 1000 if call is not None else 0.0
+            execute_ms = call.execute * 1000 if call is not None else 0.0
+            rows = call.rows if call is not None else 0
+            self.slow_calls.append({'function': name, 'time': int(time.time()), 'total_ms': total_ms,
+                                    'wait_ms': wait_ms, 'execute_ms': execute_ms, 'rows': rows, 'sql': sql,
+                                    'params': params})
+            print(f"Slow database call {name}: {total_ms:.1f}ms (waited {wait_ms:.1f}ms, executed "
+                  f"{execute_ms:.1f}ms, {rows} rows) SQL: {sql} params: {params}")
+
+    def stats(self):
+        """
+        Returns a snapshot of every function's timings over the window, and the recent slow calls.
+
+        :rtype: dict
+        """
+        functions = {}
+        for name, metrics in self.functions.items():
+            total = metrics['total'].snapshot()
+            if not total['count']:
+                continue
+            functions[name] = {'total': total, 'wait': metrics['wait'].snapshot(),
+                               'execute': metrics['execute'].snapshot(), 'rows': metrics['rows'],
+                               'errors': metrics['errors']}
+        return {'window': self.window, 'functions': functions, 'slow_calls': list(self.slow_calls)}
+
+
+db_metrics = DatabaseMetrics(constants.DB_STATS_WINDOW, constants.DB_SLOW_QUERY_MS)
+
+# the instrumented call the current task is inside, if any
+_current_call = contextvars.ContextVar('current_call', default=None)
+
+
+def instrumented(func):
+    """
+    Decorator recording an async database function's timings in db_metrics.
+    """
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        parent = _current_call.get()
+        call = CallStats()
+        token = _current_call.set(call)
+        start = time.perf_counter()
+        failed = False
+        try:
+            return await func(*args, **kwargs)
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            _current_call.reset(token)
+            db_metrics.record(func.__name__, (time.perf_counter() - start) * 1000, call, failed)
+            if parent is not None:
+                # e.g. find_infraction -> query_infractions, the outer call did everything the inner one did
+                parent.wait += call.wait
+                parent.execute += call.execute
+                parent.rows += call.rows
+                parent.sql, parent.params = call.sql or parent.sql, call.params or parent.params
+    return wrapper
+
+
+def timed_job(func):
+    # wraps a job so its queue wait, execution time, SQL and rows are recorded against the current call
+    call = _current_call.get()
+    if call is None:
+        return func
+    queued = time.perf_counter()
+
+    def job(cursor, *args, **kwargs):
+        started = time.perf_counter()
+        call.wait += started - queued
+        traced = cursor.connection.cursor(TracingCursor)
+        try:
+            return func(traced, *args, **kwargs)
+        finally:
+            call.execute += time.perf_counter() - started
+            call.rows += traced.rows
+            if traced.last_sql is not None:
+                call.sql, call.params = traced.last_sql, traced.last_params
+    return job
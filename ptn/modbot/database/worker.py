@@ -0,0 +1,366 @@
+"""
+The threads that run database work for ptn.modbot.database.database.
+
+sqlite3 calls block, so database functions hand their work to a thread and await the result: writes go to a single
+dedicated writer thread, lookups to a pool of read-only connections. This keeps slow commits/fsyncs off the event
+loop so they can't stall gateway heartbeats or other interactions.
+
+Depends on: constants
+"""
+
+# libraries
+import asyncio
+import concurrent.futures
+import os
+import pathlib
+import queue
+import sqlite3
+import threading
+import time
+
+# local constants
+import ptn.modbot.constants as constants
+
+
+# on a writer thread, the after-commit callbacks registered by the job running there
+_writer_state = threading.local()
+
+
+class DatabaseWorker:
+    """
+    Runs submitted write jobs on a dedicated thread, the single writer for its connection.
+
+    Jobs that arrive within commit_window seconds of each other are coalesced into one transaction, so a burst of
+    writes costs one commit (and one fsync) instead of one each. Every job runs inside its own savepoint: a job that
+    raises is rolled back on its own and its caller gets the exception, while the rest of the batch still commits.
+    Callers are only resolved once the batch has committed, after the after-commit callbacks of their jobs have been
+    handed to their event loops (see after_commit).
+    """
+
+    def __init__(self, conn, name, commit_window=0.0, max_batch=1):
+        self.conn = conn
+        self.name = name
+        self.commit_window = commit_window  # seconds to wait for more jobs before committing
+        self.max_batch = max_batch  # most jobs coalesced into a single transaction
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._commit_time = 0.0  # moving average of how long a COMMIT takes, in seconds
+        self._last_batch_size = 0
+        self._held_job = None  # a standalone job met while collecting a batch, run next
+
+    def _ensure_started(self):
+        # start lazily so importing this module doesn't spin up a thread
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def _collect_batch(self, first_job):
+        """
+        Gathers jobs queued behind first_job.
+
+        Anything already queued is taken straight away. If the last batch had company (so writers are contending)
+        it also waits for stragglers, but never longer than commit_window or than a commit has recently taken: when
+        commits are cheap there is nothing to save by waiting.
+
+        :returns: The batch and whether a shutdown was requested while collecting
+        :rtype: tuple
+        """
+        batch = [first_job]
+        linger = min(self.commit_window, self._commit_time) if self._last_batch_size > 1 else 0
+        deadline = time.monotonic() + linger
+        while len(batch) < self.max_batch:
+            try:
+                remaining = deadline - time.monotonic()
+                job = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is None:  # shutdown sentinel, finish this batch first
+                return batch, True
+            if getattr(job[0], 'standalone', False):  # can't share a transaction, it goes after this batch
+                self._held_job = job
+                break
+            batch.append(job)
+        return batch, False
+
+    def _run(self):
+        while True:
+            job, self._held_job = self._held_job or self._queue.get(), None
+            if job is None:  # shutdown sentinel
+                break
+
+            if getattr(job[0], 'standalone', False):
+                if job[3].set_running_or_notify_cancel():
+                    self._run_standalone(job)
+                continue
+
+            batch, stopping = self._collect_batch(job)
+
+            # drop jobs whose callers have already given up
+            batch = [job for job in batch if job[3].set_running_or_notify_cancel()]
+            if batch:
+                self._run_batch(batch)
+
+            if stopping:
+                break
+
+    @staticmethod
+    def _call_job(func, cursor, args, kwargs):
+        # runs a job, collecting the callbacks it registers with after_commit. They're dropped if it raises
+        _writer_state.callbacks = callbacks = []
+        try:
+            return func(cursor, *args, **kwargs), callbacks
+        finally:
+            _writer_state.callbacks = None
+
+    @staticmethod
+    def _dispatch(callbacks, loop):
+        # hands a committed job's callbacks to the event loop that submitted it, where the caches they update are
+        # used. Queued before the job's result is, they've run by the time its caller resumes, and they run even if
+        # the caller was cancelled while it waited
+        for callback in callbacks:
+            if loop is None:  # submitted from a plain thread, there's no loop to hand them to
+                callback()
+                continue
+            try:
+                loop.call_soon_threadsafe(callback)
+            except RuntimeError:  # the loop has closed, nothing is left to use the caches
+                pass
+
+    def _run_batch(self, batch):
+        cursor = self.conn.cursor()
+        outcomes = []
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            for func, args, kwargs, future, loop in batch:
+                cursor.execute('SAVEPOINT job')
+                try:
+                    # a cursor per job, so settings like row_factory don't leak between jobs
+                    result, callbacks = self._call_job(func, self.conn.cursor(), args, kwargs)
+                except Exception as e:
+                    cursor.execute('ROLLBACK TO job')
+                    cursor.execute('RELEASE job')
+                    outcomes.append((future, None, e, None, loop))
+                else:
+                    cursor.execute('RELEASE job')
+                    outcomes.append((future, result, None, callbacks, loop))
+
+            commit_start = time.perf_counter()
+            cursor.execute('COMMIT')
+            self._commit_time = 0.8 * self._commit_time + 0.2 * (time.perf_counter() - commit_start)
+            self._last_batch_size = len(batch)
+
+        except Exception as e:
+            # the transaction as a whole failed, so nothing in this batch was written
+            if self.conn.in_transaction:
+                self.conn.rollback()
+            print(f'{self.name}: batch of {len(batch)} write(s) failed: {e}')
+            for job in batch:
+                job[3].set_exception(e)
+            return
+
+        for future, result, error, callbacks, loop in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                self._dispatch(callbacks, loop)
+                future.set_result(result)
+
+    def _run_standalone(self, job):
+        func, args, kwargs, future, loop = job
+        try:
+            result, callbacks = self._call_job(func, self.conn.cursor(), args, kwargs)
+        except Exception as e:
+            if self.conn.in_transaction:
+                self.conn.rollback()
+            future.set_exception(e)
+        else:
+            self._dispatch(callbacks, loop)
+            future.set_result(result)
+
+    def submit_standalone(self, func, *args, **kwargs):
+        """
+        Queues func(cursor, *args, **kwargs) to run on the worker thread on its own, outside any transaction, for
+        statements that can't run inside one (VACUUM, wal_checkpoint).
+
+        :returns: A future resolved with the callable's return value or exception
+        :rtype: concurrent.futures.Future
+        """
+        def standalone(cursor, *args, **kwargs):
+            return func(cursor, *args, **kwargs)
+        standalone.standalone = True
+        return self.submit(standalone, *args, **kwargs)
+
+    async def run_standalone(self, func, *args, **kwargs):
+        """
+        Runs a standalone job (see submit_standalone) on the worker thread and awaits its result.
+        """
+        return await asyncio.wrap_future(self.submit_standalone(func, *args, **kwargs))
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Queues func(cursor, *args, **kwargs) to run on the worker thread inside a write transaction.
+
+        :returns: A future resolved with the callable's return value or exception once its batch commits
+        :rtype: concurrent.futures.Future
+        """
+        self._ensure_started()
+        future = concurrent.futures.Future()
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        self._queue.put((func, args, kwargs, future, loop))
+        return future
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Runs a write job on the worker thread and awaits its committed result without blocking the event loop.
+        """
+        return await asyncio.wrap_future(self.submit(func, *args, **kwargs))
+
+    def stop(self, timeout=None):
+        """
+        Lets queued jobs finish, then stops the worker thread.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout)
+
+
+def open_readonly_connection(db_path):
+    """
+    Opens a read-only, mmap-backed connection to db_path. Reads never take the write lock and can't modify the file.
+
+    :param str db_path: Path to the database file
+    :rtype: sqlite3.Connection
+    """
+    uri = pathlib.Path(db_path).resolve().as_uri() + '?mode=ro'
+    conn = sqlite3.connect(uri, uri=True, check_same_thread=False, cached_statements=constants.DB_STATEMENT_CACHE_SIZE)
+    conn.row_factory = sqlite3.Row
+    conn.execute(f'PRAGMA mmap_size = {int(constants.DB_MMAP_SIZE)}')
+    if db_path == constants.INFRACTIONS_DB_PATH and os.path.exists(constants.ARCHIVE_DB_PATH):
+        # full history reads union in the archive
+        archive_uri = pathlib.Path(constants.ARCHIVE_DB_PATH).resolve().as_uri() + '?mode=ro'
+        conn.execute("ATTACH DATABASE ? AS archive", (archive_uri,))
+    return conn
+
+
+class DatabaseReaderPool:
+    """
+    A small pool of threads, each holding its own read-only connection.
+
+    With WAL journaling readers see the last committed state and never wait behind the writer, so lookups can run
+    concurrently with each other and with commits on the worker thread.
+    """
+
+    def __init__(self, db_path, size, name):
+        self.db_path = db_path
+        self.size = size
+        self._local = threading.local()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=size, thread_name_prefix=name)
+
+    def _connection(self):
+        # one connection per pool thread, opened on first use
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = open_readonly_connection(self.db_path)
+            self._local.conn = conn
+        return conn
+
+    def _call(self, func, args, kwargs):
+        return func(self._connection().cursor(), *args, **kwargs)
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Runs func(cursor, *args, **kwargs) on a pool thread with that thread's read-only cursor.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._call, func, args, kwargs)
+
+    def stop(self):
+        self._executor.shutdown(wait=True)
+
+
+class TransactionRolledBack(Exception):
+    """
+    Raised on the worker thread to abandon a DatabaseTransaction's savepoint.
+    """
+    pass
+
+
+class DatabaseTransaction:
+    """
+    A write transaction held open on the worker thread for the duration of an `async with transaction():` block.
+
+    The transaction runs as a single job on the worker, so everything issued inside the block shares one commit and
+    is rolled back together if the block raises. Use transaction() rather than creating one directly.
+    """
+
+    def __init__(self, worker):
+        self._worker = worker
+        self._ops = queue.Queue()
+        self._session_future = None
+
+    def _session(self, cursor):
+        # runs on the worker thread until the block exits, executing each op as it arrives
+        while True:
+            op = self._ops.get()
+            if op is None:  # block finished cleanly, let the worker commit
+                return
+            if op is TransactionRolledBack:
+                raise TransactionRolledBack()
+
+            func, args, kwargs, future = op
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            # a failed statement only undoes itself, whether that sinks the transaction is up to the caller. Its
+            # after-commit callbacks join the session's, which the worker dispatches when the block commits
+            callbacks = _writer_state.callbacks
+            registered = len(callbacks)
+            cursor.execute('SAVEPOINT op')
+            try:
+                result = func(cursor.connection.cursor(), *args, **kwargs)
+            except Exception as e:
+                cursor.execute('ROLLBACK TO op')
+                cursor.execute('RELEASE op')
+                del callbacks[registered:]
+                future.set_exception(e)
+            else:
+                cursor.execute('RELEASE op')
+                future.set_result(result)
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Runs func(cursor, *args, **kwargs) inside this transaction and awaits its (uncommitted) result.
+        """
+        future = concurrent.futures.Future()
+        self._ops.put((func, args, kwargs, future))
+        return await asyncio.wrap_future(future)
+
+    def begin(self):
+        self._session_future = self._worker.submit(self._session)
+
+    async def end(self, commit):
+        """
+        Closes the block: commits if commit is True, otherwise rolls everything back.
+        """
+        self._ops.put(None if commit else TransactionRolledBack)
+        try:
+            await asyncio.wrap_future(self._session_future)
+        except TransactionRolledBack:
+            return
+
+
+def after_commit(callback):
+    """
+    Runs callback on the event loop once the write job calling this has committed, or when the enclosing transaction
+    commits. Call it from inside the job: the callback is tied to the commit on the worker rather than to the task
+    awaiting it, so cancelling that task can't leave the caches out of step with the database.
+    """
+    callbacks = getattr(_writer_state, 'callbacks', None)
+    if callbacks is None:
+        raise RuntimeError('after_commit is only for write jobs running on the database worker')
+    callbacks.append(callback)
@@ -0,0 +1,73 @@
+"""
+Command line export of the infractions database, for pulling data out without the bot running.
+
+Usage:
+    modbot-export [--table infractions] [--format ndjson] [--output FILE] [--member ID] [--moderator ID] [--rule N]
+                  [--since YYYY-MM-DD] [--until YYYY-MM-DD] [--full-history]
+
+Depends on: constants, database
+"""
+
+# import libraries
+import argparse
+import contextlib
+import sys
+
+# the bot's modules print progress as they load, keep stdout clean for the export itself
+with contextlib.redirect_stdout(sys.stderr):
+    # import database functions
+    from ptn.modbot.database.database import export_formats, query_tables, write_export, archive_exists
+
+    # local modules
+    from ptn.modbot.modules.DateString import date_to_posix
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Export ModBot infractions or the tow lot as gzipped NDJSON or CSV.')
+    parser.add_argument('--table', choices=list(query_tables), default='infractions')
+    parser.add_argument('--format', dest='export_format', choices=export_formats, default='ndjson')
+    parser.add_argument('--output', help='File to write, defaults to stdout')
+    parser.add_argument('--member', type=int, help='Only rows for this member ID')
+    parser.add_argument('--moderator', type=int, help='Only infractions given by this moderator ID')
+    parser.add_argument('--rule', type=int, help='Only infractions for this rule number')
+    parser.add_argument('--since', type=date_to_posix, help='Only infractions on or after this date, YYYY-MM-DD')
+    parser.add_argument('--until', type=date_to_posix, help='Only infractions before this date, YYYY-MM-DD')
+    parser.add_argument('--full-history', action='store_true', help='Include archived infractions')
+    return parser.parse_args(argv)
+
+
+def run(argv=None):
+    args = parse_args(argv)
+
+    filters = {'equals': {}}
+    if args.table == 'infractions':
+        if args.member:
+            filters['equals']['warned_user'] = args.member
+        if args.moderator:
+            filters['equals']['warning_moderator'] = args.moderator
+        if args.rule is not None:
+            filters['equals']['rule_broken'] = args.rule
+        filters['since'] = args.since
+        filters['until'] = args.until
+        filters['full_history'] = args.full_history
+        if args.full_history and not archive_exists():
+            sys.exit('--full-history needs the infraction archive, and there is none yet: nothing has been archived')
+    else:
+        if args.moderator or args.rule is not None or args.since or args.until or args.full_history:
+            sys.exit('The tow lot can only be filtered by --member')
+        if args.member:
+            filters['equals']['discord_user'] = args.member
+
+    if args.output:
+        with open(args.output, 'wb') as output:
+            row_count = write_export(output, args.table, args.export_format, **filters)
+    else:
+        row_count = write_export(sys.stdout.buffer, args.table, args.export_format, **filters)
+    print(f'Exported {row_count} row(s) from {args.table}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    """
+    If running via `python -m ptn.modbot.export`
+    """
+    run()
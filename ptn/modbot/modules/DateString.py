@@ -5,7 +5,7 @@ Depends on: none
 """
 
 # import libraries
-from datetime import datetime
+from datetime import datetime, timezone
 import time
 
 
@@ -26,3 +26,27 @@ def get_formatted_date_string():
     print(f"Current time string: {current_time_string}")
 
     return current_time_string, posix_time_string
+
+
+# convert a YYYY-MM-DD date to a POSIX timestamp
+def date_to_posix(date_string: str):
+    """
+    Returns the POSIX timestamp of midnight UTC on a YYYY-MM-DD date, raising ValueError if it isn't one.
+
+    :param str date_string: The date, as YYYY-MM-DD
+    :rtype: int
+    """
+    return int(datetime.strptime(date_string, '%Y-%m-%d').replace(tzinfo=timezone.utc).timestamp())
+
+
+# the YYYY-MM month some number of months ago, as used by the monthly statistics tables
+def month_string(months_ago: int = 0):
+    """
+    Returns the UTC month months_ago months before this one, as YYYY-MM.
+
+    :param int months_ago: How many months back, 0 for this month
+    :rtype: str
+    """
+    dt_now = datetime.utcnow()
+    year, month = divmod(dt_now.year * 12 + dt_now.month - 1 - months_ago, 12)
+    return f'{year:04d}-{month + 1:02d}'
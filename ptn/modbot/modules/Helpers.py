@@ -1,6 +1,8 @@
+import asyncio
 import os
 import re
-from datetime import datetime
+import time
+from datetime import datetime, timezone
 import discord
 from discord import app_commands
 from discord.app_commands import commands
@@ -9,7 +11,8 @@ from ptn.modbot import constants
 from ptn.modbot.bot import bot
 from ptn.modbot.constants import channel_evidence, bot_guild, channel_rules, channel_botspam, forum_channel, \
     EMBED_COLOUR_CAUTION, EMBED_COLOUR_ORANG, EMBED_COLOUR_EVIL, channel_cco_wmm
-from ptn.modbot.database.database import find_infraction, insert_infraction, get_all_carriers
+from ptn.modbot.database.database import find_infraction, insert_infraction, get_all_carriers, count_infractions, \
+    get_thread_index, save_thread_index, delete_thread_index, get_thread_crawl_state, save_thread_crawl_state
 from ptn.modbot.modules.ErrorHandler import CustomError, on_generic_error, CommandRoleError
 
 """
@@ -37,7 +40,142 @@ def create_thread(member: discord.Member, guild: discord.Guild):
         raise CustomError(f"Error in thread creation: {e}")
 
 
-# gets thread by id match in name
+# member ID: thread ID of their infraction thread in the forum channel, active or archived. Persisted to the
+# forum_threads table, and kept current by ModCommands' thread listeners and archived thread crawl
+thread_index = {}
+
+# threads are named '{member name} | {member ID}' by create_thread
+thread_name_pattern = re.compile(r'\|\s*(\d{15,20})\s*$')
+
+
+def thread_member_id(thread: discord.Thread):
+    """
+    Returns the ID of the member an infraction thread is for, read from the end of its name, or None if it isn't one.
+
+    :rtype: int
+    """
+    if thread.parent_id != forum_channel():
+        return None
+    match = thread_name_pattern.search(thread.name)
+    return int(match.group(1)) if match else None
+
+
+async def index_thread(thread: discord.Thread):
+    member_id = thread_member_id(thread)
+    if member_id is not None and thread_index.get(member_id) != thread.id:
+        thread_index[member_id] = thread.id
+        await save_thread_index({member_id: thread.id})
+
+
+async def unindex_thread(thread_id: int):
+    member_ids = [member_id for member_id, indexed_id in thread_index.items() if indexed_id == thread_id]
+    for member_id in member_ids:
+        del thread_index[member_id]
+    if member_ids:
+        await delete_thread_index([thread_id])
+
+
+async def build_thread_index(guild: discord.Guild):
+    """
+    Loads the persisted thread index and indexes every active thread in the forum channel over it. Archived threads
+    are picked up by crawl_archived_threads.
+    """
+    for member_id, thread_id in (await get_thread_index()).items():
+        thread_index.setdefault(member_id, thread_id)
+
+    forum = guild.get_channel(forum_channel())
+    if not forum:
+        print('Forum channel not found, thread index not built')
+        return
+    active = {}
+    for thread in forum.threads:
+        member_id = thread_member_id(thread)
+        if member_id is not None:
+            active[member_id] = thread.id
+    thread_index.update(active)
+    await save_thread_index(active)
+    print(f'Thread index holds {len(thread_index)} members')
+
+
+async def crawl_archived_threads(guild: discord.Guild):
+    """
+    Pages through the forum channel's archived threads, newest archived first, indexing members who aren't indexed
+    yet.
+
+    A checkpoint is saved every THREAD_CRAWL_CHECKPOINT threads, so an interrupted crawl resumes where it stopped.
+    A finished crawl records the newest archive time it saw, and the next crawl stops once it reaches it, so only
+    threads archived since are paged through again.
+
+    :returns: How many archived threads were paged through, and how many members were newly indexed
+    :rtype: tuple
+    """
+    forum = guild.get_channel(forum_channel())
+    if not forum:
+        print('Forum channel not found, archived threads not crawled')
+        return 0, 0
+
+    state = await get_thread_crawl_state(forum.id)
+    high_water = state['high_water']
+    before = None
+    pending_high_water = None
+    if state['resume_before'] is not None:
+        before = datetime.fromtimestamp(state['resume_before'], tz=timezone.utc)
+        pending_high_water = state['pending_high_water']
+        print(f'Resuming archived thread crawl from {before}')
+
+    found = {}
+    crawled = 0
+    indexed = 0
+
+    async def add_found():
+        nonlocal indexed
+        # a member's thread found by the crawl never replaces one already indexed
+        found_now = {member_id: thread_id for member_id, thread_id in found.items() if member_id not in thread_index}
+        thread_index.update(found_now)
+        await save_thread_index(found_now, replace=False)
+        indexed += len(found_now)
+        found.clear()
+
+    async for thread in forum.archived_threads(limit=None, before=before):
+        archived_at = thread.archive_timestamp.timestamp()
+        if high_water is not None and archived_at <= high_water:
+            break  # everything from here on was seen by the last finished crawl
+        if pending_high_water is None:
+            pending_high_water = archived_at
+
+        # newest archived first, so a member's most recently archived thread wins
+        member_id = thread_member_id(thread)
+        if member_id is not None:
+            found.setdefault(member_id, thread.id)
+
+        crawled += 1
+        if crawled % constants.THREAD_CRAWL_CHECKPOINT == 0:
+            await add_found()
+            await save_thread_crawl_state(forum.id, archived_at, pending_high_water, high_water)
+
+    await add_found()
+    await save_thread_crawl_state(forum.id, None, None, pending_high_water or high_water)
+    print(f'Archived thread crawl paged through {crawled} threads, indexed {indexed} members')
+    return crawled, indexed
+
+
+async def resolve_thread(guild: discord.Guild, thread_id: int):
+    """
+    Returns the forum thread with thread_id, from the cache if it's active or from the API if it's archived, or None
+    if it's gone.
+    """
+    thread = guild.get_thread(thread_id)
+    if thread is None:
+        try:
+            thread = await guild.fetch_channel(thread_id)
+        except (discord.NotFound, discord.Forbidden):
+            return None
+    if not isinstance(thread, discord.Thread) or thread.parent_id != forum_channel():
+        return None
+    return thread
+
+
+# gets a member's infraction thread from the thread index, falling back to the thread IDs on their infractions
 async def find_thread(interaction: discord.Interaction, member: discord.Member, guild: discord.Guild):
     # get member info
     member_name = member.name
@@ -46,12 +184,24 @@ async def find_thread(interaction: discord.Interaction, member: discord.Member,
     # get channel info
     print(f'find_thread called for {member_name}')
 
-    evidence_channel = guild.get_channel(forum_channel())
-
-    threads = evidence_channel.threads
-    # print(type(threads))
-    thread = next((thread for thread in threads if str(member_id) in thread.name), None)
-    # print(thread)
+    thread = None
+    thread_id = thread_index.get(member_id)
+    if thread_id:
+        thread = await resolve_thread(guild, thread_id)
+        if thread is None:
+            await unindex_thread(thread_id)
+
+    if thread is None:
+        # newest first, the thread recorded with their latest infraction is the likeliest to still exist
+        infractions = await find_infraction(member_id, 'warned_user')
+        thread_ids = list(dict.fromkeys(infraction.thread_id for infraction in reversed(infractions)
+                                        if infraction.thread_id))
+        for thread_id in thread_ids:
+            thread = await resolve_thread(guild, thread_id)
+            if thread is not None and thread_member_id(thread) == member_id:
+                await index_thread(thread)
+                break
+            thread = None
 
     if thread:
         return thread
@@ -106,10 +256,20 @@ async def display_infractions(interaction: discord.Interaction, member: discord.
         if not infractions:
             embed.description = embed.description + "\nUser has no infractions on record."
         else:
-            for i, infraction in enumerate(infractions, start=1):
+            # an embed holds 25 fields and 6000 characters, so long records show their newest entries and point at
+            # /browse_infractions for the rest
+            shown_from = max(len(infractions) - 24, 0)
+            for i, infraction in enumerate(infractions[shown_from:], start=shown_from + 1):
+                reason = infraction.warning_reason or ''
+                if len(reason) > 150:
+                    reason = reason[:147] + '...'
                 infraction_value = f'<t:{infraction.warning_time}:f> | Rule Broken: {infraction.rule_broken} | Warning ' \
-                                   f'Reason: {infraction.warning_reason}'
+                                   f'Reason: {reason}'
                 embed.add_field(name=f'Infraction {i}', value=infraction_value)
+            if shown_from:
+                embed.description += f'\nShowing the latest 24 of {len(infractions)} infractions, use ' \
+                                     f'`/browse_infractions member:{member.name}` to see them all, archived ' \
+                                     f'ones included.'
 
         await interaction.response.send_message(embed=embed, ephemeral=True)
 
@@ -127,6 +287,48 @@ Used for getting and displaying rules
 """
 
 
+# the rule embeds from the rules message, replaced when ModCommands sees the message edited and refetched once they're
+# older than RULES_CACHE_TTL as a safety net for missed edits
+rules_cache = {'embeds': None, 'fetched_at': 0.0}
+
+# so a burst of lookups after the cache expires only fetches the message once
+rules_cache_lock = asyncio.Lock()
+
+
+async def get_rule_embeds(guild: discord.Guild, refresh: bool = False):
+    """
+    Returns the rule embeds from the rules message, fetching it only if the cache is empty, expired or refresh is set.
+
+    :rtype: list
+    """
+    def fresh():
+        return (rules_cache['embeds'] is not None
+                and time.monotonic() - rules_cache['fetched_at'] < constants.RULES_CACHE_TTL)
+
+    if not refresh and fresh():
+        return rules_cache['embeds']
+
+    async with rules_cache_lock:
+        if refresh or not fresh():
+            print('Fetching rules message')
+            # get rule channel from guild
+            rules_channel_object = guild.get_channel(channel_rules())
+
+            # fetch rules message from rules channel
+            rules_message = await rules_channel_object.fetch_message(constants.rules_message())
+            update_rules_cache(rules_message.embeds)
+    return rules_cache['embeds']
+
+
+def update_rules_cache(embeds):
+    rules_cache['embeds'] = list(embeds)
+    rules_cache['fetched_at'] = time.monotonic()
+
+
+def invalidate_rules_cache():
+    rules_cache['embeds'] = None
+
+
 async def rule_check(rule_number: int, interaction: discord.Interaction):
     if rule_number <= 0:
         try:
@@ -136,14 +338,8 @@ async def rule_check(rule_number: int, interaction: discord.Interaction):
 
     guild = interaction.channel.guild
 
-    # get rule channel from guild
-    rules_channel_object = guild.get_channel(channel_rules())
-
-    # fetch rules message from rules channel
-    rules_message = await rules_channel_object.fetch_message(constants.rules_message())
-
-    # get the rule embeds from the message
-    rules_list = rules_message.embeds
+    # get the rule embeds from the rules message
+    rules_list = await get_rule_embeds(guild)
 
     # get the rule
     try:
@@ -162,14 +358,8 @@ async def get_rule(rule_number: int, interaction: discord.Interaction, member: d
 
     guild = interaction.channel.guild
 
-    # get rule channel from guild
-    rules_channel_object = guild.get_channel(channel_rules())
-
-    # fetch rules message from rules channel
-    rules_message = await rules_channel_object.fetch_message(constants.rules_message())
-
-    # get the rule embeds from the message
-    rules_list = rules_message.embeds
+    # get the rule embeds from the rules message
+    rules_list = await get_rule_embeds(guild)
 
     # get the rule
     try:
@@ -211,9 +401,8 @@ async def warn_user(warned_user: discord.Member, interaction: discord.Interactio
     spamchannel = interaction.guild.get_channel(channel_botspam())
     evidence_channel = interaction.guild.get_channel(channel_evidence())
 
-    # find and count previous infractions
-    infractions = await find_infraction(warned_user.id, 'warned_user')
-    current_infraction_number = len(infractions) + 1
+    # count previous infractions
+    current_infraction_number = await count_infractions(warned_user.id) + 1
 
     # handle thread (find if exists, create if not)
     try:
@@ -221,8 +410,9 @@ async def warn_user(warned_user: discord.Member, interaction: discord.Interactio
         # print(thread)
 
         if not thread:
-            await create_thread(member=warned_user, guild=interaction.guild)
-            thread = await find_thread(interaction, warned_user, guild=interaction.guild)
+            created = await create_thread(member=warned_user, guild=interaction.guild)
+            thread = created.thread
+            await index_thread(thread)
             ping_message = await thread.send('Ghost pinging...')
             await ping_message.edit(content=f'{interaction.guild.get_role(constants.role_mod()).mention}')
             print(f"Created thread with id {thread.id}")
@@ -538,32 +728,6 @@ async def build_or_update_tow_truck_pin_embed(interaction: discord.Interaction):
         await message.pin(reason='Tow Truck Embed')
 
 
-# get return the carrier object with the largest number of roles
-def find_largest_user_roles(carriers):
-    def numerical_value_of_roles(roles):
-        # Split the string into individual numbers and convert them to integers
-        return [int(role) for role in roles.split(',')]
-
-    def compare_roles(roles1, roles2):
-        # Compare two sequences of numbers
-        for a, b in zip(roles1, roles2):
-            if a != b:
-                return a - b
-        return 0
-
-    largest_carrier = None
-    largest_roles = []
-
-    for carrier in carriers:
-        current_roles = numerical_value_of_roles(carrier.user_roles)
-
-        if largest_carrier is None or compare_roles(current_roles, largest_roles) > 0:
-            largest_carrier = carrier
-            largest_roles = current_roles
-
-    return largest_carrier
-
-
 def member_or_member_id(input: str):
     regex_mention_pattern = r"<@!?(\d+)>"
     regex_id_pattern = r'\d{18}'
@@ -60,6 +60,7 @@ setup(
     entry_points={
         'console_scripts': [
             'modbot=ptn.modbot.application:run',
+            'modbot-export=ptn.modbot.export:run',
         ],
     },
     license='None',
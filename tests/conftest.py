@@ -0,0 +1,22 @@
+"""
+Shared fixtures: a throwaway database, built by build_database_on_startup just as the bot builds its own.
+
+Run from the repository root with `python -m pytest -q`.
+"""
+
+# libraries
+import pytest
+
+from benchmarks import _env  # noqa: F401, before ptn.modbot
+
+import ptn.modbot.database.database as database  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def db():
+    database.build_database_on_startup()
+    # build_database_on_startup prints errors rather than raising them, so check it got all the way through
+    latest = max(migration['version'] for migration in database.database_migrations)
+    assert database.infraction_conn.execute('PRAGMA user_version').fetchone()[0] == latest
+    assert database.archive_attached
+    return database
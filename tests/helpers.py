@@ -0,0 +1,55 @@
+"""
+Helpers shared by the database tests.
+"""
+
+# libraries
+import asyncio
+import datetime
+from unittest import mock
+
+import discord
+
+import ptn.modbot.constants as constants
+
+YEAR = 365 * 86400
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+class FakeGuild:
+    """
+    The parts of discord.Guild the thread helpers use: active threads from the cache, anything else fetched.
+    """
+
+    def __init__(self, active=(), archived=(), forum=None):
+        self.active = {thread.id: thread for thread in active}
+        self.archived = {thread.id: thread for thread in archived}
+        self.forum = forum
+        self.fetched = []
+
+    def get_thread(self, thread_id):
+        return self.active.get(thread_id)
+
+    async def fetch_channel(self, thread_id):
+        self.fetched.append(thread_id)
+        if thread_id not in self.archived:
+            raise discord.NotFound(mock.Mock(status=404, reason='Not Found'), 'Unknown Channel')
+        return self.archived[thread_id]
+
+    def get_channel(self, channel_id):
+        return self.forum if self.forum is not None and channel_id == constants.forum_channel() else None
+
+
+def forum_thread(thread_id, member_id, parent_id=None, archived_at=None):
+    """
+    A discord.Thread in the infractions forum, named the way create_thread names them.
+    """
+    thread = mock.Mock(spec=discord.Thread)
+    thread.id = thread_id
+    thread.name = f'member{member_id} | {member_id}'
+    thread.parent_id = constants.forum_channel() if parent_id is None else parent_id
+    if archived_at is not None:
+        thread.archive_timestamp = datetime.datetime.fromtimestamp(archived_at, tz=datetime.timezone.utc)
+    return thread
@@ -0,0 +1,99 @@
+"""
+Tests for archiving old infractions into infractions_archive.db and reading them back.
+"""
+
+# libraries
+import sqlite3
+import time
+
+import pytest
+
+from tests.helpers import YEAR, run
+
+
+def test_archived_entry_ids_are_never_reused(db):
+    member = 2001
+    old = int(time.time()) - 2 * YEAR
+    archived = [run(db.insert_infraction(member, 1, old, 1, f'old {i}')) for i in range(3)]
+    newest = run(db.insert_infraction(member, 1, int(time.time()), 1, 'newest'))
+    assert run(db.archive_infractions(older_than_days=365)) >= 3
+
+    # with the newest infraction gone, a rowid table would hand its ID and then the archived ones out again
+    run(db.delete_single_warning(newest))
+    added = [run(db.insert_infraction(member, 1, int(time.time()), 1, f'new {i}')) for i in range(2)]
+
+    assert min(added) > newest
+    record = run(db.find_infraction(member, 'warned_user'))
+    assert [infraction.entry_id for infraction in record] == [*archived, *added]
+    assert run(db.count_infractions(member)) == 5
+
+
+def test_archiving_an_id_already_archived_fails(db):
+    member = 2002
+    entry_id = run(db.insert_infraction(member, 1, int(time.time()) - 2 * YEAR, 1, 'collides'))
+    db.infraction_conn.execute('INSERT INTO archive.infractions(entry_id, warned_user, warning_moderator, '
+                               'warning_time) VALUES (?, ?, 1, 0)', (entry_id, member + 1))
+
+    with pytest.raises(sqlite3.IntegrityError):
+        run(db.archive_infractions(older_than_days=365))
+
+    # the batch rolled back: the hot row is still there and the archived one wasn't overwritten
+    assert [infraction.entry_id for infraction in run(db.query_infractions(warned_user=member))] == [entry_id]
+    archived = run(db.query_infractions(entry_id=entry_id, full_history=True))
+    assert sorted(infraction.warned_user for infraction in archived) == [member, member + 1]
+    run(db.delete_warnings([entry_id]))
+
+
+def test_search_includes_archived_reasons(db):
+    member = 2004
+    run(db.insert_infraction(member, 1, int(time.time()) - 2 * YEAR, 1, 'archived zeppelin'))
+    run(db.insert_infraction(member, 1, int(time.time()), 1, 'recent zeppelin'))
+    run(db.archive_infractions(older_than_days=365))
+
+    results, total = run(db.search_infractions('zeppelin', warned_user=member))
+    assert total == 2
+    assert sorted(infraction.warning_reason for infraction, _ in results) == ['archived zeppelin', 'recent zeppelin']
+
+
+def test_member_record_includes_archived_infractions(db):
+    member = 2007
+    old = run(db.insert_infraction(member, 1, int(time.time()) - 2 * YEAR, 3, 'archived'))
+    run(db.archive_infractions(older_than_days=365))
+
+    assert [infraction.entry_id for infraction in run(db.find_infraction(member, 'warned_user'))] == [old]
+    assert not run(db.query_infractions(warned_user=member))
+    assert run(db.count_infractions(member)) == 1
+
+    # edits and deletes by entry ID reach the archive, cached records included
+    run(db.edit_infraction(old, warning_reason='edited in the archive'))
+    assert run(db.find_infraction(member, 'warned_user'))[0].warning_reason == 'edited in the archive'
+    run(db.delete_single_warning(old))
+    assert not run(db.find_infraction(member, 'warned_user'))
+    assert run(db.count_infractions(member)) == 0
+
+
+def test_purging_a_member_purges_their_archive(db):
+    member = 2008
+    run(db.insert_infraction(member, 1, int(time.time()) - 2 * YEAR, 1, 'archived'))
+    run(db.insert_infraction(member, 1, int(time.time()), 1, 'recent'))
+    run(db.archive_infractions(older_than_days=365))
+
+    run(db.delete_all_warnings_for_user(member))
+    assert not run(db.query_infractions(warned_user=member, full_history=True))
+    assert run(db.count_infractions(member)) == 0
+
+
+def test_full_history_pages_across_the_archive(db):
+    member = 2011
+    now = int(time.time())
+    for i in range(3):
+        run(db.insert_infraction(member, 1, now - 2 * YEAR + i, 1, f'archived {i}'))
+    for i in range(3):
+        run(db.insert_infraction(member, 1, now - i, 1, f'recent {i}'))
+    run(db.archive_infractions(older_than_days=365))
+
+    assert len(run(db.query_infractions(warned_user=member))) == 3
+    pages = [run(db.query_infractions(warned_user=member, full_history=True, order_by='warning_time',
+                                      descending=True, limit=2, offset=offset)) for offset in (0, 2, 4)]
+    assert [infraction.warning_reason for page in pages for infraction in page] == \
+        ['recent 0', 'recent 1', 'recent 2', 'archived 2', 'archived 1', 'archived 0']
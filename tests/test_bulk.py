@@ -0,0 +1,68 @@
+"""
+Tests for the bulk mutations, each one executemany in a single transaction.
+"""
+
+# libraries
+import sqlite3
+import time
+
+import pytest
+
+from tests.helpers import run
+
+
+def carrier(number, discord_user, **extra):
+    return {'carrier_name': f'Bulk {number}', 'carrier_id': f'BLK-{number:03}', 'carrier_position': str(number),
+            'in_game_carrier_owner': 'owner', 'discord_user': discord_user, **extra}
+
+
+def test_delete_and_edit_many_infractions(db):
+    member, other = 2701, 2702
+    entry_ids = [run(db.insert_infraction(member, 1, int(time.time()), 1, f'bulk {i}')) for i in range(4)]
+
+    assert run(db.edit_infractions(entry_ids[:2], thread_id=99, warned_user=other)) == 2
+    moved = run(db.query_infractions(warned_user=other))
+    assert [(infraction.entry_id, infraction.thread_id) for infraction in moved] == [(entry_ids[0], 99),
+                                                                                      (entry_ids[1], 99)]
+    assert (run(db.count_infractions(member)), run(db.count_infractions(other))) == (2, 2)
+
+    assert run(db.delete_warnings([*entry_ids[1:3], 10 ** 9])) == 2
+    assert [infraction.entry_id for infraction in run(db.find_infraction(member, 'warned_user'))] == [entry_ids[3]]
+    assert [infraction.entry_id for infraction in run(db.find_infraction(other, 'warned_user'))] == [entry_ids[0]]
+
+
+def test_edit_infractions_rejects_unknown_columns(db):
+    with pytest.raises(ValueError):
+        run(db.edit_infractions([1], entry_id=2))
+    assert run(db.edit_infractions([1])) == 0
+
+
+def test_delete_all_warnings_for_many_users(db):
+    members = [2703, 2704, 2705]
+    for member in members:
+        for i in range(2):
+            run(db.insert_infraction(member, 1, int(time.time()), 1, f'purged {i}'))
+
+    assert run(db.delete_all_warnings_for_users(members[:2])) == 4
+    assert [run(db.count_infractions(member)) for member in members] == [0, 0, 2]
+    assert run(db.delete_all_warnings_for_users([])) == 0
+
+
+def test_insert_and_delete_many_carriers(db):
+    assert run(db.insert_carriers([carrier(1, 2706, user_roles=[7, 8]), carrier(2, 2707)])) == 2
+    carriers = run(db.query_carriers(carrier_id=['BLK-001', 'BLK-002']))
+    assert [found.discord_user for found in carriers] == [2706, 2707]
+    assert run(db.get_role_snapshot(2706)) == [7, 8]
+
+    assert run(db.delete_carriers([found.entry_id for found in carriers])) == 2
+    assert not run(db.query_carriers(carrier_id=['BLK-001', 'BLK-002']))
+    # the snapshot goes with the member's last carrier
+    assert not run(db.get_role_snapshot(2706))
+
+
+def test_bulk_insert_is_all_or_nothing(db):
+    run(db.insert_carriers([carrier(3, 2708)]))
+    with pytest.raises(sqlite3.IntegrityError):
+        run(db.insert_carriers([carrier(4, 2709), carrier(3, 2710)]))
+    assert not run(db.query_carriers(carrier_id='BLK-004'))
+    assert not run(db.find_carrier(2709, 'discord_user'))
@@ -0,0 +1,78 @@
+"""
+Tests for the infraction cache in front of find_infraction, and its invalidation by writes.
+"""
+
+# libraries
+import asyncio
+import time
+
+from ptn.modbot.database.cache import InfractionCache
+from tests.helpers import run
+
+
+def test_lru_evicts_the_least_recently_used_member():
+    cache = InfractionCache(2)
+    for member in (1, 2):
+        cache.put(member, [member], cache.generation)
+    cache.get(1)
+    cache.put(3, [3], cache.generation)
+
+    assert cache.get(2) is None
+    assert (cache.get(1), cache.get(3)) == ([1], [3])
+
+
+def test_read_overtaken_by_an_invalidation_isnt_cached():
+    cache = InfractionCache(10)
+    generation = cache.generation  # a read starts
+    cache.invalidate(2)  # a write to someone else commits while it runs
+    cache.put(1, ['stale?'], generation)
+    assert cache.get(1) is None
+
+    cache.put(1, ['fresh'], cache.generation)
+    assert cache.get(1) == ['fresh']
+
+
+def test_writes_invalidate_the_member(db):
+    member = 2601
+    entry_id = run(db.insert_infraction(member, 1, int(time.time()), 1, 'first'))
+    run(db.find_infraction(member, 'warned_user'))
+    hits = db.infraction_cache.hits
+    run(db.find_infraction(member, 'warned_user'))
+    assert db.infraction_cache.hits == hits + 1
+
+    run(db.edit_infraction(entry_id, warning_reason='edited'))
+    assert [infraction.warning_reason for infraction in run(db.find_infraction(member, 'warned_user'))] == ['edited']
+
+    run(db.insert_infraction(member, 1, int(time.time()), 1, 'second'))
+    assert len(run(db.find_infraction(member, 'warned_user'))) == 2
+
+    # moving an infraction to someone else invalidates both members
+    other = member + 1
+    run(db.find_infraction(other, 'warned_user'))
+    run(db.edit_infraction(entry_id, warned_user=other))
+    assert len(run(db.find_infraction(member, 'warned_user'))) == 1
+    assert [infraction.entry_id for infraction in run(db.find_infraction(other, 'warned_user'))] == [entry_id]
+
+
+def test_invalidation_survives_a_cancelled_caller(db, monkeypatch):
+    member = 2603
+    entry_id = run(db.insert_infraction(member, 1, int(time.time()), 1, 'deleted'))
+    warned_users_for_entries = db._warned_users_for_entries
+
+    def slow_lookup(cursor, entry_ids):
+        time.sleep(0.2)
+        return warned_users_for_entries(cursor, entry_ids)
+
+    # the delete job is slowed down on the worker, and its caller gives up while it runs
+    monkeypatch.setattr(db, '_warned_users_for_entries', slow_lookup)
+
+    async def cancelled_delete():
+        await db.find_infraction(member, 'warned_user')
+        task = asyncio.create_task(db.delete_warnings([entry_id]))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await asyncio.sleep(0.4)
+        return await db.find_infraction(member, 'warned_user')
+
+    assert run(cancelled_delete()) == []
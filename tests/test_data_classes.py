@@ -0,0 +1,41 @@
+"""
+Tests for InfractionData and TowTruckData built straight from row tuples.
+"""
+
+# libraries
+import pytest
+
+from ptn.modbot.classes.InfractionData import InfractionData
+from ptn.modbot.classes.TowTruckData import TowTruckData
+
+
+@pytest.mark.parametrize('cls, table', [(InfractionData, 'infractions'), (TowTruckData, 'tow_truck')])
+def test_slots_follow_the_table_columns(db, cls, table):
+    # from_row unpacks SELECT * rows positionally, so the slots must stay in column order
+    columns = [row[1] for row in db.infraction_conn.execute(f'PRAGMA table_info({table})')]
+    assert list(cls.__slots__) == columns
+
+
+@pytest.mark.parametrize('cls, table', [(InfractionData, 'infractions'), (TowTruckData, 'tow_truck')])
+def test_row_factory_matches_the_dictionary_constructor(db, cls, table):
+    values = (11, 12, 13, 14, 15, 'text', 17)
+    columns = list(cls.__slots__)
+    row = db.infraction_conn.execute(f"SELECT {', '.join('? AS ' + column for column in columns)}", values).fetchone()
+
+    cursor = db.infraction_conn.cursor()
+    cursor.row_factory = cls.row_factory
+    built = cursor.execute(f"SELECT {', '.join('?' * len(values))}", values).fetchone()
+
+    assert built.to_dictionary() == cls(row).to_dictionary() == dict(zip(columns, values))
+    assert not hasattr(built, '__dict__')
+
+
+def test_empty_objects_are_falsy():
+    assert not InfractionData()
+    assert not TowTruckData.from_row((None,) * len(TowTruckData.__slots__))
+    assert InfractionData.from_row((None, 1, None, None, None, None, None)).to_dictionary() == {'warned_user': 1}
+
+
+def test_from_row_needs_every_column():
+    with pytest.raises(ValueError):
+        InfractionData.from_row((1, 2, 3))
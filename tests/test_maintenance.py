@@ -0,0 +1,76 @@
+"""
+Tests for run_maintenance, the switch to incremental vacuum and the scheduled run times.
+"""
+
+# libraries
+import asyncio
+import sqlite3
+import time
+
+import pytest
+
+from tests.helpers import run
+
+
+@pytest.fixture
+def forget_statistics(db):
+    # PRAGMA optimize analyses whatever rows the other tests left behind, statistics that can turn the index searches
+    # test_query_plans looks for into scans
+    yield
+    for schema in ('main', 'archive'):
+        for table in ('sqlite_stat1', 'sqlite_stat4'):
+            if db.infraction_conn.execute(f"SELECT 1 FROM {schema}.sqlite_master WHERE name = ?", (table,)).fetchone():
+                db.infraction_conn.execute(f'DELETE FROM {schema}.{table}')
+        db.infraction_conn.execute(f'ANALYZE {schema}.sqlite_master')  # reloads the now empty statistics
+
+
+def test_no_budget_skips_every_step(db):
+    report = run(db.run_maintenance(budget_seconds=0))
+    assert report['steps'] == {}
+    assert report['skipped'] == ['optimize', 'incremental vacuum', 'wal checkpoint']
+
+
+def test_maintenance_hands_back_freed_pages(db, forget_statistics):
+    member = 2901
+    for i in range(400):
+        run(db.insert_infraction(member, 1, int(time.time()), 1, f'{i} ' + 'padding ' * 100))
+    run(db.delete_all_warnings_for_user(member))
+    assert db.infraction_conn.execute('PRAGMA freelist_count').fetchone()[0] > 0
+
+    report = run(db.run_maintenance(budget_seconds=30))
+    assert report['skipped'] == []
+    assert report['steps']['incremental vacuum']['freed'] > 0
+    assert report['steps']['incremental vacuum']['remaining'] == 0
+    assert not report['steps']['wal checkpoint']['busy']
+    assert db.infraction_conn.execute('PRAGMA freelist_count').fetchone()[0] == 0
+
+
+def test_maintenance_refuses_to_run_in_a_transaction(db):
+    async def in_transaction():
+        async with db.transaction():
+            await db.run_maintenance()
+
+    with pytest.raises(RuntimeError):
+        run(in_transaction())
+
+
+@pytest.mark.parametrize('limit_mb, switched', [(0, False), (1024, True)])
+def test_startup_vacuum_only_runs_under_the_size_limit(db, tmp_path, monkeypatch, limit_mb, switched):
+    conn = sqlite3.connect(tmp_path / 'vacuum.db', isolation_level=None)
+    conn.execute('CREATE TABLE padding(text TEXT)')
+    conn.executemany('INSERT INTO padding VALUES (?)', (('x' * 1000,) for _ in range(100)))
+    monkeypatch.setattr(db.constants, 'DB_STARTUP_VACUUM_MAX_MB', limit_mb)
+
+    assert db.enable_incremental_vacuum(conn) is switched
+    assert conn.execute('PRAGMA auto_vacuum').fetchone()[0] == (2 if switched else 0)
+    conn.close()
+
+
+def test_scheduled_run_times_are_kept(db):
+    async def roundtrip():
+        assert await db.get_last_scheduled_run('test job') is None
+        await db.save_scheduled_run('test job', 1000.5)
+        await db.save_scheduled_run('test job', 2000.5)
+        return await asyncio.gather(db.get_last_scheduled_run('test job'), db.get_last_scheduled_run('other job'))
+
+    assert run(roundtrip()) == [2000.5, None]
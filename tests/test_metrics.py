@@ -0,0 +1,78 @@
+"""
+Tests for the database instrumentation behind /db_stats.
+"""
+
+# libraries
+import time
+
+import pytest
+
+from ptn.modbot.database import metrics
+from ptn.modbot.database.metrics import CallStats, DatabaseMetrics, RollingHistogram
+from tests.helpers import run
+
+
+def test_histogram_summary():
+    histogram = RollingHistogram(60)
+    for ms in range(1, 101):
+        histogram.record(ms)
+
+    summary = histogram.snapshot()
+    assert (summary['count'], summary['mean'], summary['max']) == (100, 50.5, 100)
+    # percentiles are the upper bounds of the buckets they fall in
+    assert (summary['p50'], summary['p95'], summary['p99']) == (50, 100, 100)
+
+
+def test_histogram_forgets_timings_older_than_its_window(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(metrics.time, 'monotonic', lambda: now[0])
+    histogram = RollingHistogram(60)
+    histogram.record(5)
+    now[0] += 30
+    histogram.record(7)
+    assert histogram.snapshot()['count'] == 2
+
+    now[0] += 45
+    assert histogram.snapshot()['count'] == 1
+    now[0] += 60
+    assert histogram.snapshot() == {'count': 0, 'mean': 0.0, 'max': 0.0, 'p50': 0.0, 'p95': 0.0, 'p99': 0.0}
+
+
+def test_slow_calls_are_logged_without_parameter_values(capsys):
+    db_metrics = DatabaseMetrics(60, slow_ms=100)
+    call = CallStats()
+    call.wait, call.execute, call.rows = 0.02, 0.09, 3
+    call.sql, call.params = 'SELECT *\n    FROM infractions WHERE warned_user = ?', (123456789,)
+    db_metrics.record('fast', 5, call)
+    db_metrics.record('slow', 150, call, failed=True)
+
+    stats = db_metrics.stats()
+    assert sorted(stats['functions']) == ['fast', 'slow']
+    slow = stats['functions']['slow']
+    assert (slow['rows'], slow['errors'], slow['total']['count']) == (3, 1, 1)
+    assert slow['wait']['max'] == pytest.approx(20) and slow['execute']['max'] == pytest.approx(90)
+
+    [logged] = stats['slow_calls']
+    assert logged['function'] == 'slow'
+    assert logged['sql'] == 'SELECT * FROM infractions WHERE warned_user = ?'
+    assert logged['params'] == '(int)'
+    assert '123456789' not in capsys.readouterr().out
+
+
+def test_database_calls_are_recorded(db):
+    member = 2801
+    for i in range(3):
+        run(db.insert_infraction(member, 1, int(time.time()), 1, f'timed {i}'))
+
+    before = db.db_metrics.stats()['functions'].get('query_infractions', {'rows': 0, 'total': {'count': 0}})
+    run(db.query_infractions(warned_user=member))
+    after = db.db_metrics.stats()['functions']['query_infractions']
+    assert after['total']['count'] == before['total']['count'] + 1
+    assert after['rows'] == before['rows'] + 3
+    assert after['execute']['count'] == after['total']['count']
+
+    # a call made inside another is counted against both
+    rows = db.db_metrics.functions.get('find_infraction', {'rows': 0})['rows']
+    db.infraction_cache.invalidate(member)
+    run(db.find_infraction(member, 'warned_user'))
+    assert db.db_metrics.functions['find_infraction']['rows'] == rows + 3
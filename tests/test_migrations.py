@@ -0,0 +1,42 @@
+"""
+Tests for the PRAGMA user_version schema migrations.
+"""
+
+# libraries
+import sqlite3
+import time
+
+import pytest
+
+from tests.helpers import run
+
+
+def latest_version(db):
+    return max(migration['version'] for migration in db.database_migrations)
+
+
+def test_reapplying_every_migration_keeps_the_data(db):
+    member = 2401
+    for i in range(3):
+        run(db.insert_infraction(member, 1, int(time.time()), 2, f'kept {i}'))
+    rows = db.infraction_conn.execute('SELECT * FROM infractions ORDER BY entry_id').fetchall()
+
+    # what startup does after restoring a table
+    db.infraction_conn.execute('PRAGMA user_version = 0')
+    assert db.run_database_migrations(db.infraction_conn) == latest_version(db)
+
+    assert db.infraction_conn.execute('SELECT * FROM infractions ORDER BY entry_id').fetchall() == rows
+    assert run(db.count_infractions(member)) == 3
+    assert run(db.search_infractions('kept', warned_user=member))[1] == 3
+
+
+def test_failed_migration_leaves_the_version_alone(db):
+    version = latest_version(db)
+    failing = [{'version': version + 1, 'description': 'fails half way',
+                'steps': ['CREATE TABLE half_migrated(x)', 'SELECT * FROM no_such_table']}]
+
+    with pytest.raises(sqlite3.OperationalError):
+        db.run_database_migrations(db.infraction_conn, failing)
+
+    assert db.get_database_version(db.infraction_conn) == version
+    assert not db.check_database_table_exists('half_migrated', db.infraction_db)
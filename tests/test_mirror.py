@@ -0,0 +1,103 @@
+"""
+Tests for CarrierMirror, the in-memory tow lot kept current write-through by the carrier write functions.
+"""
+
+# libraries
+import asyncio
+import time
+
+import pytest
+
+from ptn.modbot.classes.TowTruckData import TowTruckData
+from ptn.modbot.database.cache import CarrierMirror
+from tests.helpers import run
+
+
+def mirrored_carrier(entry_id, carrier_id, discord_user, position='Bay 1'):
+    return TowTruckData.from_row((entry_id, f'Carrier {entry_id}', carrier_id, position, 'owner', discord_user, None))
+
+
+def entry_ids(carriers):
+    return [carrier.entry_id for carrier in carriers]
+
+
+def test_find_uses_each_index():
+    mirror = CarrierMirror()
+    mirror.put(mirrored_carrier(1, 'AAA-111', 10), mirrored_carrier(2, 'BBB-222', 10, 'Bay 2'),
+               mirrored_carrier(3, 'CCC-333', 11, 'Bay 2'))
+
+    assert entry_ids(mirror.find({'carrier_id': 'BBB-222'})) == [2]
+    # IDs typed in by a moderator arrive as text
+    assert entry_ids(mirror.find({'discord_user': '10'})) == [1, 2]
+    assert entry_ids(mirror.find({'entry_id': 3, 'discord_user': 10})) == []
+    assert entry_ids(mirror.find(contains={'carrier_position': 'bay 2'})) == [2, 3]
+    assert entry_ids(mirror.find({'discord_user': 'not a number'})) == []
+
+    # replacing a carrier moves it between index entries
+    mirror.put(mirrored_carrier(2, 'DDD-444', 11, 'Bay 2'))
+    assert mirror.find({'carrier_id': 'BBB-222'}) == []
+    assert entry_ids(mirror.find({'discord_user': 11})) == [2, 3]
+    mirror.remove(2, 3, 99)
+    assert (len(mirror), mirror.find({'discord_user': 11})) == (1, [])
+
+
+def test_writes_go_through_to_the_mirror(db):
+    member = 3001
+    run(db.insert_carrier('Mirrored', 'MIR-001', 'Bay 1', 'owner', discord_user=member))
+    [carrier] = run(db.find_carrier(member, 'discord_user'))
+    assert carrier.carrier_id == 'MIR-001'
+
+    run(db.edit_carrier(carrier.entry_id, carrier_id='MIR-002', carrier_position='Bay 3'))
+    assert run(db.find_carrier('MIR-001', 'carrier_id')) == []
+    [edited] = run(db.find_carrier('MIR-002', 'carrier_id'))
+    assert (edited.entry_id, edited.carrier_position) == (carrier.entry_id, 'Bay 3')
+    # the object handed out earlier is left as it was
+    assert carrier.carrier_id == 'MIR-001'
+
+    run(db.delete_carrier(carrier.entry_id))
+    assert run(db.find_carrier(member, 'discord_user')) == []
+
+
+def test_mirror_matches_the_table(db):
+    run(db.insert_carriers([{'carrier_name': f'Mirror {i}', 'carrier_id': f'MIR-1{i:02}', 'carrier_position': 'Bay',
+                             'in_game_carrier_owner': 'owner', 'discord_user': 3002} for i in range(3)]))
+    in_table = db.infraction_conn.execute('SELECT * FROM tow_truck ORDER BY entry_id').fetchall()
+    assert [carrier.to_dictionary() for carrier in run(db.get_all_carriers())] == \
+        [TowTruckData.from_row(tuple(row)).to_dictionary() for row in in_table]
+
+
+def test_rolled_back_writes_never_reach_the_mirror(db):
+    member = 3003
+
+    async def rolled_back():
+        async with db.transaction():
+            await db.insert_carrier('Rolled Back', 'MIR-201', 'Bay 1', 'owner', discord_user=member)
+            # inside the transaction its own writes are read from the database
+            assert entry_ids(await db.find_carrier(member, 'discord_user'))
+            raise RuntimeError('abort')
+
+    with pytest.raises(RuntimeError):
+        run(rolled_back())
+    assert run(db.find_carrier(member, 'discord_user')) == []
+
+
+def test_mirror_updated_when_the_caller_is_cancelled(db, monkeypatch):
+    member = 3004
+    select_carriers = db._select_carriers
+
+    def slow_select(*args):
+        time.sleep(0.2)
+        return select_carriers(*args)
+
+    # the insert is slowed down on the worker, and its caller gives up while it runs
+    monkeypatch.setattr(db, '_select_carriers', slow_select)
+
+    async def cancelled_insert():
+        task = asyncio.create_task(db.insert_carrier('Cancelled', 'MIR-301', 'Bay 1', 'owner', discord_user=member))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await asyncio.sleep(0.4)
+        return await db.find_carrier(member, 'discord_user')
+
+    assert [carrier.carrier_id for carrier in run(cancelled_insert())] == ['MIR-301']
@@ -0,0 +1,60 @@
+"""
+Tests for compile_query and the query functions built on it.
+"""
+
+# libraries
+import time
+
+import pytest
+
+from tests.helpers import run
+
+
+def test_filters_combine(db):
+    member = 2501
+    now = int(time.time())
+    for hours_ago, rule in [(1, 1), (2, 2), (3, 3), (48, 1)]:
+        run(db.insert_infraction(member, 7, now - hours_ago * 3600, rule, f'rule {rule} {hours_ago}h ago'))
+
+    found = run(db.query_infractions(warned_user=member, rule_broken=[1, 2], since=now - 86400,
+                                     order_by='warning_time', descending=True))
+    assert [infraction.warning_reason for infraction in found] == ['rule 1 1h ago', 'rule 2 2h ago']
+
+    found = run(db.query_infractions(warned_user=member, contains={'warning_reason': '48H'}, until=now - 86400))
+    assert [infraction.warning_reason for infraction in found] == ['rule 1 48h ago']
+
+    page = run(db.query_infractions(warned_user=member, order_by='entry_id', limit=2, offset=1))
+    everything = run(db.query_infractions(warned_user=member, order_by='entry_id'))
+    assert [infraction.entry_id for infraction in page] == [infraction.entry_id for infraction in everything[1:3]]
+
+
+def test_query_shape_is_compiled_once(db):
+    first_sql, first_params = db.compile_query('infractions', equals={'warned_user': 1, 'rule_broken': [1, 2]},
+                                               since=10, limit=5)
+    hits = db._query_sql.cache_info().hits
+    # same filters in another order with other values: the same shape
+    second_sql, second_params = db.compile_query('infractions', equals={'rule_broken': [3, 4], 'warned_user': 2},
+                                                 since=20, limit=6)
+    assert second_sql is first_sql
+    assert db._query_sql.cache_info().hits == hits + 1
+    assert (first_params, second_params) == ((1, 2, 1, 10, 5), (3, 4, 2, 20, 6))
+
+
+@pytest.mark.parametrize('filters', [
+    {'equals': {'warned_user = 1 OR 1': 1}},
+    {'contains': {'no_such_column': 'x'}},
+    {'order_by': 'entry_id; DROP TABLE infractions'},
+])
+def test_unknown_columns_are_rejected(db, filters):
+    with pytest.raises(ValueError):
+        db.compile_query('infractions', **filters)
+
+
+def test_invalid_combinations_are_rejected(db):
+    with pytest.raises(ValueError):
+        db.compile_query('tow_truck', since=1)
+    with pytest.raises(ValueError):
+        db.compile_query('tow_truck', full_history=True)
+    with pytest.raises(ValueError):
+        db.compile_query('infractions', order_by=('warning_time', 'entry_id'), seek=(1,))
+
@@ -0,0 +1,55 @@
+"""
+Tests that the lookups the bot makes are answered from the indexes the schema migrations create.
+"""
+
+# libraries
+import pytest
+
+
+def query_plan(db, sql, params):
+    return [row[3] for row in db.infraction_conn.execute(f'EXPLAIN QUERY PLAN {sql}', params)]
+
+
+def assert_searches_index(plan, index):
+    # older SQLite versions word it SEARCH TABLE x USING INDEX, newer ones SEARCH x USING INDEX
+    assert any(step.startswith('SEARCH') and f'INDEX {index} ' in step for step in plan), plan
+
+
+@pytest.mark.parametrize('equals, index', [
+    ({'warned_user': 1}, 'infractions_warned_user_time'),
+    ({'warning_moderator': 1}, 'infractions_moderator_time'),
+])
+def test_infraction_lookups_use_index(db, equals, index):
+    sql, params = db.compile_query('infractions', equals=equals, order_by='entry_id')
+    assert_searches_index(query_plan(db, sql, params), index)
+
+
+def test_member_record_uses_index_in_both_tables(db):
+    sql, params = db.compile_query('infractions', equals={'warned_user': 1}, order_by='entry_id', full_history=True)
+    plan = query_plan(db, sql, params)
+    assert_searches_index(plan, 'infractions_warned_user_time')
+    assert_searches_index(plan, 'archive_warned_user_time')
+
+
+def test_carrier_lookup_by_member_uses_index(db):
+    sql, params = db.compile_query('tow_truck', equals={'discord_user': 1}, order_by='entry_id')
+    assert_searches_index(query_plan(db, sql, params), 'tow_truck_discord_user')
+
+
+@pytest.mark.parametrize('equals, index, archive_index', [
+    ({}, 'infractions_warning_time', 'archive_warning_time'),
+    ({'warning_moderator': 1}, 'infractions_moderator_time', None),
+    ({'warned_user': 1}, 'infractions_warned_user_time', 'archive_warned_user_time'),
+])
+def test_browse_pages_seek_on_index(db, equals, index, archive_index):
+    # the query browse_infractions makes for any page after the first
+    browse = dict(equals=equals, order_by=('warning_time', 'entry_id'), descending=True, seek=(1_700_000_000, 50),
+                  limit=11)
+    sql, params = db.compile_query('infractions', **browse)
+    plan = query_plan(db, sql, params)
+    assert_searches_index(plan, index)
+    assert not any('TEMP B-TREE' in step for step in plan), plan
+
+    if archive_index:
+        sql, params = db.compile_query('infractions', full_history=True, **browse)
+        assert_searches_index(query_plan(db, sql, params), archive_index)
@@ -0,0 +1,89 @@
+"""
+Tests for the cached rule embeds, refetched when they expire and replaced when the rules message is edited.
+"""
+
+# libraries
+import asyncio
+from unittest import mock
+
+import discord
+import pytest
+
+import ptn.modbot.constants as constants
+from tests.helpers import run
+
+
+class RulesGuild:
+    """
+    A guild whose rules channel counts how often the rules message is fetched.
+    """
+
+    def __init__(self, *titles):
+        self.embeds = [discord.Embed(title=title) for title in titles]
+        self.fetches = 0
+
+    def get_channel(self, channel_id):
+        assert channel_id == constants.channel_rules()
+        return self
+
+    async def fetch_message(self, message_id):
+        assert message_id == constants.rules_message()
+        self.fetches += 1
+        await asyncio.sleep(0)  # let other lookups queue up behind the fetch
+        return mock.Mock(embeds=list(self.embeds))
+
+
+def titles(embeds):
+    return [embed.title for embed in embeds]
+
+
+@pytest.fixture
+def helpers(monkeypatch):
+    import ptn.modbot.modules.Helpers as Helpers
+    monkeypatch.setitem(Helpers.rules_cache, 'embeds', None)
+    monkeypatch.setitem(Helpers.rules_cache, 'fetched_at', 0.0)
+    return Helpers
+
+
+def test_burst_of_lookups_fetches_once(helpers):
+    guild = RulesGuild('Rule 1', 'Rule 2')
+
+    async def burst():
+        return await asyncio.gather(*(helpers.get_rule_embeds(guild) for _ in range(5)))
+
+    assert [titles(embeds) for embeds in run(burst())] == [['Rule 1', 'Rule 2']] * 5
+    assert guild.fetches == 1
+
+
+def test_expired_or_refreshed_rules_are_fetched_again(helpers):
+    guild = RulesGuild('Rule 1')
+    run(helpers.get_rule_embeds(guild))
+    guild.embeds.append(discord.Embed(title='Rule 2'))
+    assert titles(run(helpers.get_rule_embeds(guild))) == ['Rule 1']
+
+    helpers.rules_cache['fetched_at'] -= constants.RULES_CACHE_TTL
+    assert titles(run(helpers.get_rule_embeds(guild))) == ['Rule 1', 'Rule 2']
+    assert titles(run(helpers.get_rule_embeds(guild, refresh=True))) == ['Rule 1', 'Rule 2']
+    assert guild.fetches == 3
+
+
+def test_rules_message_edits_update_the_cache(helpers):
+    from ptn.modbot.botcommands.ModCommands import ModCommands
+    guild = RulesGuild('Rule 1')
+    run(helpers.get_rule_embeds(guild))
+
+    def edit(data, message_id=constants.rules_message()):
+        run(ModCommands.on_raw_message_edit(None, mock.Mock(message_id=message_id, data=data)))
+
+    edit({'embeds': [{'title': 'Edited rule 1'}]}, message_id=constants.rules_message() + 1)
+    assert titles(run(helpers.get_rule_embeds(guild))) == ['Rule 1']
+
+    # the edit carries the new embeds, so there's nothing to fetch
+    edit({'embeds': [{'title': 'Edited rule 1'}, {'title': 'New rule 2'}]})
+    assert titles(run(helpers.get_rule_embeds(guild))) == ['Edited rule 1', 'New rule 2']
+    assert guild.fetches == 1
+
+    # an edit without them drops the cache, and the next lookup fetches the message
+    edit({'content': 'no embeds in this update'})
+    assert titles(run(helpers.get_rule_embeds(guild))) == ['Rule 1']
+    assert guild.fetches == 2
@@ -0,0 +1,63 @@
+"""
+Tests for the full text index over warning reasons and search_infractions.
+"""
+
+# libraries
+import time
+
+from tests.helpers import run
+
+
+def reasons(results):
+    return sorted(infraction.warning_reason for infraction, _ in results)
+
+
+def test_search_matches_every_word(db):
+    member = 2101
+    for reason in ('spamming the trade channel', 'spamming links', 'trade scam'):
+        run(db.insert_infraction(member, 1, int(time.time()), 1, reason))
+
+    results, total = run(db.search_infractions('spamming trade', warned_user=member))
+    assert total == 1
+    assert reasons(results) == ['spamming the trade channel']
+    assert '**spamming**' in results[0][1]
+
+
+def test_exact_phrase_keeps_word_order(db):
+    member = 2102
+    run(db.insert_infraction(member, 1, int(time.time()), 1, 'carrier griefing'))
+    run(db.insert_infraction(member, 1, int(time.time()), 1, 'griefing a carrier'))
+
+    results, total = run(db.search_infractions('carrier griefing', exact_phrase=True, warned_user=member))
+    assert (total, reasons(results)) == (1, ['carrier griefing'])
+
+
+def test_query_syntax_is_searched_as_text(db):
+    member = 2103
+    run(db.insert_infraction(member, 1, int(time.time()), 1, 'said "NOT" OR worse'))
+    results, total = run(db.search_infractions('"NOT" OR (', warned_user=member))
+    assert (total, reasons(results)) == (1, ['said "NOT" OR worse'])
+    assert run(db.search_infractions('   ')) == ([], 0)
+
+
+def test_index_follows_edits_and_deletes(db):
+    member = 2104
+    entry_id = run(db.insert_infraction(member, 1, int(time.time()), 1, 'original wording'))
+    run(db.edit_infraction(entry_id, warning_reason='corrected wording'))
+    assert run(db.search_infractions('original', warned_user=member))[1] == 0
+    assert run(db.search_infractions('corrected', warned_user=member))[1] == 1
+
+    run(db.delete_single_warning(entry_id))
+    assert run(db.search_infractions('wording', warned_user=member))[1] == 0
+
+
+def test_search_pages_through_matches(db):
+    member = 2105
+    for i in range(5):
+        run(db.insert_infraction(member, 1, int(time.time()), 1, f'paged reason {i}'))
+
+    pages = [run(db.search_infractions('paged', warned_user=member, limit=2, offset=offset))
+             for offset in (0, 2, 4)]
+    assert [total for _, total in pages] == [5, 5, 5]
+    seen = [infraction.entry_id for results, _ in pages for infraction, _ in results]
+    assert len(seen) == len(set(seen)) == 5
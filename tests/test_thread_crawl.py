@@ -0,0 +1,85 @@
+"""
+Tests for crawl_archived_threads, which indexes members' archived infraction threads.
+"""
+
+# libraries
+import pytest
+
+from tests.helpers import FakeGuild, forum_thread, run
+
+MEMBER = 300000000000000101
+
+
+class FakeForum:
+    """
+    A forum channel whose archived threads page newest archived first, optionally failing part way through.
+    """
+
+    def __init__(self, forum_id, threads, fail_after=None):
+        self.id = forum_id
+        self.threads = threads
+        self.fail_after = fail_after
+        self.paged = []
+
+    async def archived_threads(self, limit=None, before=None):
+        for thread in sorted(self.threads, key=lambda thread: thread.archive_timestamp, reverse=True):
+            if before is not None and thread.archive_timestamp >= before:
+                continue
+            if self.fail_after is not None and len(self.paged) == self.fail_after:
+                raise ConnectionError('gateway went away')
+            self.paged.append(thread.id)
+            yield thread
+
+
+@pytest.fixture
+def helpers(db, monkeypatch):
+    import ptn.modbot.modules.Helpers as Helpers
+    monkeypatch.setattr(Helpers, 'thread_index', {})
+    return Helpers
+
+
+def test_crawl_indexes_new_members_only(db, helpers):
+    threads = [forum_thread(101, MEMBER, archived_at=1000), forum_thread(102, MEMBER, archived_at=2000),
+               forum_thread(103, MEMBER + 1, archived_at=1500), forum_thread(104, MEMBER + 2, archived_at=1800)]
+    not_infractions = forum_thread(105, MEMBER + 3, archived_at=1900)
+    not_infractions.name = 'general chat'
+    forum = FakeForum(4001, [*threads, not_infractions])
+    helpers.thread_index[MEMBER + 2] = 199  # already indexed, e.g. an active thread
+
+    assert run(helpers.crawl_archived_threads(FakeGuild(forum=forum))) == (5, 2)
+    # the most recently archived thread wins
+    assert helpers.thread_index == {MEMBER: 102, MEMBER + 1: 103, MEMBER + 2: 199}
+    assert {member: run(db.get_thread_index()).get(member) for member in (MEMBER, MEMBER + 1)} == \
+        {MEMBER: 102, MEMBER + 1: 103}
+
+    # the next crawl only pages through threads archived since
+    forum.threads.append(forum_thread(106, MEMBER + 4, archived_at=3000))
+    forum.paged.clear()
+    assert run(helpers.crawl_archived_threads(FakeGuild(forum=forum))) == (1, 1)
+    assert forum.paged == [106, 102]  # stopping at the first one the last crawl saw
+    assert run(db.get_thread_crawl_state(forum.id))['high_water'] == 3000
+
+
+def test_interrupted_crawl_resumes_from_its_checkpoint(db, helpers, monkeypatch):
+    monkeypatch.setattr(helpers.constants, 'THREAD_CRAWL_CHECKPOINT', 2)
+    threads = [forum_thread(200 + i, MEMBER + 10 + i, archived_at=5000 - i * 10) for i in range(5)]
+    forum = FakeForum(4002, threads, fail_after=3)
+
+    with pytest.raises(ConnectionError):
+        run(helpers.crawl_archived_threads(FakeGuild(forum=forum)))
+    state = run(db.get_thread_crawl_state(forum.id))
+    assert (state['resume_before'], state['pending_high_water'], state['high_water']) == (4990, 5000, None)
+    # what was checkpointed is indexed
+    assert helpers.thread_index == {MEMBER + 10: 200, MEMBER + 11: 201}
+
+    forum.fail_after = None
+    forum.paged.clear()
+    assert run(helpers.crawl_archived_threads(FakeGuild(forum=forum))) == (3, 3)
+    assert forum.paged == [202, 203, 204]
+    state = run(db.get_thread_crawl_state(forum.id))
+    assert (state['resume_before'], state['high_water']) == (None, 5000)
+    assert len(helpers.thread_index) == 5
+
+
+def test_no_forum_channel(helpers):
+    assert run(helpers.crawl_archived_threads(FakeGuild())) == (0, 0)
@@ -0,0 +1,72 @@
+"""
+Tests for the member ID -> infraction thread index and find_thread.
+"""
+
+# libraries
+import time
+from unittest import mock
+
+import pytest
+
+from tests.helpers import FakeGuild, forum_thread, run
+
+MEMBER = 300000000000000001
+
+
+@pytest.fixture
+def helpers(db, monkeypatch):
+    import ptn.modbot.modules.Helpers as Helpers
+    monkeypatch.setattr(Helpers, 'thread_index', {})
+    return Helpers
+
+
+def test_member_id_is_read_from_the_end_of_the_name(helpers):
+    assert helpers.thread_member_id(forum_thread(1, MEMBER)) == MEMBER
+
+    renamed = forum_thread(2, MEMBER)
+    renamed.name = f'mentions {MEMBER} | but is about someone else'
+    assert helpers.thread_member_id(renamed) is None
+    assert helpers.thread_member_id(forum_thread(3, MEMBER, parent_id=1)) is None
+
+
+def test_index_hit_is_used_without_searching(helpers):
+    thread = forum_thread(11, MEMBER)
+    helpers.thread_index[MEMBER] = thread.id
+    guild = FakeGuild(active=[thread])
+
+    assert run(helpers.find_thread(None, mock.Mock(id=MEMBER), guild)) is thread
+    assert guild.fetched == []
+
+
+def test_archived_thread_is_fetched_by_id(helpers):
+    thread = forum_thread(12, MEMBER)
+    helpers.thread_index[MEMBER] = thread.id
+    guild = FakeGuild(archived=[thread])
+
+    assert run(helpers.find_thread(None, mock.Mock(id=MEMBER), guild)) is thread
+    assert guild.fetched == [thread.id]
+
+
+def test_falls_back_to_the_thread_on_the_latest_infraction(db, helpers):
+    member = MEMBER + 1
+    old, current = forum_thread(21, member), forum_thread(22, member)
+    run(db.save_thread_index({member: 20}))
+    helpers.thread_index[member] = 20  # deleted since
+    for thread_id in (old.id, current.id):
+        run(db.insert_infraction(member, 1, int(time.time()), 1, 'threaded', thread_id))
+
+    guild = FakeGuild(archived=[old, current])
+    assert run(helpers.find_thread(None, mock.Mock(id=member), guild)) is current
+
+    # the gone thread is dropped and the one found indexed in its place, in memory and in the database
+    assert helpers.thread_index[member] == current.id
+    assert run(db.get_thread_index())[member] == current.id
+
+
+def test_no_thread_anywhere(db, helpers):
+    member = MEMBER + 2
+    run(db.insert_infraction(member, 1, int(time.time()), 1, 'thread deleted', 23))
+    guild = FakeGuild()
+
+    assert run(helpers.find_thread(None, mock.Mock(id=member), guild)) is False
+    assert member not in helpers.thread_index
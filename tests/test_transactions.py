@@ -0,0 +1,65 @@
+"""
+Tests for transaction(): several database calls committed or rolled back together.
+"""
+
+# libraries
+import time
+
+import pytest
+
+from tests.helpers import run
+
+
+def test_transaction_rolls_back_on_error(db):
+    member = 2003
+    run(db.insert_infraction(member, 1, int(time.time()), 1, 'kept'))
+    run(db.find_infraction(member, 'warned_user'))  # fills the cache
+
+    async def failing_transaction():
+        async with db.transaction():
+            await db.insert_infraction(member, 1, int(time.time()), 2, 'rolled back')
+            await db.insert_carrier('Rolled Back', 'RBK-001', '1', 'owner', discord_user=member, user_roles=[5, 6])
+            raise RuntimeError('abort')
+
+    with pytest.raises(RuntimeError):
+        run(failing_transaction())
+
+    assert [infraction.warning_reason for infraction in run(db.find_infraction(member, 'warned_user'))] == ['kept']
+    assert run(db.count_infractions(member)) == 1
+    assert not run(db.find_carrier(member, 'discord_user'))
+    assert not run(db.get_role_snapshot(member))
+
+    # the writer is usable again afterwards
+    run(db.insert_infraction(member, 1, int(time.time()), 1, 'after'))
+    assert run(db.count_infractions(member)) == 2
+
+
+def test_nested_transactions_join_the_outer_one(db):
+    member = 2005
+
+    async def nested():
+        async with db.transaction() as outer:
+            await db.insert_infraction(member, 1, int(time.time()), 1, 'outer')
+            async with db.transaction() as inner:
+                assert inner is outer
+                await db.insert_infraction(member, 1, int(time.time()), 1, 'inner')
+            # reads inside the block see its uncommitted writes
+            assert await db.count_infractions(member) == 2
+            raise RuntimeError('abort')
+
+    with pytest.raises(RuntimeError):
+        run(nested())
+    assert run(db.count_infractions(member)) == 0
+
+
+def test_transaction_commits_every_write(db):
+    member = 2006
+
+    async def committed():
+        async with db.transaction():
+            for i in range(3):
+                await db.insert_infraction(member, 1, int(time.time()), 1, f'committed {i}')
+
+    run(committed())
+    assert run(db.count_infractions(member)) == 3
+    assert len(run(db.find_infraction(member, 'warned_user'))) == 3
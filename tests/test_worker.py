@@ -0,0 +1,86 @@
+"""
+Tests for DatabaseWorker's group commit, on a database and worker of their own.
+"""
+
+# libraries
+import sqlite3
+import threading
+
+import pytest
+
+from ptn.modbot.database.worker import DatabaseWorker
+
+
+@pytest.fixture
+def worker(tmp_path):
+    conn = sqlite3.connect(tmp_path / 'worker.db', check_same_thread=False, isolation_level=None)
+    conn.execute('CREATE TABLE rows(value INTEGER NOT NULL)')
+    worker = DatabaseWorker(conn, 'test-worker', commit_window=0.05, max_batch=10)
+    yield worker
+    worker.stop(timeout=5)
+    conn.close()
+
+
+def insert(cursor, value):
+    cursor.execute('INSERT INTO rows(value) VALUES (?)', (value,))
+    return value
+
+
+def insert_then_fail(cursor, value):
+    insert(cursor, value)
+    raise ValueError(value)
+
+
+def hold_worker(worker):
+    # keeps the worker busy until the returned event is set, so the jobs submitted meanwhile queue up together
+    release = threading.Event()
+    started = threading.Event()
+
+    def blocker(cursor):
+        started.set()
+        release.wait(5)
+
+    worker.submit_standalone(blocker)
+    started.wait(5)
+    return release
+
+
+def values(worker):
+    return [row[0] for row in worker.conn.execute('SELECT value FROM rows ORDER BY value')]
+
+
+def test_failed_job_rolls_back_alone(worker):
+    release = hold_worker(worker)
+    futures = [worker.submit(insert, 1), worker.submit(insert_then_fail, 2), worker.submit(insert, 3)]
+    release.set()
+
+    assert futures[0].result(5) == 1
+    with pytest.raises(ValueError):
+        futures[1].result(5)
+    assert futures[2].result(5) == 3
+
+    # one transaction for all three, with only the failed job's insert undone
+    assert worker._last_batch_size == 3
+    assert values(worker) == [1, 3]
+
+
+def test_cancelled_jobs_are_dropped(worker):
+    release = hold_worker(worker)
+    cancelled = worker.submit(insert, 1)
+    kept = worker.submit(insert, 2)
+    assert cancelled.cancel()
+    release.set()
+
+    assert kept.result(5) == 2
+    assert values(worker) == [2]
+
+
+def test_standalone_job_runs_outside_a_transaction(worker):
+    release = hold_worker(worker)
+    futures = [worker.submit(insert, 1), worker.submit_standalone(lambda cursor: cursor.connection.in_transaction),
+               worker.submit(insert, 2)]
+    release.set()
+
+    assert futures[1].result(5) is False
+    assert [future.result(5) for future in (futures[0], futures[2])] == [1, 2]
+    assert values(worker) == [1, 2]